@@ -1,2 +1,9 @@
 from ._builder import PackageManagerBuilder
 from ._pkgmngrif import PackageManager
+from ._freshness import RepoFreshness
+from ._installed import InstalledIndex, DpkgIndex, PacmanIndex, RpmIndex
+from ._footprint import InstallSize, SizeSavings
+from ._pkgcache import PackageCache, CachedArchive
+from ._locking import HostLock, DEFAULT_LOCK_TIMEOUT
+from ._reconcile import ManagedState, ReconcilePlan, plan_reconcile
+from ._repoindex import RepoIndex, RepoPackage
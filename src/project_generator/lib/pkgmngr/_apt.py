@@ -2,13 +2,21 @@
     Package manager implementation for Apt for debian based distros
 '''
 
+import re
 from dataclasses import dataclass
 
 from typing_extensions import Self
 
 from project_generator.lib.utils.command import Command, CommandBuilder
 
+from ._footprint import InstallSize
+from ._freshness import RepoFreshness
+from ._installed import DpkgIndex, InstalledIndex, shared_index
 from ._pkgmngrif import PackageManager
+from ._reconcile import ReconcilePlan
+from ._repoindex import RepoIndex
+
+_APT_UPGRADE = re.compile(r'^Inst (\S+) \[', re.M)
 
 
 @dataclass(slots=True, init=True)
@@ -20,6 +28,7 @@ class AptPackageManager(PackageManager):
     def __init__(self, *args, **kw_args):
         PackageManager.__init__(self, *args, **kw_args)
         self.cmd_name = 'apt-get'
+        self.freshness = RepoFreshness('apt', ['/var/lib/apt/lists/*_*'])
 
     def _partial_cmd(self) -> CommandBuilder:
         cmd = CommandBuilder()
@@ -28,18 +37,104 @@ class AptPackageManager(PackageManager):
             cmd.option("-y")
         cmd.capture_logs(buffered=not self.confirmation)
 
-        return cmd
+        self._apply_minimal(cmd)
+        self._apply_downloads(cmd)
+        self._apply_package_cache(cmd)
+        self._apply_ephemeral(cmd)
+        self._apply_lock_wait(cmd)
+
+        return self._attach_session(cmd)
+
+    def _unsafe_io_options(self) -> list[str]:
+        # skip the fsync() of every unpacked file
+        return ['-o', 'Dpkg::Options::=--force-unsafe-io']
+
+    def _minimal_options(self) -> list[str]:
+        return ['--no-install-recommends']
+
+    def _parallel_download_options(self) -> list[str]:
+        # apt already downloads from every host in parallel, and pipelines 10
+        # requests on each connection. It has no option raising the number of
+        # connections to a host, so the concurrency is left to it.
+        return []
+
+    def _package_cache_options(self) -> list[str]:
+        return ['-o', f"Dir::Cache::Archives={self.package_cache.directory('apt')}",
+                '-o', 'Binary::apt::APT::Keep-Downloaded-Packages=true']
+
+    def _lock_wait_options(self, timeout: float) -> list[str]:
+        # apt 1.9.11 and later wait for the dpkg frontend lock themselves
+        return ['-o', f"DPkg::Lock::Timeout={int(timeout)}"]
+
+    def _download_only_cmd(self, install_list: list[str]) -> Command:
+        return self._partial_cmd() \
+            .option('--download-only') \
+            .subcommand(Command(cmd_name="install")) \
+            .args(install_list) \
+            .build()
+
+    def _dry_run_cmd(self, install_list: list[str], minimal: bool) -> Command:
+        cmd = CommandBuilder() \
+            .program(self.cmd_name) \
+            .option('--assume-no') \
+            .subcommand(Command(cmd_name="install")) \
+            .args(install_list) \
+            .env_vars({'LC_ALL': 'C'}) \
+            .capture_output()
+        if minimal:
+            cmd.options(self._minimal_options())
+        return cmd.build()
+
+    def _parse_footprint(self, output: str) -> InstallSize:
+        return InstallSize.from_apt(output)
+
+    def _outdated_cmd(self) -> Command:
+        return CommandBuilder() \
+            .program(self.cmd_name) \
+            .option('--simulate') \
+            .subcommand(Command(cmd_name="dist-upgrade")) \
+            .env_vars({'LC_ALL': 'C'}) \
+            .capture_output() \
+            .build()
+
+    def _parse_outdated(self, output: str) -> set[str]:
+        # `Inst <name> [<installed version>] (<new version> ...)`
+        return set(_APT_UPGRADE.findall(output))
+
+    def _reconcile_cmds(self, plan: ReconcilePlan):
+        if (plan.install or plan.upgrade) and not self.synced:
+            self.sync(True)
+
+        # a single transaction, apt upgrades the installed packages named to
+        # install and removes the ones suffixed with `-`
+        cmd = self._partial_cmd()
+        cmd.subcommand(Command(cmd_name="install"))
+        cmd.args(plan.install + plan.upgrade + [f"{pkg}-" for pkg in plan.remove])
+        self.command_list.append(cmd.build())
+
+    def repo_index(self) -> RepoIndex | None:
+        return RepoIndex.from_apt()
+
+    def _installed_index(self) -> InstalledIndex:
+        return shared_index(DpkgIndex)
 
     def sync(self, sync_repo: bool = False) -> Self:
         if sync_repo:
+            self.synced = True
+            if self._repo_is_fresh():
+                return self
+
             cmd_sync = self._partial_cmd()
             cmd_sync.subcommand(Command(cmd_name="update"))
-            self.synced = True
-            self.command_list.append(cmd_sync.build())
+            self._queue_sync(cmd_sync.build())
 
         return self
 
     def install(self, install_list: list[str]) -> Self:
+        install_list = self._drop_installed(install_list)
+        if not install_list and self.installed is not None:
+            return self
+
         if not self.synced:
             self.sync(True)
 
@@ -74,14 +169,3 @@ class AptPackageManager(PackageManager):
             self.command_list.append(cmd_update.build())
 
         return self
-
-    def commit(self):
-        '''
-        Run the built command
-        '''
-        for cmd in self.command_list:
-            ret = cmd.run()
-            if ret != 0:
-                return ret
-
-        return 0
@@ -4,9 +4,12 @@ Implementation for PackageManagerBuilder
 from typing_extensions import Self
 
 from project_generator.lib.distromngr import Distribution, PackageHandler
+from project_generator.lib.utils.command import ShellSession
 
 from ._apt import AptPackageManager
+from ._locking import HostLock
 from ._pacman import PacmanPackageManager
+from ._pkgcache import PackageCache
 from ._pkgmngrif import PackageManager
 from ._yum import YumPackageManager
 
@@ -19,6 +22,15 @@ class PackageManagerBuilder:
     def __init__(self):
         self._distribution: Distribution = None
         self._confirm: bool = False
+        self._session: ShellSession = None
+        self._sync_ttl: float = None
+        self._skip_installed: bool = False
+        self._ephemeral: bool = False
+        self._minimal: bool = False
+        self._downloads: int = None
+        self._package_cache: PackageCache = None
+        self._lock_timeout: float = None
+        self._host_lock: HostLock = None
 
     def distribution(self, dist: Distribution) -> Self:
         '''
@@ -34,6 +46,73 @@ class PackageManagerBuilder:
         self._confirm = cnf
         return self
 
+    def shell_session(self, session: ShellSession) -> Self:
+        '''
+        Specify a persistent shell session to run the commands in
+        '''
+        self._session = session
+        return self
+
+    def sync_ttl(self, ttl: float) -> Self:
+        '''
+        Specify for how many seconds refreshed repository metadata is reused
+        before syncing again, `None` to always sync
+        '''
+        self._sync_ttl = ttl
+        return self
+
+    def skip_installed(self, skip: bool) -> Self:
+        '''
+        Specify whether already installed packages are left out of installs
+        '''
+        self._skip_installed = skip
+        return self
+
+    def ephemeral(self, ephemeral: bool) -> Self:
+        '''
+        Specify whether to skip syncing to the disk during installs, for
+        environments like container image builds where durability is moot
+        '''
+        self._ephemeral = ephemeral
+        return self
+
+    def minimal(self, minimal: bool) -> Self:
+        '''
+        Specify whether to install only the hard dependencies, without the
+        recommended packages and the documentation
+        '''
+        self._minimal = minimal
+        return self
+
+    def parallel_downloads(self, count: int) -> Self:
+        '''
+        Specify how many packages to download concurrently
+        '''
+        self._downloads = count
+        return self
+
+    def package_cache(self, cache: PackageCache) -> Self:
+        '''
+        Specify a persistent cache for the downloaded package archives
+        '''
+        self._package_cache = cache
+        return self
+
+    def lock_wait(self, timeout: float) -> Self:
+        '''
+        Specify for how many seconds to wait for the package database locks
+        held by other processes, `None` to fail right away
+        '''
+        self._lock_timeout = timeout
+        return self
+
+    def host_lock(self, lock: HostLock) -> Self:
+        '''
+        Specify a host-wide lock serializing concurrent provisioning runs
+        '''
+        self._host_lock = lock
+        return self
+
     def build(self) -> PackageManager:
         '''
         Return the constructed PackageManager instance
@@ -49,5 +128,14 @@ class PackageManagerBuilder:
             pkgmngr = YumPackageManager()
 
         pkgmngr.confirm(self._confirm)
+        pkgmngr.use_session(self._session)
+        pkgmngr.use_sync_ttl(self._sync_ttl)
+        pkgmngr.skip_installed(self._skip_installed)
+        pkgmngr.use_ephemeral(self._ephemeral)
+        pkgmngr.use_minimal(self._minimal)
+        pkgmngr.use_parallel_downloads(self._downloads)
+        pkgmngr.use_package_cache(self._package_cache)
+        pkgmngr.use_lock_wait(self._lock_timeout)
+        pkgmngr.use_host_lock(self._host_lock)
 
         return pkgmngr
@@ -0,0 +1,44 @@
+'''
+Support for trading durability for speed in throwaway environments
+'''
+
+import functools
+import glob
+import os
+
+# locations of the eatmydata preload library across the distributions
+_EATMYDATA_PATTERNS = [
+    '/usr/lib/*-linux-gnu/libeatmydata.so*',
+    '/usr/lib64/libeatmydata.so*',
+    '/usr/lib/libeatmydata.so*',
+    '/usr/lib/libeatmydata/libeatmydata.so*',
+]
+
+
+def _find_library(patterns: list[str]) -> str | None:
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+@functools.cache
+def eatmydata_library() -> str | None:
+    '''
+    Return the path of the eatmydata library, which turns `fsync()` and
+    friends into no-ops when preloaded, `None` if not installed
+    '''
+    return _find_library(_EATMYDATA_PATTERNS)
+
+
+def preload_env(library: str) -> dict[str, str]:
+    '''
+    Return the environment overlay preloading `library` in front of any
+    library already preloaded
+    '''
+
+    preload = os.environ.get('LD_PRELOAD', '')
+    if preload:
+        return {'LD_PRELOAD': f"{library} {preload}"}
+    return {'LD_PRELOAD': library}
@@ -0,0 +1,105 @@
+'''
+Estimation of the download and disk footprint of package installs
+'''
+
+import re
+from dataclasses import dataclass
+
+# multipliers of the size units printed by the package managers: apt uses SI
+# units, dnf 4 single letter binary units and dnf 5 IEC units
+_UNITS = {
+    'B': 1,
+    'kB': 1000, 'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3,
+    'k': 1024, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+    'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3,
+}
+
+_APT_DOWNLOAD = re.compile(r'^Need to get ([\d.,]+ \w+)(?:/[\d.,]+ \w+)? of archives', re.M)
+_APT_INSTALLED = re.compile(
+    r'^After this operation, ([\d.,]+ \w+) (?:of )?additional disk space', re.M)
+_DNF_DOWNLOAD = re.compile(
+    r'^(?:Total download size: ([\d.]+ ?\w+)|.*Need to download ([\d.]+ ?\w+))', re.M)
+_DNF_INSTALLED = re.compile(
+    r'^(?:Installed size: ([\d.]+ ?\w+)|After this operation,? ([\d.]+ ?\w+) extra)', re.M)
+
+
+def _parse_size(size: str) -> int:
+    '''
+    Convert a human readable size like `52.3 MB` or `43 M` to bytes
+    '''
+
+    match = re.fullmatch(r'([\d.,]+) ?(\w+)', size.strip())
+    if match is None or match.group(2) not in _UNITS:
+        raise ValueError(f"Invalid size '{size}'")
+    return round(float(match.group(1).replace(',', '')) * _UNITS[match.group(2)])
+
+
+def _first_size(pattern: re.Pattern, text: str) -> int | None:
+    match = pattern.search(text)
+    if match is None:
+        return None
+    return _parse_size(next(group for group in match.groups() if group is not None))
+
+
+@dataclass(slots=True)
+class InstallSize:
+    '''
+    Bytes to download and disk space used by an install, `None` when the
+    package manager does not report it
+    '''
+
+    download_bytes: int = None
+    installed_bytes: int = None
+
+    @classmethod
+    def from_apt(cls, output: str) -> 'InstallSize':
+        '''
+        Parse the summary printed by `apt-get install`
+        '''
+        return cls(_first_size(_APT_DOWNLOAD, output), _first_size(_APT_INSTALLED, output))
+
+    @classmethod
+    def from_dnf(cls, output: str) -> 'InstallSize':
+        '''
+        Parse the transaction summary printed by `dnf install` or `yum install`
+        '''
+        return cls(_first_size(_DNF_DOWNLOAD, output), _first_size(_DNF_INSTALLED, output))
+
+    @classmethod
+    def from_pacman(cls, output: str) -> 'InstallSize':
+        '''
+        Parse the per package download sizes printed by `pacman -Sp
+        --print-format %s`. Pacman does not report the installed size.
+        '''
+        sizes = [int(line) for line in output.split() if line.isdigit()]
+        return cls(download_bytes=sum(sizes))
+
+
+@dataclass(slots=True)
+class SizeSavings:
+    '''
+    Footprint of an install with and without the minimal profile
+    '''
+
+    full: InstallSize
+    minimal: InstallSize
+
+    @staticmethod
+    def _saved(full: int, minimal: int) -> int | None:
+        if full is None or minimal is None:
+            return None
+        return full - minimal
+
+    @property
+    def download_saved(self) -> int | None:
+        '''
+        Bytes of downloads avoided by the minimal profile
+        '''
+        return self._saved(self.full.download_bytes, self.minimal.download_bytes)
+
+    @property
+    def installed_saved(self) -> int | None:
+        '''
+        Bytes of disk space saved by the minimal profile
+        '''
+        return self._saved(self.full.installed_bytes, self.minimal.installed_bytes)
@@ -0,0 +1,80 @@
+'''
+Tracking of the repository metadata freshness
+'''
+
+import glob
+import os
+import time
+from pathlib import Path
+
+from project_generator.lib.utils.cache import default_cache_dir
+
+
+class RepoFreshness:
+    '''
+    Track when the repository metadata of a package manager was last
+    refreshed. The refresh time is the newer of a stamp file, written after
+    every successful sync, and the mtimes of the metadata files matched by
+    `patterns`. A sync which did not download anything new leaves the
+    metadata files untouched, hence the stamp. Without any metadata file the
+    repositories are never considered fresh, so that wiping the metadata, as
+    container images commonly do, forces a sync.
+    '''
+
+    def __init__(self, name: str, patterns: list[str], stamp: Path = None):
+        self.name = name
+        self.patterns = patterns
+        if stamp is None:
+            stamp = default_cache_dir('pkgmngr', f"{name}.synced")
+        self.stamp = Path(stamp)
+
+    def _metadata_mtime(self) -> float | None:
+        mtime = None
+        for pattern in self.patterns:
+            for path in glob.iglob(pattern):
+                try:
+                    path_mtime = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime is None or path_mtime > mtime:
+                    mtime = path_mtime
+        return mtime
+
+    def last_refresh(self) -> float | None:
+        '''
+        Return the time of the last metadata refresh, in seconds since the
+        epoch, `None` when no metadata is present
+        '''
+
+        mtime = self._metadata_mtime()
+        if mtime is None:
+            return None
+
+        try:
+            return max(mtime, os.stat(self.stamp).st_mtime)
+        except FileNotFoundError:
+            return mtime
+
+    def is_fresh(self, ttl: float = None) -> bool:
+        '''
+        Whether the metadata was refreshed less than `ttl` seconds ago. A
+        `None` ttl never considers the metadata fresh.
+        '''
+
+        if ttl is None:
+            return False
+
+        last_refresh = self.last_refresh()
+        return last_refresh is not None and time.time() - last_refresh < ttl
+
+    def mark(self):
+        '''
+        Record a successful refresh of the metadata
+        '''
+
+        try:
+            os.makedirs(self.stamp.parent, exist_ok=True)
+            self.stamp.touch()
+        except OSError:
+            # not being able to record the refresh only costs a later sync
+            pass
@@ -0,0 +1,147 @@
+'''
+Index of the installed packages, read from the native package databases
+'''
+
+import functools
+import mmap
+import os
+import re
+import threading
+
+from project_generator.lib.utils.command import Command, CommandBuilder
+
+# a stanza of the dpkg status file, for a package that is fully installed
+_DPKG_INSTALLED = re.compile(
+    rb'^Package: (\S+)\n(?:[^\n]+\n)*?Status: [^\n]* installed$', re.MULTILINE)
+
+# upper bound of the `rpm -qa` output, the capture only grows with the output
+_RPM_QUERY_CAPTURE_SIZE = 64 * 1024 * 1024
+
+
+class InstalledIndex:
+    '''
+    In-memory set of the installed package names. The set is loaded lazily and
+    reloaded whenever the mtime of one of the database `paths` changes, so that
+    lookups after the first one only cost a few `stat()` calls.
+    '''
+
+    def __init__(self, paths: list[str]):
+        self.paths = paths
+        self._signature = None
+        self._packages: frozenset[str] = frozenset()
+        self._lock = threading.Lock()
+
+    def _current_signature(self) -> tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _load(self) -> set[str]:
+        '''
+        Read the installed package names from the database, none by default
+        '''
+        return set()
+
+    def packages(self) -> frozenset[str]:
+        '''
+        Return the names of the installed packages
+        '''
+
+        with self._lock:
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._packages = frozenset(self._load())
+                self._signature = signature
+            return self._packages
+
+    def __contains__(self, package: str) -> bool:
+        return package in self.packages()
+
+    def missing(self, packages: list[str]) -> list[str]:
+        '''
+        Return the packages, in order, which are not installed
+        '''
+
+        installed = self.packages()
+        return [pkg for pkg in packages if pkg not in installed]
+
+
+class DpkgIndex(InstalledIndex):
+    '''
+    Installed packages of dpkg based distributions
+    '''
+
+    def __init__(self, status: str = '/var/lib/dpkg/status'):
+        InstalledIndex.__init__(self, [status])
+        self.status = status
+
+    def _load(self) -> set[str]:
+        try:
+            with open(self.status, 'rb') as status_file:
+                if os.fstat(status_file.fileno()).st_size == 0:
+                    return set()
+                with mmap.mmap(status_file.fileno(), 0, access=mmap.ACCESS_READ) as status:
+                    return {match.group(1).decode()
+                            for match in _DPKG_INSTALLED.finditer(status)}
+        except FileNotFoundError:
+            return set()
+
+
+class PacmanIndex(InstalledIndex):
+    '''
+    Installed packages of pacman based distributions. The local database holds
+    a `<name>-<version>-<release>` directory per installed package, so only the
+    directory listing is needed.
+    '''
+
+    def __init__(self, local_db: str = '/var/lib/pacman/local'):
+        InstalledIndex.__init__(self, [local_db])
+        self.local_db = local_db
+
+    def _load(self) -> set[str]:
+        try:
+            entries = os.scandir(self.local_db)
+        except FileNotFoundError:
+            return set()
+
+        with entries:
+            return {entry.name.rsplit('-', 2)[0]
+                    for entry in entries if entry.is_dir() and entry.name.count('-') >= 2}
+
+
+class RpmIndex(InstalledIndex):
+    '''
+    Installed packages of rpm based distributions, listed by a single batched
+    `rpm -qa` query
+    '''
+
+    def __init__(self, paths: list[str] = None, query: Command = None):
+        if paths is None:
+            paths = ['/var/lib/rpm', '/var/lib/rpm/rpmdb.sqlite', '/var/lib/rpm/Packages',
+                     '/usr/lib/sysimage/rpm/rpmdb.sqlite']
+        if query is None:
+            query = CommandBuilder() \
+                .program('rpm') \
+                .options(['-qa', '--queryformat', '%{NAME}\\n']) \
+                .capture_output(max_bytes=_RPM_QUERY_CAPTURE_SIZE) \
+                .build()
+        InstalledIndex.__init__(self, paths)
+        self.query = query
+
+    def _load(self) -> set[str]:
+        result = self.query.execute()
+        if result.returncode != 0 or result.truncated:
+            return set()
+        return set(result.text().split())
+
+
+@functools.cache
+def shared_index(kind: type[InstalledIndex]) -> InstalledIndex:
+    '''
+    Return the index of the `kind` database shared by all package managers
+    '''
+    return kind()
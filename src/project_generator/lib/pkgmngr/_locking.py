@@ -0,0 +1,112 @@
+'''
+Waiting on the package database locks and serializing concurrent runs
+'''
+
+import contextlib
+import fcntl
+import os
+import re
+import tempfile
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+DEFAULT_LOCK_TIMEOUT = 10 * 60
+
+# output tail kept to look for the lock contention messages
+_LOCK_CAPTURE_SIZE = 64 * 1024
+
+# output of the package managers when another process holds the database lock
+_LOCK_CONTENTION = re.compile('|'.join([
+    # apt, dpkg
+    r'Could not get lock',
+    r'Unable to acquire the dpkg frontend lock',
+    r'Unable to lock (?:the administration )?directory',
+    r'dpkg status database is locked by another process',
+    # rpm, yum, dnf
+    r"can't create transaction lock",
+    r'Another app is currently holding the yum lock',
+    r'Waiting for process with pid \d+ to finish',
+    # pacman
+    r'unable to lock database',
+]))
+
+
+def _lock_contended(output: str) -> bool:
+    '''
+    Whether the output of a failed command reports a held database lock
+    '''
+    return _LOCK_CONTENTION.search(output) is not None
+
+
+class _Backoff:
+    '''
+    Exponentially growing sleeps, bounded by an overall `timeout`
+    '''
+
+    __slots__ = ('_delay', '_maximum', '_expiry', 'waited')
+
+    def __init__(self, timeout: float = None, initial: float = 0.05, maximum: float = 5.0):
+        self._delay = initial
+        self._maximum = maximum
+        self._expiry = None if timeout is None else time.monotonic() + timeout
+        self.waited = 0.0
+
+    def sleep(self) -> bool:
+        '''
+        Sleep for the next delay and return `True`, or return `False` without
+        sleeping when the timeout would be exceeded
+        '''
+
+        delay = self._delay
+        if self._expiry is not None:
+            remaining = self._expiry - time.monotonic()
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+
+        time.sleep(delay)
+        self.waited += delay
+        self._delay = min(self._delay * 2, self._maximum)
+        return True
+
+
+def _default_lock_path() -> Path:
+    for directory in ['/run/lock', '/var/lock']:
+        if os.access(directory, os.W_OK):
+            return Path(directory, 'project_generator-pkgmngr.lock')
+    return Path(tempfile.gettempdir(), 'project_generator-pkgmngr.lock')
+
+
+class HostLock:
+    '''
+    Host-wide advisory lock serializing the package manager runs of all the
+    project generator processes, and of the threads within a process
+    '''
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path) if path is not None else _default_lock_path()
+
+    @contextlib.contextmanager
+    def hold(self, timeout: float = None) -> Iterator[float]:
+        '''
+        Hold the lock for the duration of the `with` block, waiting at most
+        `timeout` seconds for it, forever if `None`. Yield the seconds spent
+        waiting and raise `TimeoutError` if the lock could not be acquired.
+        '''
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            backoff = _Backoff(timeout)
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError as err:
+                    if not backoff.sleep():
+                        raise TimeoutError(f"Timed out waiting for {self.path}") from err
+
+            yield backoff.waited
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
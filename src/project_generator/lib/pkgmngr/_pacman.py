@@ -2,13 +2,58 @@
     Package manager implementation for Pacman for Arch based distros
 '''
 
+import hashlib
+import os
+import tempfile
 from dataclasses import dataclass
+from pathlib import Path
 
 from typing_extensions import Self
 
+from project_generator.lib.utils.cache import default_cache_dir
 from project_generator.lib.utils.command import Command, CommandBuilder
 
+from ._footprint import InstallSize
+from ._freshness import RepoFreshness
+from ._installed import InstalledIndex, PacmanIndex, shared_index
 from ._pkgmngrif import PackageManager
+from ._reconcile import ReconcilePlan
+from ._repoindex import RepoIndex
+
+
+# documentation left out of the packages by the minimal profile
+_NO_EXTRACT = [
+    'usr/share/doc/*',
+    'usr/share/gtk-doc/*',
+    'usr/share/help/*',
+    'usr/share/info/*',
+    'usr/share/man/*',
+]
+
+
+def _write_config(directives: list[str], base: str = '/etc/pacman.conf') -> Path:
+    '''
+    Write a pacman configuration adding `directives` to the `[options]` of the
+    `base` configuration, and return its path. Pacman has no command line
+    switches for most of its options, so they are set through `--config`.
+    Pacman keeps the last value of an option, so the directives follow the
+    `base` configuration, in an `[options]` section of their own.
+    '''
+
+    content = '\n'.join(['[options]', f"Include = {base}", '[options]', *directives, ''])
+    digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+    path = default_cache_dir('pkgmngr', f"pacman-{digest}.conf")
+    if path.exists():
+        return path
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as config:
+        config.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+    return path
 
 
 @dataclass(slots=True, init=True)
@@ -20,6 +65,7 @@ class PacmanPackageManager(PackageManager):
     def __init__(self, *args, **kw_args):
         PackageManager.__init__(self, *args, **kw_args)
         self.cmd_name = 'pacman'
+        self.freshness = RepoFreshness('pacman', ['/var/lib/pacman/sync/*.db'])
 
     def _partial_cmd(self) -> CommandBuilder:
         cmd = CommandBuilder()
@@ -28,18 +74,105 @@ class PacmanPackageManager(PackageManager):
             cmd.option("--noconfirm")
         cmd.capture_logs(buffered=not self.confirmation)
 
-        return cmd
+        # the minimal profile, the download concurrency and the package
+        # cache are only configurable through the configuration file
+        cmd.options(self._config_options(self.minimal))
+        self._apply_ephemeral(cmd)
+        self._apply_lock_wait(cmd)
+
+        return self._attach_session(cmd)
+
+    def _config_options(self, minimal: bool) -> list[str]:
+        '''
+        Return the options pointing pacman to a configuration with the
+        directives of the minimal profile, the download concurrency and the
+        package cache
+        '''
+
+        directives = []
+        if minimal:
+            directives.append(f"NoExtract = {' '.join(_NO_EXTRACT)}")
+        if self.downloads is not None:
+            directives.append(f"ParallelDownloads = {self.downloads}")
+        if self.package_cache is not None:
+            # the first writable cache directory receives the downloads
+            directives.append(f"CacheDir = {self.package_cache.directory('pacman')}/")
+
+        if not directives:
+            return []
+        return ['--config', str(_write_config(directives))]
+
+    def _download_only_cmd(self, install_list: list[str]) -> Command:
+        return self._partial_cmd() \
+            .subcommand(Command(cmd_name="-Sw")) \
+            .args(install_list) \
+            .build()
+
+    def _dry_run_cmd(self, install_list: list[str], minimal: bool) -> Command:
+        return CommandBuilder() \
+            .program(self.cmd_name) \
+            .options(self._config_options(minimal)) \
+            .subcommand(Command(cmd_name="-S")) \
+            .options(['--needed', '--print', '--print-format', '%s']) \
+            .args(install_list) \
+            .capture_output() \
+            .build()
+
+    def _parse_footprint(self, output: str) -> InstallSize:
+        return InstallSize.from_pacman(output)
+
+    def _outdated_cmd(self) -> Command:
+        return CommandBuilder() \
+            .program(self.cmd_name) \
+            .option('-Qu') \
+            .env_vars({'LC_ALL': 'C'}) \
+            .capture_output() \
+            .build()
+
+    def _parse_outdated(self, output: str) -> set[str]:
+        # `<name> <installed version> -> <new version>`
+        return {line.split()[0] for line in output.splitlines() if ' -> ' in line}
+
+    def _reconcile_cmds(self, plan: ReconcilePlan):
+        if plan.install or plan.upgrade:
+            if not self.synced:
+                self.sync(True)
+            cmd = self._partial_cmd()
+            cmd.subcommand(Command(cmd_name="-S"))
+            cmd.args(plan.install + plan.upgrade)
+            self.command_list.append(cmd.build())
+
+        if plan.remove:
+            # without the cascade of `remove`, which could take desired
+            # packages depending on the removed ones along
+            cmd = self._partial_cmd()
+            cmd.subcommand(Command(cmd_name="-Rs"))
+            cmd.args(plan.remove)
+            self.command_list.append(cmd.build())
+
+    def repo_index(self) -> RepoIndex | None:
+        return RepoIndex.from_pacman()
+
+    def _installed_index(self) -> InstalledIndex:
+        return shared_index(PacmanIndex)
 
     def sync(self, sync_repo: bool = False) -> Self:
         if sync_repo:
+            self.synced = True
+            if self._repo_is_fresh():
+                return self
+
             cmd_sync = self._partial_cmd()
             cmd_sync.subcommand(Command(cmd_name="-Sy"))
-            self.synced = True
-            self.command_list.append(cmd_sync.build())
+            self._queue_sync(cmd_sync.build())
 
         return self
 
     def install(self, install_list: list[str]) -> Self:
+        install_list = self._drop_installed(install_list)
+        if not install_list and self.installed is not None:
+            return self
+
         if not self.synced:
             self.sync(True)
 
@@ -74,14 +207,3 @@ class PacmanPackageManager(PackageManager):
             self.command_list.append(cmd_update.build())
 
         return self
-
-    def commit(self):
-        '''
-        Run the built command
-        '''
-        for cmd in self.command_list:
-            ret = cmd.run()
-            if ret != 0:
-                return ret
-
-        return 0
@@ -0,0 +1,139 @@
+'''
+Persistent cache of the downloaded package archives
+'''
+
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from project_generator.lib.utils.cache import default_cache_dir, prune_lru
+
+DEFAULT_PACKAGE_CACHE_SIZE = 4 * 1024 * 1024 * 1024
+
+# file name layouts of the archives: `name_version_arch.deb`,
+# `name-version-release.arch.rpm` and `name-version-release-arch.pkg.tar.*`
+_ARCHIVE_NAMES = [
+    re.compile(r'^(?P<name>[^_]+)_(?P<version>[^_]+)_(?P<arch>[^_]+)\.deb$'),
+    re.compile(r'^(?P<name>.+)-(?P<version>[^-]+-[^-]+)\.(?P<arch>[^.]+)\.rpm$'),
+    re.compile(r'^(?P<name>.+)-(?P<version>[^-]+-[^-]+)-(?P<arch>[^-]+)\.pkg\.tar(?:\.\w+)?$'),
+]
+
+
+@dataclass(slots=True, frozen=True)
+class CachedArchive:
+    '''
+    A package archive present in the cache
+    '''
+
+    name: str
+    version: str
+    arch: str
+    path: Path
+    size: int
+
+
+def _parse_archive_name(filename: str) -> tuple[str, str, str] | None:
+    for pattern in _ARCHIVE_NAMES:
+        match = pattern.match(filename)
+        if match is not None:
+            # apt escapes the epoch separator of the version
+            version = match.group('version').replace('%3a', ':')
+            return match.group('name'), version, match.group('arch')
+    return None
+
+
+class PackageCache:
+    '''
+    Size bounded directory of downloaded package archives, shared by the
+    package managers across runs. Point several hosts or containers at the
+    same cache by bind-mounting `root`.
+
+    Every package manager keeps its archives in its own subdirectory. Once
+    the cache outgrows `max_bytes`, the least recently used archives are
+    evicted, judged by their access time where the filesystem records it.
+    '''
+
+    def __init__(self, root: Path = None, max_bytes: int = DEFAULT_PACKAGE_CACHE_SIZE):
+        if root is None:
+            root = default_cache_dir('packages')
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def directory(self, name: str) -> Path:
+        '''
+        Return the archive directory of the package manager `name`, creating
+        it along with the `partial` download directory apt expects
+        '''
+
+        path = self.root / name
+        os.makedirs(path / 'partial', exist_ok=True)
+        return path
+
+    def archives(self) -> list[CachedArchive]:
+        '''
+        Return all the archives in the cache
+        '''
+
+        archives = []
+        if not self.root.is_dir():
+            return archives
+
+        for dirpath, _, filenames in os.walk(self.root):
+            if os.path.basename(dirpath) == 'partial':
+                continue
+            for filename in filenames:
+                parsed = _parse_archive_name(filename)
+                if parsed is None:
+                    continue
+                path = Path(dirpath, filename)
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    continue
+                archives.append(CachedArchive(*parsed, path=path, size=size))
+
+        return archives
+
+    def index(self) -> dict[tuple[str, str, str], CachedArchive]:
+        '''
+        Return the archives in the cache keyed by name, version and arch
+        '''
+        return {(a.name, a.version, a.arch): a for a in self.archives()}
+
+    def lookup(self, name: str, version: str = None, arch: str = None) -> list[CachedArchive]:
+        '''
+        Return the cached archives of the package `name`, optionally limited
+        to a `version` and an `arch`
+        '''
+
+        return [archive for archive in self.archives()
+                if archive.name == name
+                and (version is None or archive.version == version)
+                and (arch is None or archive.arch == arch)]
+
+    def size(self) -> int:
+        '''
+        Return the total size of the cached archives in bytes
+        '''
+        return sum(archive.size for archive in self.archives())
+
+    def prune(self) -> list[Path]:
+        '''
+        Evict the least recently used archives until the cache fits in
+        `max_bytes`, and return the paths of the evicted archives
+        '''
+
+        paths = []
+        for archive in self.archives():
+            try:
+                stat = os.stat(archive.path)
+                # a package manager reading an archive only updates its atime,
+                # carry it over to the mtime which orders the eviction
+                if stat.st_atime > stat.st_mtime:
+                    os.utime(archive.path, (stat.st_atime, stat.st_atime))
+            except FileNotFoundError:
+                continue
+            paths.append(archive.path)
+
+        return prune_lru(paths, self.max_bytes)
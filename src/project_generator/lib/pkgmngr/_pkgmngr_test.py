@@ -2,10 +2,28 @@
 PackageManager tests
 '''
 
+import errno
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
+from pathlib import Path
+from unittest import mock
 
 from project_generator.lib.distromngr import Distribution, PackageHandler, get_distribution
-from project_generator.lib.pkgmngr import PackageManagerBuilder
+from project_generator.lib.pkgmngr import (DpkgIndex, HostLock, InstallSize, ManagedState,
+                                           PackageCache, PackageManagerBuilder, PacmanIndex,
+                                           RepoFreshness, RepoIndex, RpmIndex, SizeSavings,
+                                           plan_reconcile)
+from project_generator.lib.utils.command import CommandBuilder, ShellSession
+
+from . import _yum
+from ._ephemeral import _find_library, eatmydata_library, preload_env
+from ._locking import _lock_contended
 from project_generator.lib.utils.logger import get_logger
 
 lgr = get_logger('test-pkgmngr')
@@ -29,6 +47,981 @@ class TestPackageManagerBuilder(unittest.TestCase):
             'pacman'
         )
 
+    def test_build_with_session(self):
+        '''
+        Test that the commands are routed through the shell session
+        '''
+        session = ShellSession()
+        mngr = PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(Distribution.UBUNTU) \
+            .shell_session(session) \
+            .build()
+        mngr.install(['gcc'])
+        for cmd in mngr.command():
+            self.assertIs(cmd.session, session)
+
+        mngr = PackageManagerBuilder() \
+            .confirm_action(True) \
+            .distribution(Distribution.UBUNTU) \
+            .shell_session(session) \
+            .build()
+        mngr.install(['gcc'])
+        for cmd in mngr.command():
+            self.assertIsNone(cmd.session)
+
+
+class TestRepoFreshness(unittest.TestCase):
+    '''
+    Test suite for skipping the sync of fresh repository metadata
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.lists = os.path.join(self._tmpdir.name, 'lists')
+        os.makedirs(self.lists)
+        self.freshness = RepoFreshness(
+            'apt', [os.path.join(self.lists, '*_Packages')],
+            stamp=os.path.join(self._tmpdir.name, 'stamp', 'apt.synced'))
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _metadata(self, age: float):
+        path = os.path.join(self.lists, 'deb.debian.org_main_Packages')
+        with open(path, 'w', encoding='utf-8'):
+            pass
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def _mngr(self, ttl: float = 3600):
+        mngr = PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(Distribution.UBUNTU) \
+            .sync_ttl(ttl) \
+            .build()
+        mngr.freshness = self.freshness
+        return mngr
+
+    def test_fresh(self):
+        '''
+        Test the refresh time of the metadata
+        '''
+
+        self.assertIsNone(self.freshness.last_refresh())
+        self.assertFalse(self.freshness.is_fresh(3600))
+
+        self._metadata(age=7200)
+        self.assertFalse(self.freshness.is_fresh(3600))
+        self.assertTrue(self.freshness.is_fresh(10800))
+        self.assertFalse(self.freshness.is_fresh(None))
+
+        # a sync without new metadata is still a refresh
+        self.freshness.mark()
+        self.assertTrue(self.freshness.is_fresh(3600))
+
+    def test_skip_sync(self):
+        '''
+        Test that the sync is only queued for stale metadata
+        '''
+
+        self._metadata(age=7200)
+        mngr = self._mngr().install(['gcc'])
+        self.assertEqual([cmd.flatten() for cmd in mngr.command()], [
+            ["apt-get", "-y", "update"],
+            ["apt-get", "-y", "install", "gcc"],
+        ])
+
+        self._metadata(age=0)
+        mngr = self._mngr().install(['gcc'])
+        self.assertEqual([cmd.flatten() for cmd in mngr.command()], [
+            ["apt-get", "-y", "install", "gcc"],
+        ])
+
+        mngr = self._mngr(ttl=None).install(['gcc'])
+        self.assertEqual(len(mngr.command()), 2)
+
+    def test_commit_marks_sync(self):
+        '''
+        Test that a successful sync records the refresh
+        '''
+
+        self._metadata(age=7200)
+        mngr = self._mngr()
+        mngr.synced = True
+        mngr._queue_sync(CommandBuilder().program("true").build())
+        self.assertEqual(mngr.commit(), 0)
+        self.assertTrue(self.freshness.is_fresh(3600))
+
+
+_DPKG_STATUS = """\
+Package: gcc
+Status: install ok installed
+Priority: optional
+Description: GNU C compiler
+ multi-line description
+ .
+Version: 4:12.2.0-3
+
+Package: clang
+Status: deinstall ok config-files
+Version: 1:14.0-55
+
+Package: make
+Architecture: amd64
+Status: hold ok installed
+"""
+
+
+class TestInstalledIndex(unittest.TestCase):
+    '''
+    Test suite for the installed package indexes
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _write(self, name: str, content: str, age: float = 0) -> str:
+        path = os.path.join(self._tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as out:
+            out.write(content)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_dpkg(self):
+        '''
+        Test parsing the dpkg status file and reloading it once modified
+        '''
+
+        index = DpkgIndex(self._write('status', _DPKG_STATUS, age=10))
+        self.assertEqual(index.packages(), {'gcc', 'make'})
+        self.assertEqual(index.missing(['clang', 'gcc', 'vim', 'make']), ['clang', 'vim'])
+
+        self._write('status', _DPKG_STATUS.replace('deinstall ok config-files',
+                                                   'install ok installed'))
+        self.assertIn('clang', index)
+
+    def test_pacman(self):
+        '''
+        Test listing the pacman local database
+        '''
+
+        local_db = os.path.join(self._tmpdir.name, 'local')
+        for entry in ['gcc-13.2.1-3', 'lib32-glibc-2.38-7', 'python-pip-23.3.1-1']:
+            os.makedirs(os.path.join(local_db, entry))
+        self._write(os.path.join('local', 'ALPM_DB_VERSION'), '9')
+
+        index = PacmanIndex(local_db)
+        self.assertEqual(index.packages(), {'gcc', 'lib32-glibc', 'python-pip'})
+
+    def test_rpm(self):
+        '''
+        Test the batched rpm query
+        '''
+
+        rpmdb = self._write('rpmdb.sqlite', '')
+        index = RpmIndex([rpmdb], query=CommandBuilder()
+                         .program('printf').arg('bash\\nglibc\\n')
+                         .capture_output()
+                         .build())
+        self.assertEqual(index.packages(), {'bash', 'glibc'})
+
+    def test_skip_installed(self):
+        '''
+        Test that installed packages are dropped from the install
+        '''
+
+        mngr = PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(Distribution.UBUNTU) \
+            .skip_installed(True) \
+            .build()
+        mngr.installed = DpkgIndex(self._write('status', _DPKG_STATUS))
+
+        mngr.install(['gcc', 'make'])
+        self.assertEqual(mngr.command(), [])
+
+        mngr.install(['gcc', 'clang'])
+        self.assertEqual([cmd.flatten() for cmd in mngr.command()], [
+            ["apt-get", "-y", "update"],
+            ["apt-get", "-y", "install", "clang"],
+        ])
+
+
+class TestEphemeralInstall(unittest.TestCase):
+    '''
+    Test suite for the ephemeral install mode
+    '''
+
+    def _mngr(self, distro: Distribution, ephemeral: bool = True):
+        return PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(distro) \
+            .ephemeral(ephemeral) \
+            .build()
+
+    def test_apt_unsafe_io(self):
+        '''
+        Test that dpkg is told to skip syncing the unpacked files
+        '''
+
+        mngr = self._mngr(Distribution.UBUNTU).install(['gcc'])
+        self.assertEqual(mngr.command()[1].flatten(), [
+            "apt-get", "-y", "-o", "Dpkg::Options::=--force-unsafe-io", "install", "gcc"])
+
+        mngr = self._mngr(Distribution.UBUNTU, ephemeral=False).install(['gcc'])
+        self.assertEqual(mngr.command()[1].flatten(), ["apt-get", "-y", "install", "gcc"])
+        self.assertIsNone(mngr.command()[1].env)
+
+    def test_eatmydata(self):
+        '''
+        Test that eatmydata is preloaded by every package manager when found
+        '''
+
+        library = eatmydata_library()
+        for distro in [Distribution.UBUNTU, Distribution.ARCH, Distribution.RHEL]:
+            for cmd in self._mngr(distro).install(['gcc']).command():
+                if library is None:
+                    self.assertIsNone(cmd.env)
+                else:
+                    self.assertTrue(cmd.env['LD_PRELOAD'].startswith(library))
+
+    def test_find_library(self):
+        '''
+        Test locating the preload library
+        '''
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            library = os.path.join(tmpdir, 'libeatmydata.so.1')
+            with open(library, 'wb'):
+                pass
+
+            self.assertEqual(
+                _find_library([os.path.join(tmpdir, 'none*'),
+                               os.path.join(tmpdir, 'libeatmydata.so*')]),
+                library)
+            self.assertIsNone(_find_library([os.path.join(tmpdir, 'none*')]))
+            self.assertEqual(preload_env(library)['LD_PRELOAD'].split()[0], library)
+
+
+_APT_SUMMARY = """\
+The following NEW packages will be installed:
+  clang clang-14 lldb
+0 upgraded, 3 newly installed, 0 to remove and 0 not upgraded.
+Need to get 12.5 MB/52.3 MB of archives.
+After this operation, 187 MB of additional disk space will be used.
+Do you want to continue? [Y/n] N
+Abort.
+"""
+
+_DNF_SUMMARY = """\
+Install  12 Packages
+
+Total download size: 43 M
+Installed size: 120 M
+Is this ok [y/N]: Operation aborted.
+"""
+
+_DNF5_SUMMARY = """\
+Transaction Summary:
+ Installing:        12 packages
+
+Total size of inbound packages is 43 MiB. Need to download 43 MiB.
+After this operation, 120 MiB extra will be used (install 120 MiB, remove 0 B).
+"""
+
+
+class TestMinimalProfile(unittest.TestCase):
+    '''
+    Test suite for the minimal install profile
+    '''
+
+    def _mngr(self, distro: Distribution, minimal: bool = True):
+        return PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(distro) \
+            .minimal(minimal) \
+            .build()
+
+    def test_options(self):
+        '''
+        Test the options selecting the minimal profile
+        '''
+
+        mngr = self._mngr(Distribution.UBUNTU).install(['clang'])
+        self.assertEqual(mngr.command()[1].flatten(), [
+            "apt-get", "-y", "--no-install-recommends", "install", "clang"])
+
+        mngr = self._mngr(Distribution.RHEL).install(['clang'])
+        self.assertEqual(mngr.command()[1].flatten(), [
+            "yum", "-y", "--setopt=install_weak_deps=False", "--setopt=tsflags=nodocs",
+            "install", "clang"])
+
+        mngr = self._mngr(Distribution.UBUNTU, minimal=False).install(['clang'])
+        self.assertEqual(mngr.command()[1].flatten(), ["apt-get", "-y", "install", "clang"])
+
+    def test_pacman_config(self):
+        '''
+        Test that pacman gets a configuration excluding the documentation
+        '''
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': tmpdir}):
+                mngr = self._mngr(Distribution.ARCH).install(['clang'])
+
+            argv = mngr.command()[1].flatten()
+            self.assertEqual(argv[:3], ["pacman", "--noconfirm", "--config"])
+            self.assertEqual(argv[4:], ["-S", "clang"])
+
+            with open(argv[3], encoding='utf-8') as config:
+                lines = config.read().splitlines()
+            self.assertEqual(lines[:3], ["[options]", "Include = /etc/pacman.conf", "[options]"])
+            self.assertIn("usr/share/man/*", lines[3].split())
+
+    def test_footprint(self):
+        '''
+        Test parsing the footprint reported by the dry runs
+        '''
+
+        self.assertEqual(InstallSize.from_apt(_APT_SUMMARY),
+                         InstallSize(12_500_000, 187_000_000))
+        self.assertEqual(InstallSize.from_dnf(_DNF_SUMMARY),
+                         InstallSize(43 * 1024 ** 2, 120 * 1024 ** 2))
+        self.assertEqual(InstallSize.from_dnf(_DNF5_SUMMARY),
+                         InstallSize(43 * 1024 ** 2, 120 * 1024 ** 2))
+        self.assertEqual(InstallSize.from_pacman(
+            "warning: gcc-13.2.1-3 is up to date -- skipping\n1024\n2048\n"),
+            InstallSize(3072, None))
+        self.assertEqual(InstallSize.from_apt("E: Unable to locate package x"),
+                         InstallSize(None, None))
+
+        savings = SizeSavings(InstallSize(100, 1000), InstallSize(40, 300))
+        self.assertEqual(savings.download_saved, 60)
+        self.assertEqual(savings.installed_saved, 700)
+        self.assertIsNone(SizeSavings(InstallSize(100), InstallSize(40)).installed_saved)
+
+
+class TestParallelDownloads(unittest.TestCase):
+    '''
+    Test suite for the download concurrency and the prefetch phase
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._environ = mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': self._tmpdir.name})
+        self._environ.start()
+
+    def tearDown(self):
+        self._environ.stop()
+        self._tmpdir.cleanup()
+
+    def _mngr(self, distro: Distribution, downloads: int = 8, minimal: bool = False):
+        return PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(distro) \
+            .parallel_downloads(downloads) \
+            .minimal(minimal) \
+            .build()
+
+    def test_options(self):
+        '''
+        Test the native download concurrency options
+        '''
+
+        mngr = self._mngr(Distribution.UBUNTU).install(['llvm'])
+        self.assertEqual(mngr.command()[1].flatten(), [
+            "apt-get", "-y", "install", "llvm"])
+
+        mngr = self._mngr(Distribution.RHEL, downloads=32).install(['llvm'])
+        self.assertEqual(mngr.command()[1].flatten(), [
+            "yum", "-y", "--setopt=max_parallel_downloads=20", "install", "llvm"])
+
+        with self.assertRaises(ValueError):
+            self._mngr(Distribution.RHEL, downloads=0)
+
+    def test_pacman_config(self):
+        '''
+        Test that pacman gets a single configuration with all the directives
+        '''
+
+        mngr = self._mngr(Distribution.ARCH, minimal=True).install(['llvm'])
+        argv = mngr.command()[1].flatten()
+        self.assertEqual(argv.count("--config"), 1)
+
+        with open(argv[argv.index("--config") + 1], encoding='utf-8') as config:
+            lines = config.read().splitlines()
+        # the directives override the values of the base configuration
+        self.assertLess(lines.index("Include = /etc/pacman.conf"),
+                        lines.index("ParallelDownloads = 8"))
+        self.assertEqual(lines[lines.index("Include = /etc/pacman.conf") + 1], "[options]")
+        self.assertTrue(any(line.startswith("NoExtract = ") for line in lines))
+
+    def test_prefetch(self):
+        '''
+        Test the download only commands
+        '''
+
+        mngr = self._mngr(Distribution.UBUNTU).prefetch(['llvm'])
+        self.assertEqual([cmd.flatten()[-3:] for cmd in mngr.command()], [
+            ["apt-get", "-y", "update"],
+            ["--download-only", "install", "llvm"],
+        ])
+
+        mngr = self._mngr(Distribution.RHEL).prefetch(['llvm'])
+        self.assertEqual(mngr.command()[1].flatten()[-3:], ["--downloadonly", "install", "llvm"])
+
+        mngr = self._mngr(Distribution.ARCH).prefetch(['llvm'])
+        self.assertEqual(mngr.command()[1].flatten()[-2:], ["-Sw", "llvm"])
+
+        self.assertEqual(self._mngr(Distribution.ARCH).prefetch([]).command(), [])
+
+
+class TestPackageCache(unittest.TestCase):
+    '''
+    Test suite for the shared package archive cache
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cache = PackageCache(self._tmpdir.name, max_bytes=2500)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _archive(self, manager: str, filename: str, age: float = 0, size: int = 1000):
+        path = os.path.join(self.cache.directory(manager), filename)
+        with open(path, 'wb') as archive:
+            archive.write(b'\0' * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_index(self):
+        '''
+        Test indexing the archives of every package manager
+        '''
+
+        self._archive('apt', 'clang-14_1%3a14.0.6-12_amd64.deb')
+        self._archive('dnf', 'gcc-c++-12.2.1-4.fc38.x86_64.rpm')
+        self._archive('pacman', 'lib32-glibc-2.38-7-x86_64.pkg.tar.zst')
+        self._archive('pacman', 'lib32-glibc-2.38-7-x86_64.pkg.tar.zst.sig', size=10)
+        self._archive('apt', 'partial/llvm_1%3a14.0-55.7_amd64.deb')
+
+        self.assertEqual(set(self.cache.index()), {
+            ('clang-14', '1:14.0.6-12', 'amd64'),
+            ('gcc-c++', '12.2.1-4.fc38', 'x86_64'),
+            ('lib32-glibc', '2.38-7', 'x86_64'),
+        })
+        self.assertEqual(len(self.cache.lookup('gcc-c++', arch='x86_64')), 1)
+        self.assertEqual(self.cache.lookup('gcc-c++', version='13.1.0-1.fc38'), [])
+        self.assertEqual(self.cache.size(), 3000)
+
+    def test_prune(self):
+        '''
+        Test that the least recently used archives are evicted first
+        '''
+
+        oldest = self._archive('apt', 'clang_1%3a14.0-55.7_amd64.deb', age=300)
+        used = self._archive('apt', 'llvm_1%3a14.0-55.7_amd64.deb', age=200)
+        newest = self._archive('apt', 'lld_1%3a14.0-55.7_amd64.deb', age=100)
+
+        # read by the package manager after the newest archive was downloaded
+        mtime = os.stat(used).st_mtime
+        os.utime(used, (time.time(), mtime))
+
+        self.assertEqual(self.cache.prune(), [Path(oldest)])
+        self.assertTrue(os.path.exists(used))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_options(self):
+        '''
+        Test that the package managers download into the cache
+        '''
+
+        def _mngr(distro: Distribution):
+            return PackageManagerBuilder() \
+                .confirm_action(False) \
+                .distribution(distro) \
+                .package_cache(self.cache) \
+                .build()
+
+        argv = _mngr(Distribution.UBUNTU).install(['llvm']).command()[1].flatten()
+        self.assertIn(f"Dir::Cache::Archives={self.cache.root / 'apt'}", argv)
+        self.assertTrue(os.path.isdir(self.cache.root / 'apt' / 'partial'))
+
+        argv = _mngr(Distribution.RHEL).install(['llvm']).command()[1].flatten()
+        self.assertIn(f"--setopt=cachedir={self.cache.root / 'dnf'}", argv)
+
+        with mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': self._tmpdir.name}):
+            argv = _mngr(Distribution.ARCH).install(['llvm']).command()[1].flatten()
+        with open(argv[argv.index("--config") + 1], encoding='utf-8') as config:
+            self.assertIn(f"CacheDir = {self.cache.root / 'pacman'}/", config.read().splitlines())
+
+
+class TestLockWait(unittest.TestCase):
+    '''
+    Test suite for waiting on the package database and host locks
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.lock = HostLock(os.path.join(self._tmpdir.name, 'provision.lock'))
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _mngr(self, timeout: float = 5, lock: HostLock = None):
+        return PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(Distribution.UBUNTU) \
+            .lock_wait(timeout) \
+            .host_lock(lock) \
+            .build()
+
+    def _locked_once(self, mngr, message: str = 'E: Could not get lock /var/lib/dpkg/lock'):
+        # fails the first time it runs, like a command started while the
+        # database lock is held
+        marker = os.path.join(self._tmpdir.name, 'ran')
+        script = f"[ -e {marker} ] && exit 0; touch {marker}; echo '{message}' >&2; exit 100"
+        cmd = CommandBuilder().program('sh').options(['-c', script])
+        mngr.command_list.append(mngr._apply_lock_wait(cmd).build())
+        return mngr
+
+    def test_options(self):
+        '''
+        Test that apt waits for the dpkg lock on its own
+        '''
+
+        argv = self._mngr(timeout=30).install(['gcc']).command()[1].flatten()
+        self.assertIn("DPkg::Lock::Timeout=30", argv)
+
+        argv = self._mngr(timeout=None).install(['gcc']).command()[1].flatten()
+        self.assertNotIn("DPkg::Lock::Timeout=30", argv)
+
+        # apt only waits for what is left of the timeout
+        mngr = self._mngr(timeout=30).install(['gcc'])
+        argv = mngr._with_lock_budget(mngr.command()[1], 12.7).flatten()
+        self.assertIn("DPkg::Lock::Timeout=12", argv)
+        self.assertNotIn("DPkg::Lock::Timeout=30", argv)
+        self.assertIn("DPkg::Lock::Timeout=30", mngr.command()[1].flatten())
+
+    def test_retry(self):
+        '''
+        Test that commands failing on a held lock are run again
+        '''
+
+        mngr = self._locked_once(self._mngr())
+        self.assertEqual(mngr.commit(), 0)
+        self.assertGreater(mngr.queue_wait, 0)
+
+        mngr = self._mngr(timeout=None)
+        mngr.command_list = self._locked_once(self._mngr()).command_list
+        os.remove(os.path.join(self._tmpdir.name, 'ran'))
+        self.assertEqual(mngr.commit(), 100)
+
+        mngr = self._locked_once(self._mngr(), message='E: Unable to locate package gcc')
+        os.remove(os.path.join(self._tmpdir.name, 'ran'))
+        self.assertEqual(mngr.commit(), 100)
+        self.assertEqual(mngr.queue_wait, 0)
+
+    def test_host_lock(self):
+        '''
+        Test that the commits are serialized by the host lock
+        '''
+
+        mngr = self._mngr(timeout=0.2, lock=self.lock)
+        mngr.command_list.append(CommandBuilder().program('true').build())
+
+        with self.lock.hold():
+            self.assertEqual(mngr.commit(), errno.ETIMEDOUT)
+        self.assertGreater(mngr.queue_wait, 0)
+
+        results = []
+        mngr.use_lock_wait(5)
+        with self.lock.hold():
+            waiter = threading.Thread(target=lambda: results.append(mngr.commit()))
+            waiter.start()
+            time.sleep(0.2)
+        waiter.join()
+        self.assertEqual(results, [0])
+        self.assertGreater(mngr.queue_wait, 0)
+
+    def test_host_lock_denied(self):
+        '''
+        Test that the commits run without a host lock they cannot open
+        '''
+
+        class _DeniedLock(HostLock):
+            def hold(self, timeout: float = None):
+                raise PermissionError(errno.EACCES, 'Permission denied', str(self.path))
+
+        mngr = self._mngr(lock=_DeniedLock(self.lock.path))
+        mngr.command_list.append(CommandBuilder().program('true').build())
+        self.assertEqual(mngr.commit(), 0)
+
+    def test_contention(self):
+        '''
+        Test the detection of the lock contention messages
+        '''
+
+        self.assertTrue(_lock_contended("error: failed to init transaction (unable to lock database)"))
+        self.assertFalse(_lock_contended("error: target not found: gcc"))
+
+
+class TestReconcile(unittest.TestCase):
+    '''
+    Test suite for converging the installed packages to a desired set
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.state = ManagedState(os.path.join(self._tmpdir.name, 'managed.json'))
+        status = os.path.join(self._tmpdir.name, 'status')
+        with open(status, 'w', encoding='utf-8') as out:
+            out.write(_DPKG_STATUS)
+        self.installed = DpkgIndex(status)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _mngr(self, distro: Distribution = Distribution.UBUNTU):
+        mngr = PackageManagerBuilder() \
+            .confirm_action(False) \
+            .distribution(distro) \
+            .build()
+        mngr.installed = self.installed
+        return mngr
+
+    def test_plan(self):
+        '''
+        Test the minimal diff against the installed packages
+        '''
+
+        plan = plan_reconcile(['gcc', 'clang', 'gcc', 'vim'], frozenset({'gcc', 'make', 'lld'}),
+                              managed={'gcc', 'lld', 'make', 'lldb'}, outdated={'gcc', 'lld'})
+        self.assertEqual(plan.install, ['clang', 'vim'])
+        self.assertEqual(plan.upgrade, ['gcc'])
+        self.assertEqual(plan.remove, ['lld', 'make'])
+        self.assertEqual(plan.managed, ['gcc', 'clang', 'vim'])
+
+        # installed by other means, never managed nor removed
+        plan = plan_reconcile(['gcc'], frozenset({'gcc', 'make'}))
+        self.assertTrue(plan.empty())
+        self.assertEqual(plan.managed, [])
+
+    def test_state(self):
+        '''
+        Test recording the managed packages
+        '''
+
+        self.assertEqual(self.state.load(), set())
+        self.state.save(['vim', 'clang'])
+        self.assertEqual(self.state.load(), {'clang', 'vim'})
+
+        with open(self.state.path, 'w', encoding='utf-8') as state:
+            state.write('{')
+        self.assertEqual(self.state.load(), set())
+
+    def test_apt(self):
+        '''
+        Test that apt applies the diff in a single transaction
+        '''
+
+        self.state.save(['make', 'lld'])
+        mngr = self._mngr().reconcile(['gcc', 'clang'], self.state)
+        self.assertEqual([cmd.flatten() for cmd in mngr.command()], [
+            ["apt-get", "-y", "update"],
+            ["apt-get", "-y", "install", "clang", "make-"],
+        ])
+
+        self.assertEqual(self._mngr().reconcile(['gcc', 'make']).command(), [])
+
+        mngr = self._mngr()
+        self.assertEqual(mngr._parse_outdated(
+            "Inst gcc [4:12.2.0-3] (4:12.2.0-14 Debian:12/stable [amd64])\n"
+            "Inst libisl23 (0.25-1.1 Debian:12/stable [amd64])\n"
+            "Conf gcc (4:12.2.0-14 Debian:12/stable [amd64])\n"), {'gcc'})
+
+    def test_backends(self):
+        '''
+        Test the reconcile commands and outdated packages of pacman and yum,
+        which applies the diff in a single transaction
+        '''
+
+        self.state.save(['make'])
+        mngr = self._mngr(Distribution.ARCH)
+        mngr.synced = True
+        mngr._reconcile_cmds(mngr.plan(['gcc', 'clang'], self.state))
+        self.assertEqual([cmd.flatten()[-2:] for cmd in mngr.command()], [
+            ["-S", "clang"],
+            ["-Rs", "make"],
+        ])
+        self.assertEqual(mngr._parse_outdated("gcc 13.2.1-3 -> 13.2.1-5\n"), {'gcc'})
+
+        mngr = self._mngr(Distribution.RHEL)
+        mngr.synced = True
+        with mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': self._tmpdir.name}), \
+                mock.patch.object(_yum, '_is_dnf5', return_value=False):
+            mngr._reconcile_cmds(mngr.plan(['gcc', 'clang'], self.state))
+        argv = mngr.command()[0].flatten()
+        self.assertEqual(len(mngr.command()), 1)
+        self.assertEqual(argv[:3], ["yum", "-y", "shell"])
+        with open(argv[3], encoding='utf-8') as script:
+            self.assertEqual(script.read(), "install clang\nremove make\nrun\n")
+
+        # dnf5 has no shell
+        mngr = self._mngr(Distribution.RHEL)
+        mngr.synced = True
+        with mock.patch.object(_yum, '_is_dnf5', return_value=True):
+            mngr._reconcile_cmds(mngr.plan(['gcc', 'clang'], self.state))
+        self.assertEqual([cmd.flatten()[-2:] for cmd in mngr.command()], [
+            ["install", "clang"],
+            ["remove", "make"],
+        ])
+
+        self.assertEqual(mngr._parse_outdated(
+            "\ngcc.x86_64    11.4.1-3.el9    baseos\n"
+            "gcc-c++.x86_64    11.4.1-3.el9    appstream\n"
+            "Obsoleting Packages\n"
+            "grub2-tools.x86_64    1:2.06-70.el9    baseos\n"), {'gcc', 'gcc-c++'})
+
+    def test_dnf5(self):
+        '''
+        Test the detection of dnf5 behind the `yum` command
+        '''
+
+        with tempfile.TemporaryDirectory() as bin_dir:
+            dnf5 = os.path.join(bin_dir, 'dnf5')
+            with open(dnf5, 'w', encoding='utf-8') as script:
+                script.write('#!/bin/sh\n')
+            os.chmod(dnf5, 0o755)
+            os.symlink(dnf5, os.path.join(bin_dir, 'yum'))
+
+            _yum._is_dnf5.cache_clear()
+            try:
+                with mock.patch.dict(os.environ, {'PATH': bin_dir}):
+                    self.assertTrue(_yum._is_dnf5('yum'))
+                    self.assertFalse(_yum._is_dnf5('dnf'))
+            finally:
+                _yum._is_dnf5.cache_clear()
+
+    def test_groups(self):
+        '''
+        Test that the package groups installed by the reconciler converge
+        '''
+
+        group = '@C Development Tools and Libraries'
+        plan = plan_reconcile([group, 'gcc'], frozenset({'gcc'}))
+        self.assertEqual(plan.install, [group])
+        self.assertEqual(plan.managed, [group])
+
+        self.assertTrue(plan_reconcile([group, 'gcc'], frozenset({'gcc'}), managed={group}).empty())
+
+        plan = plan_reconcile(['gcc'], frozenset({'gcc'}), managed={group})
+        self.assertEqual(plan.remove, [group])
+
+    def test_commit_records_state(self):
+        '''
+        Test that the managed packages are only recorded by a successful commit
+        '''
+
+        mngr = self._mngr().reconcile(['gcc', 'clang'], self.state)
+        mngr.command_list = [CommandBuilder().program('false').build()]
+        self.assertNotEqual(mngr.commit(), 0)
+        self.assertEqual(self.state.load(), set())
+
+        mngr.command_list = [CommandBuilder().program('true').build()]
+        self.assertEqual(mngr.commit(), 0)
+        self.assertEqual(self.state.load(), {'clang'})
+
+
+_APT_PACKAGES = """\
+Package: clang
+Version: 1:14.0-55.7
+Depends: clang-14 (>= 14~), libc6:any
+Size: 9436
+
+Package: clang-14
+Version: 1:14.0.6-12
+Pre-Depends: libc6 (>= 2.34)
+Depends: libllvm14 (= 1:14.0.6-12), libgcc-s1 | libgcc1,
+ binutils
+Size: 121840
+Description: C, C++ and Objective-C compiler
+ multi-line description
+ .
+ continued
+
+Package: libc6
+Version: 2.36-9
+Provides: libc6-x32-compat
+Size: 2757936
+
+Package: libllvm14
+Version: 1:14.0.6-12
+Depends: libc6
+Size: 24007740
+"""
+
+_PACMAN_DESC = """\
+%FILENAME%
+{name}-{version}-x86_64.pkg.tar.zst
+
+%NAME%
+{name}
+
+%VERSION%
+{version}
+
+%CSIZE%
+{size}
+
+%DEPENDS%
+{depends}
+
+"""
+
+_PRIMARY_XML = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common"
+          xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="2">
+<package type="rpm">
+  <name>gcc</name>
+  <arch>x86_64</arch>
+  <version epoch="0" ver="11.4.1" rel="3.el9"/>
+  <size package="32990877" installed="92341546" archive="92391008"/>
+  <format>
+    <rpm:provides><rpm:entry name="gcc" flags="EQ" ver="11.4.1"/></rpm:provides>
+    <rpm:requires>
+      <rpm:entry name="cpp" flags="EQ" ver="11.4.1"/>
+      <rpm:entry name="libc.so.6()(64bit)"/>
+    </rpm:requires>
+  </format>
+</package>
+<package type="rpm">
+  <name>glibc</name>
+  <version epoch="0" ver="2.34" rel="100.el9"/>
+  <size package="2012340"/>
+  <format>
+    <rpm:provides><rpm:entry name="libc.so.6()(64bit)"/></rpm:provides>
+  </format>
+</package>
+</metadata>
+"""
+
+
+class TestRepoIndex(unittest.TestCase):
+    '''
+    Test suite for the offline index of the repository metadata
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _path(self, *parts: str) -> str:
+        path = os.path.join(self._tmpdir.name, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def test_apt(self):
+        '''
+        Test indexing the apt lists, plain and compressed
+        '''
+
+        main = _APT_PACKAGES[:_APT_PACKAGES.index('Package: libllvm14')]
+        with open(self._path('lists', 'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages'),
+                  'w', encoding='utf-8') as packages:
+            packages.write(main)
+        with gzip.open(self._path('lists', 'apt.llvm.org_dists_main_binary-amd64_Packages.gz'),
+                       'wt', encoding='utf-8') as packages:
+            packages.write(_APT_PACKAGES[len(main):])
+
+        index = RepoIndex.from_apt(os.path.join(self._tmpdir.name, 'lists'))
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.get('clang-14').depends,
+                         ('libc6', 'libllvm14', 'libgcc-s1', 'binutils'))
+        self.assertEqual(index.get('libc6-x32-compat').name, 'libc6')
+        self.assertEqual(index.missing(['clang', 'clangd', 'libc6-x32-compat']), ['clangd'])
+
+        self.assertEqual(index.closure(['clang']), ['clang', 'clang-14', 'libc6', 'libllvm14'])
+        self.assertEqual(index.download_size(['clang'], installed={'libc6'}),
+                         9436 + 121840 + 24007740)
+
+    def test_pacman(self):
+        '''
+        Test streaming the pacman sync databases
+        '''
+
+        with tarfile.open(self._path('sync', 'core.db'), 'w:gz') as database:
+            for name, version, size, depends in [('gcc', '13.2.1-3', 47580000, 'gcc-libs\nbinutils>=2.28'),
+                                                 ('gcc-libs', '13.2.1-3', 25000000, 'glibc')]:
+                desc = _PACMAN_DESC.format(name=name, version=version, size=size,
+                                           depends=depends).encode()
+                info = tarfile.TarInfo(f"{name}-{version}/desc")
+                info.size = len(desc)
+                database.addfile(info, io.BytesIO(desc))
+
+        index = RepoIndex.from_pacman(os.path.join(self._tmpdir.name, 'sync'))
+        self.assertEqual(index.get('gcc').depends, ('gcc-libs', 'binutils'))
+        self.assertEqual(index.download_size(['gcc']), 72580000)
+
+    def test_repomd(self):
+        '''
+        Test parsing the primary metadata of the rpm repositories
+        '''
+
+        pattern = os.path.join(self._tmpdir.name, 'dnf', '*', 'repodata', '*primary.xml*')
+        with gzip.open(self._path('dnf', 'baseos-1234', 'repodata', '0a1b-primary.xml.gz'),
+                       'wt', encoding='utf-8') as primary:
+            primary.write(_PRIMARY_XML)
+
+        index = RepoIndex.from_repomd([pattern])
+        self.assertEqual(index.get('gcc').version, '11.4.1-3.el9')
+        self.assertEqual(index.closure(['gcc']), ['gcc', 'glibc'])
+        self.assertEqual(index.download_size(['gcc']), 32990877 + 2012340)
+
+        mngr = PackageManagerBuilder().distribution(Distribution.RHEL).build()
+        with mock.patch.object(RepoIndex, 'from_repomd', return_value=index):
+            self.assertIs(mngr.repo_index(), index)
+
+    def test_unreadable(self):
+        '''
+        Test that no index is built without any readable metadata
+        '''
+
+        lists_dir = os.path.join(self._tmpdir.name, 'lists')
+        self.assertIsNone(RepoIndex.from_apt(lists_dir))
+        with open(self._path('lists', 'deb.debian.org_debian_dists_bookworm_main_binary-amd64_Packages.lz4'),
+                  'wb') as packages:
+            packages.write(b'\x04\x22\x4d\x18')
+        with open(self._path('lists', 'deb.debian.org_debian_dists_bookworm_contrib_binary-amd64_Packages.gz'),
+                  'wb') as packages:
+            packages.write(b'not gzip')
+        self.assertIsNone(RepoIndex.from_apt(lists_dir))
+
+        # an empty list is read, it is the repository which has no packages
+        with open(self._path('lists', 'deb.debian.org_debian_dists_bookworm_non-free_binary-amd64_Packages'),
+                  'wb'):
+            pass
+        self.assertEqual(len(RepoIndex.from_apt(lists_dir)), 0)
+
+        with open(self._path('sync', 'core.db'), 'wb') as database:
+            database.write(b'\x28\xb5\x2f\xfd' + bytes(512))
+        self.assertIsNone(RepoIndex.from_pacman(os.path.join(self._tmpdir.name, 'sync')))
+
+        with gzip.open(self._path('dnf', 'baseos-1234', 'repodata', '0a1b-primary.xml.gz'),
+                       'wt', encoding='utf-8') as primary:
+            primary.write(_PRIMARY_XML[:len(_PRIMARY_XML) // 2])
+        pattern = os.path.join(self._tmpdir.name, 'dnf', '*', 'repodata', '*primary.xml*')
+        self.assertIsNone(RepoIndex.from_repomd([pattern]))
+
 
 class TestAptPackageManager(unittest.TestCase):
     '''
@@ -2,12 +2,25 @@
 Interface for package manager
 '''
 
+import contextlib
+import copy
+import errno
+import time
 from dataclasses import dataclass
 from enum import Enum
 
 from typing_extensions import Self
 
-from project_generator.lib.utils.command import Command
+from project_generator.lib.utils.command import Command, CommandBuilder, ShellSession
+
+from ._ephemeral import eatmydata_library, preload_env
+from ._footprint import InstallSize, SizeSavings
+from ._freshness import RepoFreshness
+from ._installed import InstalledIndex
+from ._locking import _LOCK_CAPTURE_SIZE, HostLock, _Backoff, _lock_contended
+from ._pkgcache import PackageCache
+from ._reconcile import ManagedState, ReconcilePlan, plan_reconcile
+from ._repoindex import RepoIndex
 
 
 class Action(Enum):
@@ -31,6 +44,19 @@ class PackageManager:
     cmd_name: str = None
     synced: bool = None
     command_list: list[Command] = None
+    session: ShellSession = None
+    freshness: RepoFreshness = None
+    sync_ttl: float = None
+    sync_cmd: Command = None
+    installed: InstalledIndex = None
+    ephemeral: bool = None
+    minimal: bool = None
+    downloads: int = None
+    package_cache: PackageCache = None
+    lock_timeout: float = None
+    host_lock: HostLock = None
+    queue_wait: float = None
+    reconciled: ReconcilePlan = None
 
     def __init__(self):
         self.confirmation = False
@@ -39,6 +65,19 @@ class PackageManager:
         self.synced = False
         self.command_list: list[Command] = []
         self.pkglist = {}
+        self.session = None
+        self.freshness = None
+        self.sync_ttl = None
+        self.sync_cmd = None
+        self.installed = None
+        self.ephemeral = False
+        self.minimal = False
+        self.downloads = None
+        self.package_cache = None
+        self.lock_timeout = None
+        self.host_lock = None
+        self.queue_wait = 0.0
+        self.reconciled = None
 
     def confirm(self, cnf: bool = False) -> Self:
         '''
@@ -47,12 +86,278 @@ class PackageManager:
         self.confirmation = cnf
         return self
 
+    def use_session(self, session: ShellSession = None) -> Self:
+        '''
+        Run the non-interactive package manager commands inside a persistent
+        shell session
+        '''
+        self.session = session
+        return self
+
+    def use_sync_ttl(self, ttl: float = None) -> Self:
+        '''
+        Skip syncing the repository metadata if it was refreshed less than
+        `ttl` seconds ago. `None` always syncs.
+        '''
+        self.sync_ttl = ttl
+        return self
+
+    def skip_installed(self, skip: bool = False) -> Self:
+        '''
+        Whether to drop the already installed packages from installs, looking
+        them up in the native package database
+        '''
+        self.installed = self._installed_index() if skip else None
+        return self
+
+    def _installed_index(self) -> InstalledIndex:
+        '''
+        Return the index of the installed packages for the package manager
+        '''
+        return None
+
+    def repo_index(self) -> RepoIndex | None:
+        '''
+        Return the index of the packages available in the repository metadata
+        on the host, read without any network access, `None` when the package
+        manager does not support it or none of the metadata could be read
+        '''
+        return None
+
+    def _drop_installed(self, install_list: list[str]) -> list[str]:
+        '''
+        Remove the already installed packages from `install_list`
+        '''
+        if self.installed is None:
+            return install_list
+        return self.installed.missing(install_list)
+
+    def _repo_is_fresh(self) -> bool:
+        '''
+        Whether the repository metadata is recent enough to skip the sync
+        '''
+        return self.freshness is not None and self.freshness.is_fresh(self.sync_ttl)
+
+    def _queue_sync(self, cmd: Command):
+        '''
+        Queue the repository sync command, to be recorded once successful
+        '''
+        self.sync_cmd = cmd
+        self.command_list.append(cmd)
+
+    def use_ephemeral(self, ephemeral: bool = False) -> Self:
+        '''
+        Whether to give up the crash safety of the package database and the
+        unpacked files for speed, for environments which are thrown away on
+        failure, like container image builds
+        '''
+        self.ephemeral = ephemeral
+        return self
+
+    def _unsafe_io_options(self) -> list[str]:
+        '''
+        Options of the package manager disabling its own syncing to the disk
+        '''
+        return []
+
+    def _apply_ephemeral(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Disable the syncing to the disk of the command in the ephemeral mode,
+        through the options of the package manager and by preloading eatmydata
+        when it is installed
+        '''
+        if not self.ephemeral:
+            return cmd
+
+        cmd.options(self._unsafe_io_options())
+
+        library = eatmydata_library()
+        if library is not None:
+            cmd.env_vars(preload_env(library))
+        return cmd
+
+    def use_minimal(self, minimal: bool = False) -> Self:
+        '''
+        Whether to install only the hard dependencies of the packages, leaving
+        out recommended packages and documentation
+        '''
+        self.minimal = minimal
+        return self
+
+    def _minimal_options(self) -> list[str]:
+        '''
+        Options of the package manager selecting the minimal profile
+        '''
+        return []
+
+    def _apply_minimal(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Add the options of the minimal profile to the command, when selected
+        '''
+        if self.minimal:
+            cmd.options(self._minimal_options())
+        return cmd
+
+    def use_parallel_downloads(self, count: int = None) -> Self:
+        '''
+        Number of packages to download concurrently, `None` keeps the default
+        of the package manager
+        '''
+        if count is not None and count < 1:
+            raise ValueError("parallel downloads must be at least 1")
+        self.downloads = count
+        return self
+
+    def _parallel_download_options(self) -> list[str]:
+        '''
+        Options of the package manager setting the download concurrency
+        '''
+        return []
+
+    def _apply_downloads(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Add the download concurrency options to the command, when set
+        '''
+        if self.downloads is not None:
+            cmd.options(self._parallel_download_options())
+        return cmd
+
+    def use_package_cache(self, cache: PackageCache = None) -> Self:
+        '''
+        Keep the downloaded package archives in `cache`, shared across runs
+        '''
+        self.package_cache = cache
+        return self
+
+    def _package_cache_options(self) -> list[str]:
+        '''
+        Options of the package manager moving its archives into the cache
+        '''
+        return []
+
+    def _apply_package_cache(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Add the package cache options to the command, when set
+        '''
+        if self.package_cache is not None:
+            cmd.options(self._package_cache_options())
+        return cmd
+
+    def use_lock_wait(self, timeout: float = None) -> Self:
+        '''
+        Wait up to `timeout` seconds, with an exponential backoff, for the
+        package database locks held by other processes instead of failing.
+        `None` fails right away.
+        '''
+        self.lock_timeout = timeout
+        return self
+
+    def use_host_lock(self, lock: HostLock = None) -> Self:
+        '''
+        Serialize the commits with the other runs holding the same host lock.
+        The lock is waited for at most the lock wait timeout.
+        '''
+        self.host_lock = lock
+        return self
+
+    def _lock_wait_options(self, timeout: float) -> list[str]:
+        '''
+        Options of the package manager making it wait up to `timeout` seconds
+        for the database lock on its own
+        '''
+        return []
+
+    def _apply_lock_wait(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Make the command wait for the locks, when set, and capture the tail of
+        its output to detect the lock contention. Interactive commands keep
+        the terminal and rely on the package manager alone.
+        '''
+        if self.lock_timeout is None:
+            return cmd
+
+        cmd.options(self._lock_wait_options(self.lock_timeout))
+        if not self.confirmation:
+            cmd.capture_output(_LOCK_CAPTURE_SIZE)
+        return cmd
+
+    def _download_only_cmd(self, install_list: list[str]) -> Command:
+        '''
+        Return the command downloading the packages without installing them,
+        `None` when the package manager cannot download only
+        '''
+        return None
+
+    def _dry_run_cmd(self, install_list: list[str], minimal: bool) -> Command:
+        '''
+        Return the command printing the footprint of installing `install_list`
+        without installing anything, `None` when the package manager has no
+        dry run
+        '''
+        return None
+
+    def _parse_footprint(self, output: str) -> InstallSize:
+        '''
+        Extract the footprint from the output of the dry run command
+        '''
+        return InstallSize()
+
+    def estimate_size(self, install_list: list[str], minimal: bool = None) -> InstallSize:
+        '''
+        Return the download and disk footprint of installing `install_list`,
+        with the minimal profile if `minimal`, defaulting to the selected
+        profile. Requires synced repository metadata.
+        '''
+        if minimal is None:
+            minimal = self.minimal
+
+        cmd = self._dry_run_cmd(install_list, minimal)
+        if cmd is None:
+            return InstallSize()
+        return self._parse_footprint(cmd.execute().text())
+
+    def minimal_savings(self, install_list: list[str]) -> SizeSavings:
+        '''
+        Return how much the minimal profile saves on installing `install_list`
+        '''
+        return SizeSavings(full=self.estimate_size(install_list, minimal=False),
+                           minimal=self.estimate_size(install_list, minimal=True))
+
+    def _attach_session(self, cmd: CommandBuilder) -> CommandBuilder:
+        '''
+        Route the command through the shell session, unless confirmation is
+        requested, which needs the terminal as stdin
+        '''
+        if self.session is not None and not self.confirmation:
+            cmd.session(self.session)
+        return cmd
+
     def install(self, install_list: list[str]) -> Self:
         '''
         Install the given list of packages
         '''
         return self
 
+    def prefetch(self, install_list: list[str]) -> Self:
+        '''
+        Download the given list of packages into the package cache without
+        installing them, so that a later install of them skips the downloads.
+        Committing a prefetch can overlap with other work.
+        '''
+        install_list = self._drop_installed(install_list)
+        if not install_list:
+            return self
+
+        cmd = self._download_only_cmd(install_list)
+        if cmd is None:
+            return self
+
+        if not self.synced:
+            self.sync(True)
+
+        self.command_list.append(cmd)
+        return self
+
     def remove(self, remove_list: list[str]) -> Self:
         '''
         Remove the given list of packages
@@ -71,14 +376,153 @@ class PackageManager:
         '''
         return self
 
+    def _outdated_cmd(self) -> Command:
+        '''
+        Return the command listing the installed packages with an upgrade
+        available in the repository metadata, `None` when the package manager
+        cannot list them
+        '''
+        return None
+
+    def _parse_outdated(self, output: str) -> set[str]:
+        '''
+        Extract the package names from the output of the outdated command
+        '''
+        return set()
+
+    def outdated(self) -> set[str]:
+        '''
+        Return the installed packages which have an upgrade available, as
+        known from the repository metadata on the host
+        '''
+        cmd = self._outdated_cmd()
+        if cmd is None:
+            return set()
+        return self._parse_outdated(cmd.execute().text())
+
+    def plan(self, desired: list[str], state: ManagedState = None,
+             upgrade: bool = False) -> ReconcilePlan:
+        '''
+        Return the changes converging the installed packages to `desired`.
+        The packages recorded in `state` and no longer desired are removed,
+        and with `upgrade` the outdated desired packages are upgraded.
+        '''
+        installed = self.installed if self.installed is not None else self._installed_index()
+        plan = plan_reconcile(desired, installed.packages(),
+                              managed=state.load() if state is not None else set(),
+                              outdated=self.outdated() if upgrade else set())
+        plan.state = state
+        return plan
+
+    def _reconcile_cmds(self, plan: ReconcilePlan):
+        '''
+        Queue the commands applying the plan
+        '''
+        if plan.install:
+            self.install(plan.install)
+        if plan.upgrade:
+            self.update(plan.upgrade)
+        if plan.remove:
+            self.remove(plan.remove)
+
+    def reconcile(self, desired: list[str], state: ManagedState = None,
+                  upgrade: bool = False) -> Self:
+        '''
+        Install, upgrade and remove only what differs between the installed
+        packages and `desired`, see `plan`. The managed packages are recorded
+        in `state` once the commit succeeds.
+        '''
+        plan = self.plan(desired, state, upgrade)
+        if not plan.empty():
+            self._reconcile_cmds(plan)
+        self.reconciled = plan
+        return self
+
     def command(self) -> list[Command]:
         '''
         Return the raw accumulated commands so far
         '''
         return self.command_list
 
+    def _with_lock_budget(self, cmd: Command, budget: float) -> Command:
+        '''
+        Return the command with its lock wait options bounded by the `budget`
+        left of the lock wait timeout
+        '''
+        options = self._lock_wait_options(self.lock_timeout)
+        budgeted = self._lock_wait_options(budget)
+        if options == budgeted or not cmd.cmd_opts:
+            return cmd
+
+        for idx in range(len(cmd.cmd_opts) - len(options) + 1):
+            if cmd.cmd_opts[idx:idx + len(options)] == options:
+                cmd = copy.copy(cmd)
+                cmd.cmd_opts = cmd.cmd_opts[:idx] + budgeted + cmd.cmd_opts[idx + len(options):]
+                break
+        return cmd
+
+    def _run_waiting(self, cmd: Command) -> int:
+        '''
+        Run the command, running it again with a backoff while it fails on a
+        database lock held by another process. The waits of the whole commit
+        share the lock wait timeout.
+        '''
+        if self.lock_timeout is None:
+            return cmd.execute().returncode
+
+        budget = max(0.0, self.lock_timeout - self.queue_wait)
+        start = time.monotonic()
+        backoff = _Backoff(budget)
+        contended = 0.0
+        try:
+            while True:
+                remaining = max(0.0, budget - (time.monotonic() - start))
+                result = self._with_lock_budget(cmd, remaining).execute()
+                if result.returncode == 0 or not _lock_contended(result.text()):
+                    return result.returncode
+                # the failed run spent its time waiting for the lock
+                contended += result.wall_time
+                if not backoff.sleep():
+                    return result.returncode
+        finally:
+            self.queue_wait += backoff.waited + contended
+
     def commit(self) -> int:
         '''
-        Run the package manager commands
+        Run the package manager commands. The time spent waiting for the locks
+        is recorded in `queue_wait`.
         '''
+        self.queue_wait = 0.0
+
+        with contextlib.ExitStack() as stack:
+            if self.host_lock is not None:
+                try:
+                    self.queue_wait += stack.enter_context(
+                        self.host_lock.hold(self.lock_timeout))
+                except TimeoutError:
+                    # only a bounded wait gives up
+                    self.queue_wait += self.lock_timeout
+                    return errno.ETIMEDOUT
+                except PermissionError:
+                    # a lock file created by another user, the package manager
+                    # still serializes on its own database lock
+                    pass
+
+            return self._run_commands()
+
+    def _run_commands(self) -> int:
+        for cmd in self.command_list:
+            ret = self._run_waiting(cmd)
+            if ret != 0:
+                return ret
+
+            if cmd is self.sync_cmd and self.freshness is not None:
+                self.freshness.mark()
+
+        if self.reconciled is not None:
+            self.reconciled.record()
+
+        if self.package_cache is not None:
+            self.package_cache.prune()
+
         return 0
@@ -0,0 +1,98 @@
+'''
+Convergence of the installed packages to a desired set
+'''
+
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from project_generator.lib.utils.cache import default_cache_dir
+
+
+class ManagedState:
+    '''
+    Record of the packages installed by the reconciler. Only these packages
+    are ever removed by it, the packages installed by other means are left
+    alone even once they are no longer desired. Losing the record only makes
+    the reconciler forget what to remove.
+    '''
+
+    def __init__(self, path: Path = None, name: str = 'packages'):
+        if path is None:
+            path = default_cache_dir('pkgmngr', f"{name}.managed.json")
+        self.path = Path(path)
+
+    def load(self) -> set[str]:
+        '''
+        Return the managed packages
+        '''
+
+        try:
+            with open(self.path, encoding='utf-8') as state:
+                return set(json.load(state))
+        except (FileNotFoundError, ValueError, TypeError):
+            return set()
+
+    def save(self, packages: list[str]):
+        '''
+        Replace the managed packages with `packages`
+        '''
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as state:
+            json.dump(sorted(packages), state)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass(slots=True)
+class ReconcilePlan:
+    '''
+    Changes converging the installed packages to the desired ones, along with
+    the packages managed once they are applied
+    '''
+
+    install: list[str] = field(default_factory=list)
+    upgrade: list[str] = field(default_factory=list)
+    remove: list[str] = field(default_factory=list)
+    managed: list[str] = field(default_factory=list)
+    state: ManagedState = None
+
+    def empty(self) -> bool:
+        '''
+        Whether the installed packages already match the desired ones
+        '''
+        return not (self.install or self.upgrade or self.remove)
+
+    def record(self):
+        '''
+        Record the packages managed after the plan was applied
+        '''
+        if self.state is not None:
+            self.state.save(self.managed)
+
+
+def plan_reconcile(desired: list[str], installed: frozenset[str], managed: set[str] = frozenset(),
+                   outdated: set[str] = frozenset()) -> ReconcilePlan:
+    '''
+    Compute the changes bringing the `installed` packages to the `desired`
+    ones: install the missing packages, upgrade the `outdated` desired ones,
+    and remove the `managed` packages which are no longer desired. Package
+    groups, named with a leading `@`, are not in the package database, they
+    count as installed once the reconciler installed them.
+    '''
+
+    installed = installed | {name for name in managed if name.startswith('@')}
+    desired = list(dict.fromkeys(desired))
+    wanted = set(desired)
+
+    install = [pkg for pkg in desired if pkg not in installed]
+    upgrade = [pkg for pkg in desired if pkg in installed and pkg in outdated]
+    remove = sorted(pkg for pkg in managed if pkg not in wanted and pkg in installed)
+    # packages which were already installed do not become managed
+    kept = [pkg for pkg in desired if pkg in managed and pkg in installed]
+
+    return ReconcilePlan(install=install, upgrade=upgrade, remove=remove,
+                         managed=kept + install)
@@ -0,0 +1,319 @@
+'''
+Offline index of the packages available in the cached repository metadata
+'''
+
+import bz2
+import glob
+import gzip
+import lzma
+import mmap
+import os
+import re
+import sys
+import tarfile
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from xml.etree import ElementTree
+
+# a stanza of an apt `Packages` file, up to the blank line ending it
+_APT_STANZA = re.compile(rb'^Package: .*?(?=\n\n|\n?\Z)', re.MULTILINE | re.DOTALL)
+_APT_FIELD = re.compile(rb'^([\w-]+): ?(.*(?:\n[ \t].*)*)', re.MULTILINE)
+# the name of a dependency, without its version constraint or architecture
+_DEP_NAME = re.compile(r'^\s*([^\s(:<>=]+)')
+
+_RPM_COMMON = '{http://linux.duke.edu/metadata/common}'
+_RPM_FORMAT = '{http://linux.duke.edu/metadata/rpm}'
+
+_OPENERS = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+    '.bz2': bz2.open,
+}
+
+
+@dataclass(slots=True, frozen=True)
+class RepoPackage:
+    '''
+    A package available in the repositories
+    '''
+
+    name: str
+    version: str
+    size: int
+    depends: tuple[str, ...] = ()
+    provides: tuple[str, ...] = ()
+
+
+def _dep_names(deps: Iterable[str]) -> tuple[str, ...]:
+    '''
+    Return the package names of the dependencies, keeping the first of the
+    alternatives. The names repeat across packages, so they are interned.
+    '''
+
+    names = []
+    for dep in deps:
+        match = _DEP_NAME.match(dep.split('|', 1)[0])
+        if match is not None:
+            names.append(sys.intern(match.group(1)))
+    return tuple(names)
+
+
+class RepoIndex:
+    '''
+    Name to `RepoPackage` index of the repositories, built from the metadata
+    the package manager keeps on the host, without any network access.
+    Multiple versions of a package keep the first one read.
+    '''
+
+    def __init__(self, packages: Iterable[RepoPackage] = ()):
+        self._packages: dict[str, RepoPackage] = {}
+        self._providers: dict[str, str] = {}
+        for package in packages:
+            self.add(package)
+
+    def add(self, package: RepoPackage):
+        '''
+        Add a package to the index
+        '''
+
+        if package.name in self._packages:
+            return
+        self._packages[package.name] = package
+        for provided in package.provides:
+            self._providers.setdefault(provided, package.name)
+
+    def __len__(self) -> int:
+        return len(self._packages)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._packages or name in self._providers
+
+    def get(self, name: str) -> RepoPackage | None:
+        '''
+        Return the package `name`, or the package providing it
+        '''
+
+        package = self._packages.get(name)
+        if package is None and name in self._providers:
+            package = self._packages[self._providers[name]]
+        return package
+
+    def missing(self, names: list[str]) -> list[str]:
+        '''
+        Return the names, in order, which no package provides
+        '''
+        return [name for name in names if name not in self]
+
+    def closure(self, names: list[str], installed: Iterable[str] = frozenset()) -> list[str]:
+        '''
+        Return the packages needed to install `names`, their dependencies
+        included, leaving out the `installed` packages and the names missing
+        from the index
+        '''
+
+        installed = frozenset(installed)
+        needed: dict[str, None] = {}
+        queue = deque(names)
+        while queue:
+            package = self.get(queue.popleft())
+            if package is None or package.name in needed or package.name in installed:
+                continue
+            needed[package.name] = None
+            queue.extend(package.depends)
+
+        return list(needed)
+
+    def download_size(self, names: list[str], installed: Iterable[str] = frozenset()) -> int:
+        '''
+        Return the bytes to download to install `names` and their dependencies
+        '''
+        return sum(self._packages[name].size for name in self.closure(names, installed))
+
+    @classmethod
+    def from_apt(cls, lists_dir: str = '/var/lib/apt/lists') -> 'RepoIndex | None':
+        '''
+        Index the `Packages` files of the apt lists, `None` when none of them
+        could be read
+        '''
+        return cls._from_files(sorted(glob.glob(os.path.join(lists_dir, '*_Packages*'))),
+                               _read_apt_packages)
+
+    @classmethod
+    def from_pacman(cls, sync_dir: str = '/var/lib/pacman/sync') -> 'RepoIndex | None':
+        '''
+        Index the sync databases of pacman, `None` when none of them could be
+        read
+        '''
+        return cls._from_files(sorted(glob.glob(os.path.join(sync_dir, '*.db'))),
+                               _read_pacman_db)
+
+    @classmethod
+    def from_repomd(cls, patterns: list[str] = None) -> 'RepoIndex | None':
+        '''
+        Index the primary metadata of the rpm repositories, `None` when none
+        of it could be read
+        '''
+        if patterns is None:
+            patterns = ['/var/cache/dnf/*/repodata/*primary.xml*',
+                        '/var/cache/libdnf5/*/repodata/*primary.xml*',
+                        '/var/cache/yum/*/*/*/*primary.xml*']
+        return cls._from_files([path for pattern in patterns for path in sorted(glob.glob(pattern))],
+                               _read_repomd_primary)
+
+    @classmethod
+    def _from_files(cls, paths: list[str],
+                    reader: Callable[[str], Iterator[RepoPackage] | None]) -> 'RepoIndex | None':
+        '''
+        Index the metadata files read by `reader`, skipping the files it cannot
+        read. An index of no metadata at all would report every package as
+        missing, so `None` is returned instead.
+        '''
+
+        index = cls()
+        parsed = 0
+        for path in paths:
+            try:
+                packages = reader(path)
+                if packages is None:
+                    continue
+                for package in packages:
+                    index.add(package)
+            except (OSError, EOFError, lzma.LZMAError, tarfile.TarError, ElementTree.ParseError):
+                continue
+            parsed += 1
+
+        return index if parsed else None
+
+
+def _opener(path: str, name: str):
+    '''
+    Return the function opening the metadata file `path`, named `name` once
+    decompressed, `None` for compressions the standard library cannot read,
+    like lz4 and zstd
+    '''
+
+    if path.endswith(name):
+        return open
+    for suffix, opener in _OPENERS.items():
+        if path.endswith(name + suffix):
+            return opener
+    return None
+
+
+def _read_apt_packages(path: str) -> Iterator[RepoPackage] | None:
+    '''
+    Parse an apt `Packages` file, memory-mapped when it is not compressed,
+    `None` when its compression cannot be read
+    '''
+
+    opener = _opener(path, 'Packages')
+    if opener is None:
+        return None
+    return _iter_apt_packages(path, opener)
+
+
+def _iter_apt_packages(path: str, opener) -> Iterator[RepoPackage]:
+    if opener is not open:
+        with opener(path, 'rb') as packages:
+            yield from _parse_apt_stanzas(packages.read())
+        return
+
+    with open(path, 'rb') as packages:
+        if os.fstat(packages.fileno()).st_size == 0:
+            return
+        with mmap.mmap(packages.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            yield from _parse_apt_stanzas(content)
+
+
+def _parse_apt_stanzas(content: bytes) -> Iterator[RepoPackage]:
+    for stanza in _APT_STANZA.finditer(content):
+        fields = {key.decode(): value.decode(errors='replace')
+                  for key, value in _APT_FIELD.findall(stanza.group(0))}
+        depends = ','.join(filter(None, [fields.get('Pre-Depends'), fields.get('Depends')]))
+        yield RepoPackage(
+            name=fields['Package'],
+            version=fields.get('Version', ''),
+            size=int(fields.get('Size', 0)),
+            depends=_dep_names(depends.split(',')) if depends else (),
+            provides=_dep_names(fields['Provides'].split(',')) if 'Provides' in fields else (),
+        )
+
+
+def _read_pacman_db(path: str) -> Iterator[RepoPackage] | None:
+    '''
+    Parse a pacman sync database, a tarball of a `desc` file per package,
+    streamed without extracting it, `None` when its compression cannot be read
+    '''
+
+    try:
+        database = tarfile.open(path, mode='r|*')
+    except tarfile.ReadError:
+        # zstd compressed databases cannot be read with the standard library
+        return None
+    return _iter_pacman_db(database)
+
+
+def _iter_pacman_db(database: tarfile.TarFile) -> Iterator[RepoPackage]:
+    with database:
+        for member in database:
+            if not member.isfile() or os.path.basename(member.name) != 'desc':
+                continue
+            desc = database.extractfile(member).read().decode(errors='replace')
+            yield _parse_pacman_desc(desc)
+
+
+def _parse_pacman_desc(desc: str) -> RepoPackage:
+    fields: dict[str, list[str]] = {}
+    for section in desc.split('\n\n'):
+        lines = section.strip().splitlines()
+        if lines and lines[0].startswith('%'):
+            fields[lines[0].strip('%')] = lines[1:]
+
+    return RepoPackage(
+        name=fields['NAME'][0],
+        version=fields.get('VERSION', [''])[0],
+        size=int(fields.get('CSIZE', ['0'])[0]),
+        depends=_dep_names(fields.get('DEPENDS', [])),
+        provides=_dep_names(fields.get('PROVIDES', [])),
+    )
+
+
+def _read_repomd_primary(path: str) -> Iterator[RepoPackage] | None:
+    '''
+    Parse the primary metadata of an rpm repository with a streaming parser,
+    dropping every package element once read, `None` when its compression
+    cannot be read
+    '''
+
+    opener = _opener(path, 'primary.xml')
+    if opener is None:
+        return None
+    return _iter_repomd_primary(path, opener)
+
+
+def _iter_repomd_primary(path: str, opener) -> Iterator[RepoPackage]:
+    with opener(path, 'rb') as primary:
+        for _, elem in ElementTree.iterparse(primary, events=('end',)):
+            if elem.tag != f"{_RPM_COMMON}package":
+                continue
+            yield _parse_rpm_package(elem)
+            elem.clear()
+
+
+def _parse_rpm_package(elem: ElementTree.Element) -> RepoPackage:
+    version = elem.find(f"{_RPM_COMMON}version")
+    size = elem.find(f"{_RPM_COMMON}size")
+    entries = {}
+    for kind in ('requires', 'provides'):
+        entries[kind] = [entry.get('name')
+                         for entry in elem.iterfind(f"{_RPM_COMMON}format/{_RPM_FORMAT}{kind}/"
+                                                    f"{_RPM_FORMAT}entry")]
+
+    return RepoPackage(
+        name=elem.findtext(f"{_RPM_COMMON}name"),
+        version='' if version is None else f"{version.get('ver')}-{version.get('rel')}",
+        size=0 if size is None else int(size.get('package', 0)),
+        depends=tuple(sys.intern(name) for name in entries['requires']),
+        provides=tuple(sys.intern(name) for name in entries['provides']),
+    )
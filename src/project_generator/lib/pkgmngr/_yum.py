@@ -2,13 +2,58 @@
     Package manager implementation for YUM for debian based distros
 '''
 
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
 from dataclasses import dataclass
+from pathlib import Path
 
 from typing_extensions import Self
 
+from project_generator.lib.utils.cache import default_cache_dir
 from project_generator.lib.utils.command import Command, CommandBuilder
 
+from ._footprint import InstallSize
+from ._freshness import RepoFreshness
+from ._installed import InstalledIndex, RpmIndex, shared_index
+from ._pkgcache import PackageCache
 from ._pkgmngrif import PackageManager
+from ._reconcile import ReconcilePlan
+from ._repoindex import RepoIndex
+
+
+@functools.cache
+def _is_dnf5(program: str) -> bool:
+    '''
+    Whether `program` is dnf5, which `yum` links to on Fedora 41 and later
+    '''
+
+    path = shutil.which(program)
+    return path is not None and os.path.basename(os.path.realpath(path)).startswith('dnf5')
+
+
+def _write_shell_script(commands: list[str]) -> Path:
+    '''
+    Write a script of `yum shell` commands, ending with the `run` of the
+    transaction they queue, and return its path
+    '''
+
+    content = '\n'.join([*commands, 'run', ''])
+    digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+    path = default_cache_dir('pkgmngr', f"yum-shell-{digest}.txt")
+    if path.exists():
+        return path
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as script:
+        script.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+    return path
 
 
 @dataclass(slots=True, init=True)
@@ -20,6 +65,11 @@ class YumPackageManager(PackageManager):
     def __init__(self, *args, **kw_args):
         PackageManager.__init__(self, *args, **kw_args)
         self.cmd_name = 'yum'
+        self.freshness = RepoFreshness('yum', [
+            '/var/cache/dnf/*/repodata/repomd.xml',
+            '/var/cache/libdnf5/*/repodata/repomd.xml',
+            '/var/cache/yum/*/*/*/repomd.xml',
+        ])
 
     def _partial_cmd(self) -> CommandBuilder:
         cmd = CommandBuilder()
@@ -28,18 +78,120 @@ class YumPackageManager(PackageManager):
             cmd.option("-y")
         cmd.capture_logs(buffered=not self.confirmation)
 
-        return cmd
+        self._apply_minimal(cmd)
+        self._apply_downloads(cmd)
+        self._apply_package_cache(cmd)
+        self._apply_ephemeral(cmd)
+        self._apply_lock_wait(cmd)
+
+        return self._attach_session(cmd)
+
+    def _minimal_options(self) -> list[str]:
+        return ['--setopt=install_weak_deps=False', '--setopt=tsflags=nodocs']
+
+    def _parallel_download_options(self) -> list[str]:
+        # dnf caps the concurrency at 20
+        return [f"--setopt=max_parallel_downloads={min(self.downloads, 20)}"]
+
+    def use_package_cache(self, cache: PackageCache = None) -> Self:
+        PackageManager.use_package_cache(self, cache)
+        if cache is not None:
+            # dnf keeps the repository metadata next to the archives
+            self.freshness.patterns.append(
+                os.path.join(cache.directory('dnf'), '*', 'repodata', 'repomd.xml'))
+        return self
+
+    def _package_cache_options(self) -> list[str]:
+        return [f"--setopt=cachedir={self.package_cache.directory('dnf')}",
+                '--setopt=keepcache=True']
+
+    def _download_only_cmd(self, install_list: list[str]) -> Command:
+        return self._partial_cmd() \
+            .option('--downloadonly') \
+            .subcommand(Command(cmd_name="install")) \
+            .args(install_list) \
+            .build()
+
+    def _dry_run_cmd(self, install_list: list[str], minimal: bool) -> Command:
+        cmd = CommandBuilder() \
+            .program(self.cmd_name) \
+            .option('--assumeno') \
+            .subcommand(Command(cmd_name="install")) \
+            .args(install_list) \
+            .env_vars({'LC_ALL': 'C'}) \
+            .capture_output()
+        if minimal:
+            cmd.options(self._minimal_options())
+        return cmd.build()
+
+    def _parse_footprint(self, output: str) -> InstallSize:
+        return InstallSize.from_dnf(output)
+
+    def _outdated_cmd(self) -> Command:
+        return CommandBuilder() \
+            .program(self.cmd_name) \
+            .options(['--quiet', '--cacheonly']) \
+            .subcommand(Command(cmd_name="check-update")) \
+            .env_vars({'LC_ALL': 'C'}) \
+            .capture_output() \
+            .build()
+
+    def _parse_outdated(self, output: str) -> set[str]:
+        # `<name>.<arch> <version> <repository>` until the obsoletes, if any
+        outdated = set()
+        for line in output.splitlines():
+            if line.startswith('Obsoleting'):
+                break
+            fields = line.split()
+            if len(fields) == 3 and '.' in fields[0]:
+                outdated.add(fields[0].rsplit('.', 1)[0])
+        return outdated
+
+    def _reconcile_cmds(self, plan: ReconcilePlan):
+        if _is_dnf5(self.cmd_name):
+            # dnf5 has no shell, the plan runs as a transaction per action
+            PackageManager._reconcile_cmds(self, plan)
+            return
+
+        if (plan.install or plan.upgrade) and not self.synced:
+            self.sync(True)
+
+        # a single transaction, queued through the shell as the command line
+        # cannot mix installs and removals
+        commands = []
+        for action, packages in [('install', plan.install), ('upgrade', plan.upgrade),
+                                 ('remove', plan.remove)]:
+            if packages:
+                commands.append(' '.join([action, *packages]))
+
+        cmd = self._partial_cmd()
+        cmd.subcommand(Command(cmd_name="shell"))
+        cmd.arg(str(_write_shell_script(commands)))
+        self.command_list.append(cmd.build())
+
+    def repo_index(self) -> RepoIndex | None:
+        return RepoIndex.from_repomd()
+
+    def _installed_index(self) -> InstalledIndex:
+        return shared_index(RpmIndex)
 
     def sync(self, sync_repo: bool = False) -> Self:
         if sync_repo:
+            self.synced = True
+            if self._repo_is_fresh():
+                return self
+
             cmd_sync = self._partial_cmd()
             cmd_sync.subcommand(Command(cmd_name="makecache"))
-            self.synced = True
-            self.command_list.append(cmd_sync.build())
+            self._queue_sync(cmd_sync.build())
 
         return self
 
     def install(self, install_list: list[str]) -> Self:
+        install_list = self._drop_installed(install_list)
+        if not install_list and self.installed is not None:
+            return self
+
         if not self.synced:
             self.sync(True)
 
@@ -74,14 +226,3 @@ class YumPackageManager(PackageManager):
             self.command_list.append(cmd_update.build())
 
         return self
-
-    def commit(self):
-        '''
-        Run the built command
-        '''
-        for cmd in self.command_list:
-            ret = cmd.run()
-            if ret != 0:
-                return ret
-
-        return 0
@@ -9,7 +9,8 @@ from enum import Enum
 from typing_extensions import Self
 
 from project_generator.lib.devenvcfg import devcontainer
-from project_generator.lib.toolchain import Toolchain
+from project_generator.lib.distromngr import Distribution
+from project_generator.lib.toolchain import Toolchain, resolve_packages
 
 
 class ProjectTemplate(Enum):
@@ -52,6 +53,14 @@ class ProjectConfig:
         '''
         return self.required_toolchains
 
+    def packages(self, distribution: Distribution, extra_tools: bool = False) -> list[str]:
+        '''
+        Get the distribution packages of the required toolchains, along with
+        their extra tools if `extra_tools`
+        '''
+        toolchains = self.required_toolchains or []
+        return resolve_packages(distribution, toolchains, toolchains if extra_tools else ())
+
     def devcontainer_config(self) -> devcontainer.DevContainer:
         '''
         Get the devcontainer configuration
@@ -1 +1,3 @@
 from ._toolchain import Toolchain
+from ._resolver import resolve_packages, resolve_toolchains, unknown_packages
+from ._registry import load_registry, registry_overlays
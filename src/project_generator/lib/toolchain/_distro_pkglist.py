@@ -1,192 +1,28 @@
 '''
 Module containing definition of package names mapped to specific distribution
-for any given toolchain
+for any given toolchain. The definitions live in the package registry files,
+loaded on first access of the attributes below.
 '''
 
-_toolchain_packages = {
-    'rhel': {
-        'c': [
-            '@C Development Tools and Libraries',
-            'clang',
-            'lldb',
-            'lld',
-        ],
-        'cpp': [
-            'llvm',
-        ],
-        'gtk': [
-            'gtk4-devel',
-            'graphene-devel',
-            'appstream',
-            'appstream-data',
-            'appstream-compose',
-            'libappstream-glib',
-            'desktop-file-utils',
-        ],
-        'base': [
-            'ncurses',
-            'nss',
-            'unzip',
-            'tree',
-            'tar',
-            'bzip2',
-            'zstd',
-            'git',
-            'curl',
-            'wget',
-            'vim',
-            'python3-pip',
-        ],
-        'rust': [],
-        'go': [],
-        'python': [
-            'python3-pip',
-            'python3-devel',
-        ],
-    },
-    'debian': {
-        'c': [
-            'clang',
-            'lldb',
-            'lld',
-            'build-essential',
-        ],
-        'cpp': [
-            'llvm',
-        ],
-        'gtk': [
-            'libgtk-4-dev',
-            'libgraphene-1.0-dev',
-            'appstream',
-            'appstream-compose',
-            'libappstream-glib-dev',
-            'desktop-file-utils',
-        ],
-        'base': [
-            'libncurses6',
-            'libnss3',
-            'unzip',
-            'tree',
-            'tar',
-            'bzip2',
-            'zstd',
-            'git',
-            'curl',
-            'wget',
-            'vim',
-            'python3-pip',
-        ],
-        'rust': [],
-        'go': [],
-        'python': [
-            'python3-pip',
-            'python3-dev',
-        ],
-    },
-    'arch': {
-        'c': [
-            'base-devel',
-            'clang',
-            'lldb',
-            'lld',
-        ],
-        'cpp': [
-            'llvm',
-        ],
-        'gtk': [
-            'gtk4',
-            'graphene',
-            'appstream',
-            'appstream-generator',
-            'desktop-file-utils',
-        ],
-        'base': [
-            'ncurses',
-            'nss',
-            'unzip',
-            'tree',
-            'tar',
-            'bzip2',
-            'zstd',
-            'git',
-            'curl',
-            'wget',
-            'vim',
-            'python-pip',
-        ],
-        'rust': [],
-        'go': [],
-        'python': [
-            'python-pip',
-        ],
-    },
-    'suse': {
-        'c': [],
-        'cpp': [],
-        'gtk': [],
-        'base': [],
-        'rust': [],
-        'go': [],
-        'python': [],
-    }
-}
+import functools
+
+from ._registry import load_registry
 
-_extra_tools_packages = {
-    'rhel': {
-        'c': [
-            'clang-tools-extra',
-            'cmake',
-            'make',
-            'pkgconf'
-        ],
-        'cpp': [],
-        'gtk': [
-            'd-feet'
-        ],
-        'base': [],
-        'rust': [],
-        'go': [],
-        'python': [],
-    },
-    'debian': {
-        'c': [
-            'clangd',
-            'cmake',
-            'make',
-            'pkgconf'
-        ],
-        'cpp': [],
-        'gtk': [
-            'd-feet'
-        ],
-        'base': [],
-        'rust': [],
-        'go': [],
-        'python': [],
-    },
-    'arch': {
-        'c': [
-            'clang-tools-extra',
-            'cmake',
-            'make',
-            'pkgconf'
-        ],
-        'cpp': [],
-        'gtk': [
-            'd-feet',
-        ],
-        'base': [],
-        'rust': [],
-        'go': [],
-        'python': [],
-    },
-    'suse': {
-        'c': [],
-        'cpp': [],
-        'gtk': [],
-        'base': [],
-        'rust': [],
-        'go': [],
-        'python': [],
-    },
+_SECTIONS = {
+    # toolchains whose packages a toolchain builds upon, followed transitively
+    '_toolchain_dependencies': 'dependencies',
+    '_toolchain_packages': 'packages',
+    '_extra_tools_packages': 'extra_packages',
 }
+
+
+@functools.cache
+def _registry() -> dict:
+    return load_registry()
+
+
+def __getattr__(name: str):
+    section = _SECTIONS.get(name)
+    if section is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _registry()[section]
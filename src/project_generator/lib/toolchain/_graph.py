@@ -0,0 +1,70 @@
+'''
+Resolution of the toolchain dependency graph to package lists
+'''
+
+import functools
+
+from project_generator.lib.distromngr import Distribution
+
+from . import _distro_pkglist
+
+
+def _family(distribution: Distribution) -> str:
+    '''
+    Return the registry key of the distribution
+    '''
+
+    if distribution.family not in _distro_pkglist._toolchain_packages:
+        raise ValueError(f"Distribution {distribution.value} is not supported")
+    return distribution.family
+
+
+@functools.cache
+def _dependencies(toolchain: str) -> tuple[str, ...]:
+    '''
+    Return the toolchains `toolchain` builds upon, transitively, each one
+    after its own dependencies
+    '''
+
+    order: dict[str, None] = {}
+    for dependency in _distro_pkglist._toolchain_dependencies.get(toolchain, []):
+        order.update(dict.fromkeys(_dependencies(dependency)))
+        order[dependency] = None
+    return tuple(order)
+
+
+@functools.cache
+def _resolve(family: str, toolchains: tuple[str, ...], extra: bool = False) -> tuple[str, ...]:
+    '''
+    Return the packages, or the extra tools packages if `extra`, of the
+    `toolchains` on the distribution `family`. Every toolchain contributes
+    its own packages, the base packages and the packages of its dependencies,
+    in this order, and every package keeps its first position.
+    '''
+
+    registry = (_distro_pkglist._extra_tools_packages if extra
+                else _distro_pkglist._toolchain_packages)[family]
+
+    packages: dict[str, None] = {}
+    for toolchain in toolchains:
+        own = registry.get(toolchain, None)
+        if own is None:
+            raise ValueError(f"Invalid toolchain {toolchain}")
+
+        packages.update(dict.fromkeys(own))
+        packages.update(dict.fromkeys(registry.get('base')))
+        for dependency in _dependencies(toolchain):
+            packages.update(dict.fromkeys(registry.get(dependency)))
+
+    return tuple(packages)
+
+
+@functools.cache
+def _resolve_all(family: str, toolchains: tuple[str, ...],
+                 extra_tools: tuple[str, ...]) -> tuple[str, ...]:
+    '''
+    Return the packages of the `toolchains` followed by the extra tools
+    packages of the `extra_tools` toolchains, without duplicates
+    '''
+    return tuple(dict.fromkeys(_resolve(family, toolchains)
+                               + _resolve(family, extra_tools, extra=True)))
@@ -0,0 +1,169 @@
+'''
+Loading of the package registry from its data files
+'''
+
+import functools
+import hashlib
+import json
+import marshal
+import os
+import tempfile
+from pathlib import Path
+
+from project_generator.lib.utils.cache import default_cache_dir
+
+# bumped whenever the layout of the compiled registry changes
+_FORMAT = 1
+
+_BUILTIN_REGISTRY = Path(os.path.dirname(__file__), 'packages.json')
+
+_SECTIONS = ('dependencies', 'packages', 'extra_packages')
+
+
+def registry_overlays() -> tuple[Path, ...]:
+    '''
+    Return the registry files overlaid on the builtin one, in order: the
+    system-wide and the user files when they exist, followed by the files
+    listed in `PROJGEN_PACKAGE_REGISTRY`
+    '''
+
+    config_home = os.getenv('XDG_CONFIG_HOME')
+    if not config_home:
+        config_home = os.path.join(os.path.expanduser('~'), '.config')
+
+    overlays = [path for path in [Path('/etc/project_generator/packages.json'),
+                                  Path(config_home, 'project_generator', 'packages.json')]
+                if path.is_file()]
+    overlays.extend(Path(path) for path in
+                    os.getenv('PROJGEN_PACKAGE_REGISTRY', '').split(os.pathsep) if path)
+    return tuple(overlays)
+
+
+def _merge(registry: dict, overlay: dict, source: Path):
+    '''
+    Merge the `overlay` into the `registry`, the package lists and the
+    dependencies of the overlay replacing the ones of the registry
+    '''
+
+    if not isinstance(overlay, dict) or not set(overlay) <= set(_SECTIONS):
+        raise ValueError(f"Invalid package registry {source}: "
+                         f"expected an object with the keys {', '.join(_SECTIONS)}")
+
+    for section, entries in overlay.items():
+        if not isinstance(entries, dict):
+            raise ValueError(f"Invalid package registry {source}: '{section}' is not an object")
+        if section == 'dependencies':
+            registry[section].update(entries)
+            continue
+        for family, lists in entries.items():
+            if not isinstance(lists, dict):
+                raise ValueError(
+                    f"Invalid package registry {source}: '{section}.{family}' is not an object")
+            registry[section].setdefault(family, {}).update(lists)
+
+
+def _validate(registry: dict):
+    '''
+    Check that the package lists are lists of names, defined for every
+    toolchain, and that the toolchain dependencies form no cycle
+    '''
+
+    def _names(value, where: str):
+        if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+            raise ValueError(f"Invalid package registry: '{where}' is not a list of names")
+
+    dependencies = registry['dependencies']
+    for toolchain, needed in dependencies.items():
+        _names(needed, f"dependencies.{toolchain}")
+        unknown = [dependency for dependency in needed if dependency not in dependencies]
+        if unknown:
+            raise ValueError(f"Invalid package registry: toolchain '{toolchain}' depends on "
+                             f"unknown toolchains {', '.join(unknown)}")
+
+    for section in ('packages', 'extra_packages'):
+        for family, lists in registry[section].items():
+            for toolchain in ['base', *dependencies]:
+                if toolchain not in lists:
+                    raise ValueError(f"Invalid package registry: '{section}.{family}' has "
+                                     f"no package list for '{toolchain}'")
+                _names(lists[toolchain], f"{section}.{family}.{toolchain}")
+
+    visiting, done = set(), set()
+
+    def _visit(toolchain: str):
+        if toolchain in done:
+            return
+        if toolchain in visiting:
+            raise ValueError(f"Invalid package registry: dependency cycle through '{toolchain}'")
+        visiting.add(toolchain)
+        for dependency in dependencies[toolchain]:
+            _visit(dependency)
+        done.add(toolchain)
+
+    for toolchain in dependencies:
+        _visit(toolchain)
+
+
+def _compile(sources: list[tuple[Path, bytes]]) -> dict:
+    '''
+    Parse, merge and validate the registry files
+    '''
+
+    registry = {section: {} for section in _SECTIONS}
+    for path, content in sources:
+        try:
+            overlay = json.loads(content)
+        except ValueError as err:
+            raise ValueError(f"Invalid package registry {path}: {err}") from err
+        _merge(registry, overlay, path)
+
+    _validate(registry)
+    return registry
+
+
+@functools.cache
+def _load(paths: tuple[Path, ...]) -> dict:
+    sources = []
+    digest = hashlib.sha256(f"{_FORMAT}:{marshal.version}".encode())
+    for path in paths:
+        content = path.read_bytes()
+        sources.append((path, content))
+        digest.update(f"\0{path}\0{len(content)}\0".encode())
+        digest.update(content)
+
+    compiled = default_cache_dir('toolchain', f"registry-{digest.hexdigest()[:16]}.bin")
+    try:
+        registry = marshal.loads(compiled.read_bytes())
+        if isinstance(registry, dict) and set(registry) == set(_SECTIONS):
+            return registry
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    registry = _compile(sources)
+
+    try:
+        os.makedirs(compiled.parent, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=compiled.parent, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as out:
+            out.write(marshal.dumps(registry))
+        os.replace(tmp_path, compiled)
+    except OSError:
+        # without a writable cache every run parses the registry again
+        pass
+
+    return registry
+
+
+def load_registry(overlays: tuple[Path, ...] = None) -> dict:
+    '''
+    Return the package registry: the builtin registry file with the
+    `overlays`, defaulting to `registry_overlays()`, merged over it.
+
+    The merged registry is validated once, then compiled into the cache
+    directory keyed by the hash of the registry files, so that later runs
+    load the compiled registry instead of parsing the files again.
+    '''
+
+    if overlays is None:
+        overlays = registry_overlays()
+    return _load((_BUILTIN_REGISTRY, *overlays))
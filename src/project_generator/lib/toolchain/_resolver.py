@@ -0,0 +1,56 @@
+'''
+Resolution of the distribution packages needed by a set of toolchains
+'''
+
+from collections.abc import Container, Iterable
+
+from project_generator.lib.distromngr import Distribution
+
+from ._graph import _family, _resolve_all
+from ._toolchain import Toolchain
+
+
+def resolve_toolchains(distribution: Distribution, toolchains: Iterable[Toolchain],
+                       extra_tools: Iterable[Toolchain] = ()) -> tuple[str, ...]:
+    '''
+    Return the packages of all the `toolchains`, followed by the extra tools
+    packages of the `extra_tools` toolchains, as a single tuple without
+    duplicates. Every package keeps the position of its first occurrence, so
+    the result can be fed to one package manager transaction. The result is
+    cached per distribution family and toolchains.
+    '''
+
+    return _resolve_all(_family(distribution),
+                        tuple(toolchain.value for toolchain in dict.fromkeys(toolchains)),
+                        tuple(toolchain.value for toolchain in dict.fromkeys(extra_tools)))
+
+
+def resolve_packages(distribution: Distribution, toolchains: Iterable[Toolchain],
+                     extra_tools: Iterable[Toolchain] = ()) -> list[str]:
+    '''
+    Return the packages of `resolve_toolchains` as a list
+    '''
+    return list(resolve_toolchains(distribution, toolchains, extra_tools))
+
+
+def unknown_packages(distribution: Distribution, toolchains: Iterable[Toolchain],
+                     available: Container[str] | None) -> dict[Toolchain, list[str]]:
+    '''
+    Return the packages, and extra tools packages, of the `toolchains` which
+    are not `available`, like the names in an offline index of the
+    repositories, keyed by toolchain. Package groups are not checked, and
+    nothing is reported when `available` is `None`, as for a package manager
+    without any readable repository metadata.
+    '''
+
+    unknown = {}
+    if available is None:
+        return unknown
+    for toolchain in dict.fromkeys(toolchains):
+        names = toolchain.packages_for(distribution) + toolchain.extra_packages_for(distribution)
+        missing = [name for name in dict.fromkeys(names)
+                   if not name.startswith('@') and name not in available]
+        if missing:
+            unknown[toolchain] = missing
+
+    return unknown
@@ -2,13 +2,40 @@
 Test module for Toolchain
 '''
 
+import json
+import marshal
+import os
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
 from project_generator.lib.distromngr import Distribution
 
-from ._distro_pkglist import _extra_tools_packages, _toolchain_packages
+from . import _distro_pkglist
+from ._graph import _dependencies
+from ._registry import _load, load_registry
+from ._resolver import resolve_packages, resolve_toolchains, unknown_packages
 from ._toolchain import Toolchain
 
+_cache_dir: tempfile.TemporaryDirectory = None
+_environ: mock._patch_dict = None
+
+
+def setUpModule():
+    # the registry is compiled into the cache on its first load
+    global _cache_dir, _environ
+    _cache_dir = tempfile.TemporaryDirectory()
+    _environ = mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': _cache_dir.name})
+    _environ.start()
+    _load.cache_clear()
+
+
+def tearDownModule():
+    _load.cache_clear()
+    _environ.stop()
+    _cache_dir.cleanup()
+
 
 class TestToolchain(unittest.TestCase):
     '''
@@ -23,9 +50,9 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.packages_for(Distribution.RHEL)
         self.assertEqual(pkg_list, [
-            *_toolchain_packages['rhel']['cpp'],
-            *_toolchain_packages['rhel']['base'],
-            *_toolchain_packages['rhel']['c'],
+            *_distro_pkglist._toolchain_packages['rhel']['cpp'],
+            *_distro_pkglist._toolchain_packages['rhel']['base'],
+            *_distro_pkglist._toolchain_packages['rhel']['c'],
         ])
 
     def test_arch_gcc(self):
@@ -36,9 +63,9 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.packages_for(Distribution.ARCH)
         self.assertEqual(pkg_list, [
-            *_toolchain_packages['arch']['cpp'],
-            *_toolchain_packages['arch']['base'],
-            *_toolchain_packages['arch']['c'],
+            *_distro_pkglist._toolchain_packages['arch']['cpp'],
+            *_distro_pkglist._toolchain_packages['arch']['base'],
+            *_distro_pkglist._toolchain_packages['arch']['c'],
         ])
 
     def test_debian_gcc(self):
@@ -49,9 +76,9 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.packages_for(Distribution.DEBIAN)
         self.assertEqual(pkg_list, [
-            *_toolchain_packages['debian']['cpp'],
-            *_toolchain_packages['debian']['base'],
-            *_toolchain_packages['debian']['c'],
+            *_distro_pkglist._toolchain_packages['debian']['cpp'],
+            *_distro_pkglist._toolchain_packages['debian']['base'],
+            *_distro_pkglist._toolchain_packages['debian']['c'],
         ])
 
     def test_extrapkg_rhel_gcc(self):
@@ -62,8 +89,8 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.extra_packages_for(Distribution.RHEL)
         self.assertEqual(pkg_list, [
-            *_extra_tools_packages['rhel']['cpp'],
-            *_extra_tools_packages['rhel']['c'],
+            *_distro_pkglist._extra_tools_packages['rhel']['cpp'],
+            *_distro_pkglist._extra_tools_packages['rhel']['c'],
         ])
 
     def test_extrapkg_arch_gcc(self):
@@ -74,8 +101,8 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.extra_packages_for(Distribution.ARCH)
         self.assertEqual(pkg_list, [
-            *_extra_tools_packages['arch']['cpp'],
-            * _extra_tools_packages['arch']['c'],
+            *_distro_pkglist._extra_tools_packages['arch']['cpp'],
+            *_distro_pkglist._extra_tools_packages['arch']['c'],
         ])
 
     def test_extrapkg_debian_gcc(self):
@@ -86,10 +113,185 @@ class TestToolchain(unittest.TestCase):
         toolchain = Toolchain.CPP
         pkg_list = toolchain.extra_packages_for(Distribution.DEBIAN)
         self.assertEqual(pkg_list, [
-            *_extra_tools_packages['debian']['cpp'],
-            *_extra_tools_packages['debian']['c'],
+            *_distro_pkglist._extra_tools_packages['debian']['cpp'],
+            *_distro_pkglist._extra_tools_packages['debian']['c'],
         ])
 
 
+class TestPackageRegistry(unittest.TestCase):
+    '''
+    Test suite for loading the package registry files
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._environ = mock.patch.dict(
+            os.environ, {'PROJGEN_CACHE_DIR': os.path.join(self._tmpdir.name, 'cache')})
+        self._environ.start()
+
+    def tearDown(self):
+        self._environ.stop()
+        _load.cache_clear()
+        self._tmpdir.cleanup()
+
+    def _overlay(self, content) -> Path:
+        path = Path(self._tmpdir.name, 'packages.json')
+        path.write_text(json.dumps(content), encoding='utf-8')
+        return path
+
+    def test_builtin(self):
+        '''
+        Test that the builtin registry backs the package lists
+        '''
+
+        registry = load_registry(())
+        self.assertEqual(registry['packages'], _distro_pkglist._toolchain_packages)
+        self.assertEqual(registry['extra_packages'], _distro_pkglist._extra_tools_packages)
+        self.assertEqual(registry['dependencies']['cpp'], ['c'])
+
+    def test_overlay(self):
+        '''
+        Test that the overlays replace the package lists they define
+        '''
+
+        overlay = self._overlay({'packages': {'debian': {'c': ['clang-16', 'lld-16']}}})
+        registry = load_registry((overlay,))
+        self.assertEqual(registry['packages']['debian']['c'], ['clang-16', 'lld-16'])
+        self.assertEqual(registry['packages']['debian']['cpp'],
+                         _distro_pkglist._toolchain_packages['debian']['cpp'])
+
+        for invalid in [{'packages': {'debian': {'c': 'clang'}}},
+                        {'dependencies': {'c': ['gtk']}},
+                        {'dependencies': {'c': ['vala']}},
+                        {'toolchains': {}}]:
+            _load.cache_clear()
+            with self.assertRaises(ValueError):
+                load_registry((self._overlay(invalid),))
+
+    def test_compiled(self):
+        '''
+        Test that the compiled registry is reused by later loads
+        '''
+
+        overlay = self._overlay({'packages': {'arch': {'go': ['go']}}})
+        registry = load_registry((overlay,))
+        compiled = list(Path(os.environ['PROJGEN_CACHE_DIR'], 'toolchain').glob('registry-*.bin'))
+        self.assertEqual(len(compiled), 1)
+
+        registry['packages']['arch']['go'] = ['go', 'gopls']
+        compiled[0].write_bytes(marshal.dumps(registry))
+        _load.cache_clear()
+        self.assertEqual(load_registry((overlay,))['packages']['arch']['go'], ['go', 'gopls'])
+
+        # a modified overlay is compiled again
+        overlay = self._overlay({'packages': {'arch': {'go': ['go', 'delve']}}})
+        _load.cache_clear()
+        self.assertEqual(load_registry((overlay,))['packages']['arch']['go'], ['go', 'delve'])
+
+
+class TestToolchainGraph(unittest.TestCase):
+    '''
+    Test suite for the toolchain dependency graph
+    '''
+
+    def test_dependencies(self):
+        '''
+        Test that the dependencies are followed transitively, in order
+        '''
+
+        self.assertEqual(_dependencies('c'), ())
+        self.assertEqual(_dependencies('cpp'), ('c',))
+        for toolchain in ['gtk', 'go', 'rust']:
+            self.assertEqual(_dependencies(toolchain), ('c', 'cpp'))
+
+    def test_packages(self):
+        '''
+        Test the package order of a toolchain with transitive dependencies
+        '''
+
+        self.assertEqual(Toolchain.GTK.packages_for(Distribution.DEBIAN), list(dict.fromkeys([
+            *_distro_pkglist._toolchain_packages['debian']['gtk'],
+            *_distro_pkglist._toolchain_packages['debian']['base'],
+            *_distro_pkglist._toolchain_packages['debian']['c'],
+            *_distro_pkglist._toolchain_packages['debian']['cpp'],
+        ])))
+
+        pkg_list = Toolchain.PYTHON.packages_for(Distribution.ARCH)
+        self.assertEqual(len(pkg_list), len(set(pkg_list)))
+
+    def test_cached(self):
+        '''
+        Test that the resolution is a cached lookup returning frozen tuples
+        '''
+
+        resolved = resolve_toolchains(Distribution.UBUNTU, [Toolchain.GO, Toolchain.C])
+        self.assertIsInstance(resolved, tuple)
+        self.assertIs(resolve_toolchains(Distribution.UBUNTU, (Toolchain.GO, Toolchain.C)),
+                      resolved)
+
+        # the lists handed out are copies
+        Toolchain.C.packages_for(Distribution.DEBIAN).append('vim-gtk3')
+        self.assertNotIn('vim-gtk3', Toolchain.C.packages_for(Distribution.DEBIAN))
+
+
+class TestResolvePackages(unittest.TestCase):
+    '''
+    Test suite for the package resolution of multiple toolchains
+    '''
+
+    def test_deduplicated(self):
+        '''
+        Test that the shared packages are only listed once, in order
+        '''
+
+        toolchains = [Toolchain.C, Toolchain.CPP, Toolchain.GTK, Toolchain.RUST]
+        for distro in [Distribution.DEBIAN, Distribution.RHEL, Distribution.ARCH]:
+            pkg_list = resolve_packages(distro, toolchains)
+
+            self.assertEqual(len(pkg_list), len(set(pkg_list)))
+            self.assertEqual(
+                set(pkg_list),
+                {pkg for toolchain in toolchains for pkg in toolchain.packages_for(distro)})
+            self.assertEqual(
+                pkg_list[:len(Toolchain.C.packages_for(distro))],
+                list(dict.fromkeys(Toolchain.C.packages_for(distro))))
+
+    def test_single_toolchain(self):
+        '''
+        Test that a single toolchain resolves to its own package list
+        '''
+
+        self.assertEqual(resolve_packages(Distribution.DEBIAN, [Toolchain.CPP]),
+                         Toolchain.CPP.packages_for(Distribution.DEBIAN))
+
+    def test_extra_tools(self):
+        '''
+        Test that the extra tools packages follow the toolchain packages
+        '''
+
+        pkg_list = resolve_packages(Distribution.ARCH, [Toolchain.C],
+                                    extra_tools=[Toolchain.C, Toolchain.CPP])
+        toolchain_pkgs = Toolchain.C.packages_for(Distribution.ARCH)
+
+        self.assertEqual(pkg_list[:len(toolchain_pkgs)], toolchain_pkgs)
+        self.assertEqual(set(pkg_list[len(toolchain_pkgs):]),
+                         set(Toolchain.CPP.extra_packages_for(Distribution.ARCH))
+                         - set(toolchain_pkgs))
+
+    def test_unknown_packages(self):
+        '''
+        Test validating the package names against the available packages
+        '''
+
+        available = set(resolve_packages(Distribution.RHEL, [Toolchain.CPP],
+                                         extra_tools=[Toolchain.CPP]))
+        self.assertEqual(unknown_packages(Distribution.RHEL, [Toolchain.CPP], available), {})
+
+        available.discard('llvm')
+        self.assertEqual(unknown_packages(Distribution.RHEL, [Toolchain.C, Toolchain.CPP], available),
+                         {Toolchain.CPP: ['llvm']})
+        self.assertEqual(unknown_packages(Distribution.RHEL, [Toolchain.CPP], None), {})
+
+
 if __name__ == '__main__':
     unittest.main()
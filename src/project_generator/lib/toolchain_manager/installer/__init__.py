@@ -1 +1,2 @@
-from ._installer import ToolchainInstallerBuilder, Installer
+from ._installer import ToolchainInstallerBuilder, Installer, InstallReport, ToolchainResult, ToolInstallError
+from ._toolcache import GoToolCache, CachedTool, GoTarget, DEFAULT_TOOL_CACHE_SIZE
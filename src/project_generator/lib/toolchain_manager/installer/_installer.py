@@ -2,21 +2,29 @@
 Module for installing the configured toolchains for the project
 '''
 
+import functools
 import os
 import shutil
 import subprocess
-import tarfile
-from copy import deepcopy
-from dataclasses import dataclass
+import tempfile
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from http.client import HTTPException
+from pathlib import Path
+from tarfile import TarError
+from urllib.error import URLError
 
 from typing_extensions import Self
 
 from project_generator.lib.distromngr import Distribution
-from project_generator.lib.toolchain import Toolchain
-from project_generator.lib.utils.command import CommandBuilder
+from project_generator.lib.toolchain import Toolchain, resolve_packages
+from project_generator.lib.utils.command import (CommandBuilder, CommandScheduler, NodeTiming,
+                                                 ScheduleReport)
 
-from ._util import (_download_go_toolchain, _download_rust_toolchain,
-                    _install_tools_packages)
+from ._toolcache import GoTarget, GoToolCache
+from ._util import (ChecksumError, _download_rust_toolchain, _extract_go_toolchain,
+                    _go_binary_name, _go_build_env, _go_env_values, _go_install_workers,
+                    _go_module_version, _go_resolve_version, _install_tools_packages, lgr)
 
 
 @dataclass(slots=True)
@@ -38,73 +46,96 @@ class Installer:
         '''
 
 
-@dataclass(slots=True)
-class _CToolchainInstaller(Installer):
-    '''
-    C Toolchain installer
-    '''
-
-    def install_toolchain(self, path: str = None) -> int:
-        '''
-        C toolchain installer
-        '''
-
-        pkg_list = Toolchain.C.packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
-
-    def install_additional_tools(self, path: str = None) -> int:
-        '''
-        C additional tools installer
-        '''
+_GO_TOOLS = [
+    'github.com/cweill/gotests/gotests@latest',
+    'github.com/fatih/gomodifytags@latest',
+    'github.com/josharian/impl@latest',
+    'github.com/haya14busa/goplay/cmd/goplay@latest',
+    'github.com/go-delve/delve/cmd/dlv@latest',
+    'honnef.co/go/tools/cmd/staticcheck@latest',
+    'golang.org/x/tools/gopls@latest',
+    'github.com/ramya-rao-a/go-outline@latest'
+]
 
-        pkg_list = Toolchain.C.extra_packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
 
-
-@dataclass(slots=True)
-class _CppToolchainInstaller(Installer):
+class ToolInstallError(subprocess.CalledProcessError):
     '''
-    C++ Toolchain installer
+    Failure to install some of the additional tools of a toolchain, with the
+    return code of every failed tool in `failures`
     '''
 
-    def install_toolchain(self, path: str = None) -> int:
-        '''
-        C++ toolchain installer
-        '''
-
-        pkg_list = Toolchain.CPP.packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
+    def __init__(self, failures: dict[str, int]):
+        subprocess.CalledProcessError.__init__(
+            self, next(iter(failures.values())), f"go install {' '.join(failures)}")
+        self.failures = failures
 
-    def install_additional_tools(self, path: str = None) -> int:
-        '''
-        C++ additional tools installer
-        '''
 
-        pkg_list = Toolchain.CPP.extra_packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
-
-
-@dataclass(slots=True)
-class _GtkToolchainInstaller(Installer):
+class _GoToolInstall:
     '''
-    Gtk Toolchain installer
+    `go install` of a tool, scheduled as a node of a `CommandScheduler`. The
+    binary is restored from the tool cache when it holds a build of the
+    resolved version, and a fresh build is added to the cache.
     '''
 
-    def install_toolchain(self, path: str = None) -> int:
+    __slots__ = ('tool', 'bin_dir', 'target', 'cache', 'env')
+
+    def __init__(self, tool: str, bin_dir: Path, target: GoTarget, cache: GoToolCache,
+                 env: dict[str, str]):
+        self.tool = tool
+        self.bin_dir = bin_dir
+        self.target = target
+        self.cache = cache
+        self.env = env
+
+    def _restore(self, package: str, query: str, dest: Path) -> bool:
+        # the module of a package is only known once it was built
+        module = self.cache.module_of(package)
+        if module is None:
+            return False
+        version = _go_resolve_version(module, query, self.env)
+        if version is None:
+            return False
+        cached = self.cache.lookup(package, module, version, self.target)
+        if cached is None:
+            return False
+
+        try:
+            self.cache.restore(cached, dest)
+        except OSError as err:
+            lgr.warning("Failed to restore '%s' from the tool cache: %s", self.tool, err)
+            return False
+
+        lgr.info("Restored '%s' %s from the tool cache", package, version)
+        return True
+
+    def run(self) -> int:
         '''
-        Gtk toolchain installer
+        Install the tool
         '''
 
-        pkg_list = Toolchain.GTK.packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
+        package, _, query = self.tool.partition('@')
+        dest = self.bin_dir / _go_binary_name(package)
+        if self._restore(package, query or 'latest', dest):
+            return 0
 
-    def install_additional_tools(self, path: str = None) -> int:
-        '''
-        Gtk additional tools installer
-        '''
+        ret = CommandBuilder() \
+            .program('go') \
+            .arg('install') \
+            .arg(self.tool) \
+            .env_vars(self.env) \
+            .build() \
+            .run()
+        if ret != 0:
+            return ret
+
+        built = _go_module_version(dest, self.env)
+        if built is not None:
+            try:
+                self.cache.store(dest, package, *built, self.target)
+            except OSError as err:
+                lgr.warning("Failed to add '%s' to the tool cache: %s", self.tool, err)
 
-        pkg_list = Toolchain.GTK.extra_packages_for(self._distribution)
-        return _install_tools_packages(self._distribution, pkg_list)
+        return 0
 
 
 @dataclass(slots=True)
@@ -118,8 +149,6 @@ class _GoToolchainInstaller(Installer):
         Go toolchain installer
         '''
 
-        go_tar_file = _download_go_toolchain()
-
         go_root: str = None
 
         if path is not None and path != "":
@@ -129,54 +158,56 @@ class _GoToolchainInstaller(Installer):
             if go_root is None or go_root == "":
                 go_root = "/usr/local/sdks/go"
 
-        extract_path = "/tmp/golang"
-
-        tar_handler = tarfile.TarFile.gzopen(go_tar_file, 'r')
-        tar_handler.extractall(extract_path)
-
-        filenames = tar_handler.getnames()
-
-        extracted_path = deepcopy(extract_path)
+        # extract next to the final location, so that the toolchain can be
+        # swapped in with a rename once complete
+        os.makedirs(os.path.dirname(go_root), exist_ok=True)
+        staging_path = tempfile.mkdtemp(
+            prefix=".go-", dir=os.path.dirname(go_root))
+        os.chmod(staging_path, 0o755)
 
-        common_path = os.path.commonpath(filenames)
-        if common_path.startswith(".") is False:
-            extracted_path = os.path.join(extracted_path, common_path)
+        try:
+            _extract_go_toolchain(staging_path)
+        except BaseException:
+            shutil.rmtree(staging_path, True, None)
+            raise
 
         shutil.rmtree(go_root, True, None)
-        os.makedirs(os.path.dirname(go_root), exist_ok=True)
-        shutil.move(extracted_path, go_root)
-
-        os.remove(go_tar_file)
+        os.rename(staging_path, go_root)
 
         return 0
 
     def install_additional_tools(self, path: str = None) -> int:
         '''
-        Go additional tools installer
+        Go additional tools installer. The tools are built concurrently,
+        sharing the build and module caches, and every failed tool is reported.
+        The binaries already built for the same versions of the tools and of Go
+        are taken from the tool cache instead.
         '''
 
-        go_tools_list = [
-            'github.com/cweill/gotests/gotests@latest',
-            'github.com/fatih/gomodifytags@latest',
-            'github.com/josharian/impl@latest',
-            'github.com/haya14busa/goplay/cmd/goplay@latest',
-            'github.com/go-delve/delve/cmd/dlv@latest',
-            'honnef.co/go/tools/cmd/staticcheck@latest',
-            'golang.org/x/tools/gopls@latest',
-            'github.com/ramya-rao-a/go-outline@latest'
-        ]
-
-        for tool in go_tools_list:
-            cmd = CommandBuilder() \
-                .program('go') \
-                .arg('install') \
-                .arg(tool) \
-                .build()
-
-            ret = cmd.run()
-            if ret != 0:
-                raise subprocess.CalledProcessError(
-                    ret, ' '.join(cmd.flatten()))
+        env = _go_build_env()
+        go_version, goos, goarch, hostos, hostarch, gobin, gopath = _go_env_values(
+            ['GOVERSION', 'GOOS', 'GOARCH', 'GOHOSTOS', 'GOHOSTARCH', 'GOBIN', 'GOPATH'], env)
+        if gobin:
+            bin_dir = Path(gobin)
+        else:
+            bin_dir = Path(gopath.split(os.pathsep)[0], 'bin')
+            # cross-compiled binaries go to a subdirectory named after the target
+            if (goos, goarch) != (hostos, hostarch):
+                bin_dir /= f"{goos}_{goarch}"
+
+        target = GoTarget(version=go_version, goos=goos, goarch=goarch)
+        cache = GoToolCache()
+        scheduler = CommandScheduler(max_workers=_go_install_workers(len(_GO_TOOLS)), logger=lgr)
+        for tool in _GO_TOOLS:
+            scheduler.add(tool, _GoToolInstall(tool, bin_dir, target, cache, env))
+
+        report = scheduler.run()
+        cache.prune()
+        failures = {tool: report.timings[tool].returncode for tool in report.failed}
+        for tool, ret in failures.items():
+            lgr.error("Failed to install '%s', go returned %d", tool, ret)
+        if failures:
+            raise ToolInstallError(failures)
 
         return 0
 
@@ -224,6 +255,91 @@ class _RustToolchainInstaller(Installer):
         return ret
 
 
+class _Step:
+    '''
+    Installation step scheduled as a node of a `CommandScheduler`. Failed
+    commands, and downloads failing or not matching their checksum, are
+    turned into a return code, keeping the error for the report. Any other
+    error is raised out of the installer.
+    '''
+
+    __slots__ = ('name', '_action', 'error')
+
+    def __init__(self, name: str, action: Callable[[], int]):
+        self.name = name
+        self._action = action
+        self.error: Exception = None
+
+    def run(self) -> int:
+        '''
+        Run the step
+        '''
+
+        try:
+            ret = self._action()
+        except subprocess.CalledProcessError as err:
+            # including the `ToolInstallError` of the additional tools
+            self.error = err
+            return err.returncode
+        except (URLError, HTTPException, TarError, ChecksumError) as err:
+            lgr.error("Installation step '%s' failed: %s", self.name, err)
+            self.error = err
+            return getattr(err, 'errno', None) or 1
+
+        return 0 if ret is None else ret
+
+
+@dataclass(slots=True)
+class ToolchainResult:
+    '''
+    Outcome of the installation of a toolchain
+    '''
+
+    toolchain: Toolchain
+    returncode: int = 0
+    steps: list[NodeTiming] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    error: Exception = None
+
+    @property
+    def duration(self) -> float:
+        '''
+        Wall clock time spent in the steps of the toolchain
+        '''
+        return sum(timing.duration for timing in self.steps)
+
+
+@dataclass(slots=True)
+class InstallReport:
+    '''
+    Outcome of an installer run, per toolchain
+    '''
+
+    results: dict[Toolchain, ToolchainResult] = field(default_factory=dict)
+    schedule: ScheduleReport = None
+
+    @property
+    def returncode(self) -> int:
+        '''
+        Return code of the first failed step, 0 otherwise
+        '''
+        return self.schedule.returncode
+
+    @property
+    def wall_time(self) -> float:
+        '''
+        Wall clock time of the whole run
+        '''
+        return self.schedule.wall_time
+
+
+# toolchains installed outside of the distribution package manager
+_STANDALONE_INSTALLERS: dict[Toolchain, type[Installer]] = {
+    Toolchain.GO: _GoToolchainInstaller,
+    Toolchain.RUST: _RustToolchainInstaller,
+}
+
+
 @dataclass(slots=True)
 class ToolchainInstaller:
     '''
@@ -234,41 +350,100 @@ class ToolchainInstaller:
     toolchain: Toolchain
     install_path: str = ""
     additional_tools: bool = False
+    toolchains: list[Toolchain] = field(default_factory=list)
 
-    def run(self) -> int:
+    def _toolchains(self) -> list[Toolchain]:
         '''
-        Run the constructed installer
+        Return the requested toolchains in order, without duplicates
         '''
 
-        if self.toolchain is None or self.toolchain not in Toolchain:
-            raise ValueError(
-                f"Invalid or unsupported toolchain '{self.toolchain}' specified")
+        toolchains = [] if self.toolchain is None else [self.toolchain]
+        toolchains.extend(self.toolchains)
+        return list(dict.fromkeys(toolchains))
 
-        if self.toolchain not in [Toolchain.GO, Toolchain.RUST] and \
-                (self.distribution is None or self.distribution not in Distribution):
-            raise ValueError(
-                f"Distribution not specified for '{self.toolchain.value}' toolchain")
-
-        installer = None
-        if self.toolchain == Toolchain.C:
-            installer = _CToolchainInstaller(self.distribution)
-        elif self.toolchain == Toolchain.CPP:
-            installer = _CppToolchainInstaller(self.distribution)
-        elif self.toolchain == Toolchain.GTK:
-            installer = _GtkToolchainInstaller(self.distribution)
-        elif self.toolchain == Toolchain.GO:
-            installer = _GoToolchainInstaller(self.distribution)
-        elif self.toolchain == Toolchain.RUST:
-            installer = _RustToolchainInstaller(self.distribution)
-
-        ret = installer.install_toolchain()
-        if ret != 0:
-            return ret
-
-        if self.additional_tools:
-            ret = installer.install_additional_tools()
-
-        return ret
+    def run(self) -> int:
+        '''
+        Run the constructed installer, see `execute`
+        '''
+        return self.execute().returncode
+
+    def execute(self) -> InstallReport:
+        '''
+        Run the constructed installer and return the per toolchain report.
+
+        The distribution packages of all the toolchains are installed together
+        in a single package manager transaction. It runs concurrently with the
+        downloads and installs of the toolchains shipped outside of the
+        distribution. The additional tools of these toolchains are installed
+        last, as they may need the compilers from the packages. The package
+        manager steps of concurrent installers are serialized by its host lock.
+        '''
+
+        toolchains = self._toolchains()
+        if not toolchains:
+            raise ValueError("No toolchain specified")
+
+        for toolchain in toolchains:
+            if toolchain not in Toolchain:
+                raise ValueError(
+                    f"Invalid or unsupported toolchain '{toolchain}' specified")
+
+            if toolchain not in _STANDALONE_INSTALLERS and \
+                    (self.distribution is None or self.distribution not in Distribution):
+                raise ValueError(
+                    f"Distribution not specified for '{toolchain.value}' toolchain")
+
+        packaged = [t for t in toolchains if t not in _STANDALONE_INSTALLERS]
+        steps: dict[Toolchain, list[_Step]] = {toolchain: [] for toolchain in toolchains}
+        scheduler = CommandScheduler(max_workers=2 * len(toolchains), logger=lgr)
+
+        if packaged:
+            pkg_list = resolve_packages(
+                self.distribution, packaged,
+                extra_tools=packaged if self.additional_tools else ())
+            step = _Step('packages', functools.partial(
+                _install_tools_packages, self.distribution, pkg_list))
+            scheduler.add(step.name, step)
+            for toolchain in packaged:
+                steps[toolchain].append(step)
+
+        for toolchain in toolchains:
+            if toolchain in packaged:
+                continue
+
+            installer = _STANDALONE_INSTALLERS[toolchain](self.distribution)
+            step = _Step(toolchain.value, installer.install_toolchain)
+            scheduler.add(step.name, step)
+            steps[toolchain].append(step)
+
+            if self.additional_tools:
+                tools = _Step(f"{toolchain.value}-tools", installer.install_additional_tools)
+                # the tools are built with the compilers from the packages
+                scheduler.add(tools.name, tools,
+                              depends_on=[step.name, *(['packages'] if packaged else [])])
+                steps[toolchain].append(tools)
+
+        schedule = scheduler.run()
+
+        report = InstallReport(schedule=schedule)
+        for toolchain, toolchain_steps in steps.items():
+            result = ToolchainResult(toolchain)
+            for step in toolchain_steps:
+                timing = schedule.timings.get(step.name)
+                if timing is None:
+                    result.skipped.append(step.name)
+                    continue
+                result.steps.append(timing)
+                if timing.returncode != 0 and result.returncode == 0:
+                    result.returncode = timing.returncode
+                    result.error = step.error
+            report.results[toolchain] = result
+
+        for result in report.results.values():
+            lgr.debug("Toolchain '%s' returned %d in %.3fs",
+                      result.toolchain.value, result.returncode, result.duration)
+
+        return report
 
 
 @dataclass(slots=True)
@@ -290,6 +465,14 @@ class ToolchainInstallerBuilder:
         self._toolchain_installer.install_path = path
         return self
 
+    def install_toolchains(self, toolchains: list[Toolchain]) -> Self:
+        '''
+        Specify further toolchains to be installed along with the first one
+        '''
+
+        self._toolchain_installer.toolchains.extend(toolchains)
+        return self
+
     def install_additional_tools(self, install: bool = False) -> Self:
         '''
         Specify whether to install additional utility tools acoompanied with
@@ -2,13 +2,83 @@
 Test module for toolchain installer
 '''
 
-import unittest
 import os
+import subprocess
+import tarfile
+import tempfile
+import time
+import unittest
+from http.client import IncompleteRead
+from pathlib import Path
+from unittest import mock
+from urllib.error import URLError
 
-from project_generator.lib.distromngr import get_distribution
+from project_generator.lib.distromngr import Distribution, get_distribution
 from project_generator.lib.toolchain import Toolchain
 from project_generator.lib.toolchain_manager.installer import \
-    ToolchainInstallerBuilder
+    GoTarget, GoToolCache, ToolchainInstallerBuilder, ToolInstallError
+
+from . import _installer
+from ._installer import _GoToolInstall, _Step
+from ._util import (ChecksumError, _go_binary_name, _go_build_env, _go_install_workers, _strip_go_root,
+                    _tools_package_manager)
+
+# stand-in for the go command, logging its arguments to GO_STUB_LOG. `install`
+# fails for the tools listed in GO_STUB_FAIL and writes a fake binary built
+# from GO_STUB_VERSION, which `version -m` reads back as build information.
+_GO_STUB = '''#!/bin/sh
+echo "$*" >> "$GO_STUB_LOG"
+case "$1" in
+env)
+    shift
+    for name in "$@"; do
+        case "$name" in
+        GOVERSION) echo go1.22.1 ;;
+        GOOS|GOHOSTOS) echo linux ;;
+        GOARCH|GOHOSTARCH) echo amd64 ;;
+        GOBIN) echo "$GOBIN" ;;
+        GOPATH) echo "$GOPATH" ;;
+        esac
+    done ;;
+install)
+    case " $GO_STUB_FAIL " in *" $2 "*) exit 2 ;; esac
+    sleep 0.2
+    package="${2%@*}"
+    mkdir -p "$GOBIN"
+    # replaced like go does, leaving any hardlinked copy alone
+    echo "$package $GO_STUB_VERSION" > "$GOBIN/.tmp-$$"
+    mv "$GOBIN/.tmp-$$" "$GOBIN/${package##*/}"
+    echo "done $2" >> "$GO_STUB_LOG" ;;
+version)
+    read -r package version < "$3"
+    printf '%s: go1.22.1\\n\\tpath\\t%s\\n\\tmod\\t%s\\t%s\\th1:stub=\\n' \\
+        "$3" "$package" "$package" "$version" ;;
+list)
+    echo "$GO_STUB_VERSION" ;;
+esac
+'''
+
+
+def _stub_go(root: Path) -> dict[str, str]:
+    '''
+    Write the stub go command under `root`, and return the environment
+    running it, with the binaries and the caches kept under `root`
+    '''
+
+    stub = root / 'stub' / 'go'
+    stub.parent.mkdir(parents=True)
+    stub.write_text(_GO_STUB, encoding='utf-8')
+    stub.chmod(0o755)
+
+    return {
+        'PATH': f"{stub.parent}{os.pathsep}{os.environ.get('PATH', os.defpath)}",
+        'GOBIN': str(root / 'bin'),
+        'GOPATH': str(root / 'go'),
+        'PROJGEN_CACHE_DIR': str(root / 'cache'),
+        'GO_STUB_LOG': str(root / 'go.log'),
+        'GO_STUB_VERSION': 'v1.0.0',
+        'GO_STUB_FAIL': '',
+    }
 
 
 class TestToolchainInstaller(unittest.TestCase):
@@ -84,3 +154,329 @@ class TestToolchainInstaller(unittest.TestCase):
         rust_toolchain_path = f"{home}/.cargo/bin"
         os.environ["PATH"] = f"{path}:{rust_toolchain_path}"
         self.assertEqual(installer.run(), 0)
+
+    def test_multi_installer(self):
+        '''
+        Test the concurrent installation of several toolchains
+        '''
+
+        distro = get_distribution()
+        if distro is None:
+            return
+
+        installer = ToolchainInstallerBuilder() \
+            .distribution(distro) \
+            .install_toolchain(Toolchain.CPP) \
+            .install_toolchains([Toolchain.C, Toolchain.GO]) \
+            .build()
+        report = installer.execute()
+
+        self.assertEqual(report.returncode, 0)
+        self.assertEqual(list(report.results), [Toolchain.CPP, Toolchain.C, Toolchain.GO])
+        self.assertEqual([t.name for t in report.results[Toolchain.C].steps], ['packages'])
+        self.assertEqual([t.name for t in report.results[Toolchain.GO].steps], ['go'])
+        self.assertLessEqual(report.wall_time, sum(r.duration for r in report.results.values()))
+
+
+class TestInstallStep(unittest.TestCase):
+    '''
+    Test suite for the scheduled installation steps
+    '''
+
+    def test_errors(self):
+        '''
+        Test that the failed commands and downloads of a step are turned into
+        return codes, and that other errors are raised
+        '''
+
+        def _fail(error: Exception):
+            raise error
+
+        self.assertEqual(_Step('ok', lambda: None).run(), 0)
+
+        step = _Step('cmd', lambda: _fail(subprocess.CalledProcessError(100, 'apt-get')))
+        self.assertEqual(step.run(), 100)
+        self.assertIsInstance(step.error, subprocess.CalledProcessError)
+
+        step = _Step('download', lambda: _fail(URLError('unreachable')))
+        self.assertEqual(step.run(), 1)
+
+        for error in [IncompleteRead(b'partial', 100), tarfile.ReadError('truncated'),
+                      ChecksumError('SHA256 mismatch for go1.22.1.linux-amd64.tar.gz')]:
+            step = _Step('download', lambda error=error: _fail(error))
+            self.assertEqual(step.run(), 1)
+            self.assertIs(step.error, error)
+
+        step = _Step('bug', lambda: _fail(ValueError('No stable release found')))
+        self.assertRaises(ValueError, step.run)
+
+    def test_schedule(self):
+        '''
+        Test that the standalone toolchains install alongside the packages,
+        and their additional tools once the packages are installed
+        '''
+
+        spans: dict[str, list[float]] = {}
+
+        def _timed(name: str, secs: float = 0.3, error: Exception = None):
+            start = time.monotonic()
+            time.sleep(secs)
+            spans[name] = [start, time.monotonic()]
+            if error is not None:
+                raise error
+            return 0
+
+        class _StubGo(_installer.Installer):
+            def install_toolchain(self, path: str = None) -> int:
+                return _timed('go')
+
+            def install_additional_tools(self, path: str = None) -> int:
+                return _timed('go-tools', 0)
+
+        class _StubRust(_installer.Installer):
+            def install_toolchain(self, path: str = None) -> int:
+                return _timed('rust', error=ChecksumError('SHA256 mismatch for rustup-init'))
+
+        with mock.patch.dict(_installer._STANDALONE_INSTALLERS,
+                             {Toolchain.GO: _StubGo, Toolchain.RUST: _StubRust}), \
+                mock.patch.object(_installer, 'resolve_packages', return_value=['gcc']), \
+                mock.patch.object(_installer, '_install_tools_packages',
+                                  lambda distro, pkgs: _timed('packages')):
+            report = ToolchainInstallerBuilder() \
+                .distribution(Distribution.UBUNTU) \
+                .install_toolchain(Toolchain.C) \
+                .install_toolchains([Toolchain.GO, Toolchain.RUST]) \
+                .install_additional_tools(True) \
+                .build() \
+                .execute()
+
+        # the downloads overlap the package manager transaction
+        self.assertLess(spans['go'][0], spans['packages'][1])
+        self.assertLess(spans['packages'][0], spans['go'][1])
+        self.assertGreaterEqual(spans['go-tools'][0], spans['packages'][1])
+        self.assertLess(report.wall_time, 0.55)
+
+        # a failed download is reported with its toolchain
+        self.assertEqual(report.results[Toolchain.GO].returncode, 0)
+        self.assertEqual(report.results[Toolchain.RUST].returncode, 1)
+        self.assertIsInstance(report.results[Toolchain.RUST].error, ChecksumError)
+        self.assertEqual(report.results[Toolchain.RUST].skipped, ['rust-tools'])
+
+    def test_package_cache(self):
+        '''
+        Test that the shared package cache is only used once configured
+        '''
+
+        with mock.patch.dict(os.environ):
+            os.environ.pop('PROJGEN_CACHE_DIR', None)
+            self.assertIsNone(_tools_package_manager(Distribution.UBUNTU).package_cache)
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': cache_dir}):
+            cache = _tools_package_manager(Distribution.UBUNTU).package_cache
+            self.assertEqual(cache.root, Path(cache_dir, 'packages'))
+
+
+class TestGoTools(unittest.TestCase):
+    '''
+    Test suite for the concurrent install of the Go tools
+    '''
+
+    def test_build_env(self):
+        '''
+        Test that the tools share the caches, unless the user chose them
+        '''
+
+        saved = {name: os.environ.pop(name, None) for name in ['GOCACHE', 'GOMODCACHE', 'GOFLAGS']}
+        try:
+            env = _go_build_env()
+            self.assertEqual(set(env), {'GOCACHE', 'GOMODCACHE', 'GOFLAGS'})
+            self.assertEqual(env['GOFLAGS'], '-modcacherw')
+
+            os.environ['GOCACHE'] = '/tmp/go-build'
+            os.environ['GOFLAGS'] = '-trimpath'
+            env = _go_build_env()
+            self.assertNotIn('GOCACHE', env)
+            self.assertEqual(env['GOFLAGS'], '-trimpath -modcacherw')
+        finally:
+            for name, value in saved.items():
+                os.environ.pop(name, None)
+                if value is not None:
+                    os.environ[name] = value
+
+        self.assertEqual(_go_install_workers(1), 1)
+        self.assertLessEqual(_go_install_workers(8), 8)
+        self.assertGreaterEqual(_go_install_workers(8), 2)
+
+    def test_strip_go_root(self):
+        '''
+        Test that the release tar is extracted without its leading `go/`
+        '''
+
+        member = tarfile.TarInfo('go/bin/gofmt')
+        self.assertTrue(_strip_go_root(member))
+        self.assertEqual(member.name, 'bin/gofmt')
+
+        link = tarfile.TarInfo('go/bin/go2')
+        link.type, link.linkname = tarfile.LNKTYPE, 'go/bin/go'
+        self.assertTrue(_strip_go_root(link))
+        self.assertEqual(link.linkname, 'bin/go')
+
+        for name in ['go', 'go/', 'go/../etc/passwd', 'go//etc/passwd']:
+            self.assertFalse(_strip_go_root(tarfile.TarInfo(name)), name)
+
+    def test_failures(self):
+        '''
+        Test that every failed tool is reported
+        '''
+
+        def _fail():
+            raise ToolInstallError({'gopls@latest': 1, 'dlv@latest': 2})
+
+        step = _Step('go-tools', _fail)
+        self.assertEqual(step.run(), 1)
+        self.assertEqual(step.error.failures, {'gopls@latest': 1, 'dlv@latest': 2})
+
+
+    def test_install(self):
+        '''
+        Test that the tools are installed concurrently, and that a failed tool
+        neither stops the others nor goes unreported
+        '''
+
+        tools = ['example.com/a/cmd/alpha@latest', 'example.com/b/beta@latest',
+                 'example.com/c/gamma@latest']
+        with tempfile.TemporaryDirectory() as tmp:
+            env = _stub_go(Path(tmp))
+            env['GO_STUB_FAIL'] = tools[1]
+            with mock.patch.dict(os.environ, env), \
+                    mock.patch.object(_installer, '_GO_TOOLS', tools):
+                installer = _installer._GoToolchainInstaller(Distribution.UBUNTU)
+                with self.assertRaises(ToolInstallError) as ctx:
+                    installer.install_additional_tools()
+
+            self.assertEqual(ctx.exception.failures, {tools[1]: 2})
+            self.assertEqual(sorted(os.listdir(env['GOBIN'])), ['alpha', 'gamma'])
+
+            with open(env['GO_STUB_LOG'], encoding='utf-8') as log:
+                calls = log.read().splitlines()
+            installs = [i for i, call in enumerate(calls) if call.startswith('install ')]
+            first_done = next(i for i, call in enumerate(calls) if call.startswith('done '))
+            self.assertEqual(len(installs), 3)
+            # a second build starts before the first one is done
+            self.assertLess(installs[1], first_done)
+
+
+class TestGoToolCache(unittest.TestCase):
+    '''
+    Test suite for the cache of the Go tool binaries
+    '''
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.cache = GoToolCache(self.tmp / 'cache')
+        self.target = GoTarget(version='go1.22.1', goos='linux', goarch='amd64')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _binary(self, name: str, content: bytes) -> Path:
+        path = self.tmp / 'build' / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(content)
+        return path
+
+    def test_store_restore(self):
+        '''
+        Test that a stored binary is looked up by version and Go target, and
+        restored with a hardlink
+        '''
+
+        package = 'golang.org/x/tools/gopls'
+        self.assertIsNone(self.cache.module_of(package))
+
+        tool = self.cache.store(self._binary('gopls', b'gopls v0.15.0'), package,
+                                'golang.org/x/tools/gopls', 'v0.15.0', self.target)
+        self.assertEqual(self.cache.module_of(package), 'golang.org/x/tools/gopls')
+        self.assertEqual(self.cache.lookup(package, tool.module, 'v0.15.0', self.target), tool)
+        self.assertIsNone(self.cache.lookup(package, tool.module, 'v0.15.1', self.target))
+        self.assertIsNone(self.cache.lookup(package, tool.module, 'v0.15.0',
+                                            GoTarget('go1.23.0', 'linux', 'amd64')))
+
+        dest = self.cache.restore(tool, self.tmp / 'bin' / 'gopls')
+        self.assertEqual(dest.read_bytes(), b'gopls v0.15.0')
+        self.assertEqual(dest.stat().st_ino, self.cache.object_path(tool).stat().st_ino)
+
+        self.assertEqual(self.cache.entries(), [tool])
+        self.assertEqual(self.cache.size(), len(b'gopls v0.15.0'))
+        self.assertEqual(_go_binary_name(package), 'gopls')
+        self.assertEqual(_go_binary_name('github.com/a/b/cmd/tool/v2'), 'tool')
+
+    def test_prune(self):
+        '''
+        Test that the least recently used binaries are evicted with their entries
+        '''
+
+        old = self.cache.store(self._binary('old', b'x' * 100), 'example.com/old',
+                               'example.com/old', 'v1.0.0', self.target)
+        past = time.time() - 3600
+        os.utime(self.cache.object_path(old), (past, past))
+        new = self.cache.store(self._binary('new', b'y' * 100), 'example.com/new',
+                               'example.com/new', 'v1.0.0', self.target)
+
+        self.assertEqual(self.cache.prune(150), [self.cache.object_path(old)])
+        self.assertEqual(self.cache.entries(), [new])
+        self.assertIsNone(self.cache.module_of('example.com/old'))
+        self.assertEqual(self.cache.prune(150), [])
+
+    def test_install(self):
+        '''
+        Test that a tool is built and stored on its first install, restored
+        from the cache afterwards, and built again for a new version
+        '''
+
+        env = _stub_go(self.tmp)
+        tool = 'golang.org/x/tools/gopls@latest'
+        dest = self.tmp / 'bin' / 'gopls'
+
+        def _calls() -> list[str]:
+            log = Path(env['GO_STUB_LOG'])
+            if not log.exists():
+                return []
+            calls = log.read_text(encoding='utf-8').splitlines()
+            log.unlink()
+            return [call.split()[0] for call in calls if not call.startswith('done ')]
+
+        with mock.patch.dict(os.environ, env):
+            install = _GoToolInstall(tool, self.tmp / 'bin', self.target, self.cache, {})
+            self.assertEqual(install.run(), 0)
+            # the module is unknown before the first build, nothing to resolve
+            self.assertEqual(_calls(), ['install', 'version'])
+            cached, = self.cache.entries()
+            self.assertEqual((cached.module, cached.version), ('golang.org/x/tools/gopls', 'v1.0.0'))
+
+            dest.unlink()
+            self.assertEqual(install.run(), 0)
+            self.assertEqual(_calls(), ['list'])
+            self.assertEqual(dest.read_text(encoding='utf-8'), 'golang.org/x/tools/gopls v1.0.0\n')
+            self.assertEqual(dest.stat().st_ino, self.cache.object_path(cached).stat().st_ino)
+
+            os.environ['GO_STUB_VERSION'] = 'v1.1.0'
+            self.assertEqual(install.run(), 0)
+            self.assertEqual(_calls(), ['list', 'install', 'version'])
+            self.assertEqual(sorted(tool.version for tool in self.cache.entries()), ['v1.0.0', 'v1.1.0'])
+
+            # a fixed version is not resolved through go
+            pinned = _GoToolInstall('golang.org/x/tools/gopls@v1.0.0', self.tmp / 'bin',
+                                    self.target, self.cache, {})
+            self.assertEqual(pinned.run(), 0)
+            self.assertEqual(_calls(), [])
+            self.assertEqual(dest.read_text(encoding='utf-8'), 'golang.org/x/tools/gopls v1.0.0\n')
+
+            # a failed build is reported, and nothing is cached
+            os.environ['GO_STUB_VERSION'] = 'v1.2.0'
+            os.environ['GO_STUB_FAIL'] = tool
+            self.assertEqual(install.run(), 2)
+            self.assertEqual(_calls(), ['list', 'install'])
+            self.assertEqual(len(self.cache.entries()), 2)
@@ -0,0 +1,215 @@
+'''
+Content-addressed cache of the Go tool binaries
+'''
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from project_generator.lib.utils.cache import default_cache_dir, prune_lru
+
+DEFAULT_TOOL_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+
+
+@dataclass(slots=True, frozen=True)
+class GoTarget:
+    '''
+    Go toolchain version and platform a binary is built for
+    '''
+
+    version: str
+    goos: str
+    goarch: str
+
+
+@dataclass(slots=True, frozen=True)
+class CachedTool:
+    '''
+    A tool binary present in the cache
+    '''
+
+    package: str
+    module: str
+    version: str
+    target: GoTarget
+    digest: str
+    size: int
+
+
+def _write_atomic(path: Path, write):
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _objects(objects_dir: Path) -> list[Path]:
+    # leaving out the temporary files of interrupted stores
+    if not objects_dir.is_dir():
+        return []
+    return [path for path in objects_dir.iterdir()
+            if path.is_file() and not path.name.startswith('.')]
+
+
+def _read_entry(path: Path) -> CachedTool | None:
+    try:
+        with open(path, encoding='utf-8') as entry:
+            fields = json.load(entry)
+        return CachedTool(**{**fields, 'target': GoTarget(**fields['target'])})
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+class GoToolCache:
+    '''
+    Size bounded cache of the binaries built by `go install`, keyed by the
+    package, its module and resolved version, and the Go version and platform
+    they were built with. The binaries are stored once per content under
+    `objects`, and an entry under `entries` maps each key to its binary.
+    Restoring a binary hardlinks it, or copies it across filesystems.
+    '''
+
+    def __init__(self, root: Path = None, max_bytes: int = DEFAULT_TOOL_CACHE_SIZE):
+        if root is None:
+            root = default_cache_dir('go', 'tools')
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _key(package: str, module: str, version: str, target: GoTarget) -> str:
+        key = '\0'.join([package, f"{module}@{version}",
+                         target.version, f"{target.goos}/{target.goarch}"])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / 'entries' / f"{key}.json"
+
+    def object_path(self, tool: CachedTool) -> Path:
+        '''
+        Return the path of the binary of a cached tool
+        '''
+        return self.root / 'objects' / tool.digest
+
+    def entries(self) -> list[CachedTool]:
+        '''
+        Return the cached tools whose binary is present
+        '''
+
+        tools = []
+        entries_dir = self.root / 'entries'
+        if not entries_dir.is_dir():
+            return tools
+
+        for path in sorted(entries_dir.glob('*.json')):
+            tool = _read_entry(path)
+            if tool is not None and self.object_path(tool).is_file():
+                tools.append(tool)
+
+        return tools
+
+    def module_of(self, package: str) -> str | None:
+        '''
+        Return the module of `package`, as recorded by an earlier build
+        '''
+
+        for tool in self.entries():
+            if tool.package == package:
+                return tool.module
+        return None
+
+    def lookup(self, package: str, module: str, version: str, target: GoTarget) -> CachedTool | None:
+        '''
+        Return the cached build of `package`, `None` when it was not cached
+        '''
+
+        tool = _read_entry(self._entry_path(self._key(package, module, version, target)))
+        if tool is None or not self.object_path(tool).is_file():
+            return None
+        return tool
+
+    def store(self, binary: Path, package: str, module: str, version: str,
+              target: GoTarget) -> CachedTool:
+        '''
+        Add the `binary` built from `package` to the cache
+        '''
+
+        digest = hashlib.sha256()
+        with open(binary, 'rb') as data:
+            for chunk in iter(lambda: data.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        tool = CachedTool(package=package, module=module, version=version, target=target,
+                          digest=digest.hexdigest(), size=os.stat(binary).st_size)
+
+        obj = self.object_path(tool)
+        if not obj.is_file():
+            with open(binary, 'rb') as data:
+                _write_atomic(obj, lambda out: shutil.copyfileobj(data, out))
+            os.chmod(obj, 0o555)
+
+        entry = json.dumps(asdict(tool)).encode()
+        _write_atomic(self._entry_path(self._key(package, module, version, target)),
+                      lambda out: out.write(entry))
+
+        return tool
+
+    def restore(self, tool: CachedTool, dest: Path) -> Path:
+        '''
+        Place the binary of the cached `tool` at `dest`, replacing any file
+        there, and return `dest`
+        '''
+
+        obj = self.object_path(tool)
+        dest = Path(dest)
+        os.makedirs(dest.parent, exist_ok=True)
+        tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+
+        try:
+            os.link(obj, tmp_path)
+        except OSError as err:
+            if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copy2(obj, tmp_path)
+        os.replace(tmp_path, dest)
+
+        # the eviction goes by the mtime of the objects
+        os.utime(obj)
+
+        return dest
+
+    def size(self) -> int:
+        '''
+        Return the total size of the cached binaries in bytes
+        '''
+
+        return sum(path.stat().st_size for path in _objects(self.root / 'objects'))
+
+    def prune(self, max_bytes: int = None) -> list[Path]:
+        '''
+        Evict the least recently used binaries until the cache fits in
+        `max_bytes`, defaulting to the cache size, along with their entries.
+        Return the paths of the evicted binaries.
+        '''
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        evicted = prune_lru(_objects(self.root / 'objects'), max_bytes)
+
+        if evicted:
+            for path in (self.root / 'entries').glob('*.json'):
+                tool = _read_entry(path)
+                if tool is None or not self.object_path(tool).is_file():
+                    path.unlink(missing_ok=True)
+
+        return evicted
@@ -6,62 +6,63 @@ import hashlib
 import json
 import os
 import platform
-import tempfile
+import re
+import subprocess
+import tarfile
 
 from pathlib import Path
-from tarfile import TarError, is_tarfile
 from urllib import request
-from urllib.error import HTTPError, URLError
 
 from project_generator.lib.distromngr import Distribution
-from project_generator.lib.pkgmngr import PackageManagerBuilder
+from project_generator.lib.pkgmngr import (DEFAULT_LOCK_TIMEOUT, HostLock, PackageCache,
+                                          PackageManager, PackageManagerBuilder)
+from project_generator.lib.utils.cache import default_cache_dir
+from project_generator.lib.utils.command import CommandBuilder
 from project_generator.lib.utils.logger import get_logger
 
 lgr = get_logger("installer")
 
+# repository metadata refreshed within this many seconds is not synced again
+_SYNC_TTL = 60 * 60
 
-def _check_hash(filename: Path, exp_chksum: str) -> bool:
+# number of packages downloaded concurrently
+_PARALLEL_DOWNLOADS = 8
+
+
+class ChecksumError(ValueError):
     '''
-    Check if the file with the name "filename" matches the SHA-256 sum in "expect"
+    Downloaded file not matching its published checksum
     '''
-    hash_val = hashlib.sha256()
-    with open(filename, 'rb') as f_h:
-        while True:
-            data = f_h.read(4096)
-            if len(data) == 0:
-                break
-            hash_val.update(data)
-    return exp_chksum == hash_val.hexdigest()
 
 
-class _GoToolchainDownloader:
+class _HashingReader:
     '''
-    Utility class for managing the download for golang toolchain
+    File-like wrapper computing the SHA-256 digest of the data read through it
     '''
 
-    def __init__(self):
-        self._latest_release_info: dict[str, str] = None
+    __slots__ = ('_stream', 'hash')
 
-    def check_install_file_exists(self, path: Path = None) -> bool:
+    def __init__(self, stream):
+        self._stream = stream
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
         '''
-        Verify if an already downloaded install file exists
+        Read from the wrapped stream, updating the digest
         '''
 
-        try:
-            if os.path.exists(path) and os.stat(path).st_size != 0 and is_tarfile(path):
-                latest_release_info = self.get_latest_release()
-                release_file_info = self.get_latest_release_installer_info(
-                    latest_release_info)
-                if _check_hash(path, release_file_info.get('sha256')):
-                    lgr.debug(
-                        "Latest release file found with matching SHA256 hash")
-                    return True
-                lgr.debug("Latest release found but hash doesn't match")
-                return False
-            raise FileNotFoundError(
-                "No valid golang installation tar file found")
-        except (FileNotFoundError, TarError):
-            return False
+        data = self._stream.read(size)
+        self.hash.update(data)
+        return data
+
+
+class _GoToolchainDownloader:
+    '''
+    Utility class for managing the download for golang toolchain
+    '''
+
+    def __init__(self):
+        self._latest_release_info: dict[str, str] = None
 
     def get_latest_release(self) -> dict[str, str]:
         '''
@@ -104,63 +105,61 @@ class _GoToolchainDownloader:
 
         return release_file_info
 
-    def download_install_tar(self) -> Path:
+    def extract_install_tar(self, dest: Path):
         '''
-        Download the latest released install tar
+        Stream the latest released install tar straight into `dest`, without
+        staging the tarball on the disk, and verify its SHA-256 sum
         '''
 
-        latest_release_info = self.get_latest_release()
-
-        version = latest_release_info.get('version', None)
-        if version is None:
-            raise ValueError(
-                "Version information missing from release info")
-
         release_file_info = self.get_latest_release_installer_info(
-            latest_release_info)
+            self.get_latest_release())
 
         release_filename = release_file_info.get('filename', None)
         if release_filename is None:
-            raise ValueError(
-                f"No suitable file found in release {version}")
+            raise ValueError("No suitable file found in the latest release")
 
         release_checksum = release_file_info.get('sha256', None)
         if release_checksum is None:
             lgr.debug("release_info: %s", json.dumps(release_file_info))
             raise ValueError("Checksum info not present in the release info")
 
-        try:
-            file_fd, temp_output_path = tempfile.mkstemp()
-            # close the return fd, as we are not going to use it
-            os.close(file_fd)
-
-            file_dir = os.path.dirname(temp_output_path)
-            final_output_path = Path(os.path.join(file_dir, release_filename))
-
-            if self.check_install_file_exists(final_output_path):
-                return final_output_path
+        lgr.debug("Streaming golang installation tar file into %s", dest)
 
-            lgr.debug("Downloading golang installation tar file from scratch")
+        with request.urlopen(f"https://go.dev/dl/{release_filename}") as resp:
+            reader = _HashingReader(resp)
+            with tarfile.open(fileobj=reader, mode='r|gz') as install_tar:
+                for member in install_tar:
+                    if _strip_go_root(member):
+                        install_tar.extract(member, dest)
+            # the digest covers the padding after the end of the archive
+            while reader.read(64 * 1024):
+                pass
 
-            request.urlretrieve(
-                f"https://go.dev/dl/{release_filename}", temp_output_path)
+        if reader.hash.hexdigest() != release_checksum:
+            raise ChecksumError(f"SHA256 mismatch for {release_filename}")
 
-            os.rename(temp_output_path, final_output_path)
-            temp_output_path = final_output_path
 
-            return temp_output_path
+def _strip_go_root(member: tarfile.TarInfo) -> bool:
+    '''
+    Strip the leading `go/` from the path of a member of the release tar,
+    returning `False` for the members to leave out
+    '''
 
-        except (URLError, HTTPError, Exception) as exc:
-            os.remove(temp_output_path)
-            raise exc
+    _, sep, name = member.name.partition('/')
+    if not sep or not name or os.path.isabs(name) or '..' in name.split('/'):
+        return False
+    member.name = name
+    if member.islnk():
+        member.linkname = member.linkname.partition('/')[2]
+    return True
 
 
-def _download_go_toolchain():
+def _extract_go_toolchain(dest: Path):
     '''
-    Download the Go toolchain
+    Download and extract the Go toolchain into `dest` in a single pass
     '''
     go_toolchain_downloader = _GoToolchainDownloader()
-    return go_toolchain_downloader.download_install_tar()
+    go_toolchain_downloader.extract_install_tar(dest)
 
 
 def _download_rust_toolchain():
@@ -180,6 +179,105 @@ def _download_rust_toolchain():
     return rustup_init_bin
 
 
+def _go_build_env() -> dict[str, str]:
+    '''
+    Return the environment overlay sharing the Go build and module caches
+    between the tool installs, and across runs. Caches chosen by the user are
+    kept.
+    '''
+
+    env = {}
+    if not os.getenv('GOCACHE'):
+        env['GOCACHE'] = str(default_cache_dir('go', 'build'))
+    if not os.getenv('GOMODCACHE'):
+        env['GOMODCACHE'] = str(default_cache_dir('go', 'mod'))
+
+    # the module cache is read-only by default, which keeps it from being pruned
+    flags = os.getenv('GOFLAGS', '')
+    if '-modcacherw' not in flags.split():
+        env['GOFLAGS'] = f"{flags} -modcacherw".strip()
+
+    return env
+
+
+def _go_install_workers(tools: int) -> int:
+    '''
+    Return how many `go install` to run concurrently. Every build already
+    compiles its packages in parallel, so a worker per four cores is enough to
+    overlap the module downloads and the links with the compilation.
+    '''
+    return max(1, min(tools, max(2, (os.cpu_count() or 1) // 4)))
+
+
+def _go_env_values(names: list[str], env: dict[str, str]) -> list[str]:
+    '''
+    Return the values of the Go environment variables `names`
+    '''
+
+    cmd = CommandBuilder() \
+        .program('go') \
+        .arg('env') \
+        .args(names) \
+        .env_vars(env) \
+        .capture_output() \
+        .build()
+    result = cmd.execute()
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, ' '.join(cmd.flatten()))
+    return result.text().splitlines()
+
+
+def _go_binary_name(package: str) -> str:
+    '''
+    Return the name of the binary `go install` builds from `package`, the last
+    element of its path before any major version suffix
+    '''
+
+    elements = package.split('/')
+    if len(elements) > 1 and re.fullmatch(r'v\d+', elements[-1]):
+        return elements[-2]
+    return elements[-1]
+
+
+def _go_module_version(binary: Path, env: dict[str, str]) -> tuple[str, str] | None:
+    '''
+    Return the module and version a Go binary was built from, read from its
+    embedded build information
+    '''
+
+    result = CommandBuilder() \
+        .program('go') \
+        .args(['version', '-m', str(binary)]) \
+        .env_vars(env) \
+        .capture_output() \
+        .build() \
+        .execute()
+    if result.returncode != 0:
+        return None
+
+    match = re.search(r'^\tmod\t(\S+)\t(\S+)', result.text(), re.MULTILINE)
+    return None if match is None else (match.group(1), match.group(2))
+
+
+def _go_resolve_version(module: str, query: str, env: dict[str, str]) -> str | None:
+    '''
+    Resolve the version `query` of `module`, like `latest`, to a version
+    '''
+
+    if re.fullmatch(r'v\d+\.\d+\.\d+(?:[-+][\w.-]+)?', query):
+        return query
+
+    result = CommandBuilder() \
+        .program('go') \
+        .args(['list', '-m', '-f', '{{.Version}}', f"{module}@{query}"]) \
+        .env_vars(env) \
+        .capture_output() \
+        .build() \
+        .execute()
+    version = result.text().strip()
+    return version if result.returncode == 0 and version else None
+
+
 def _get_target_triple() -> str:
     '''
     Generate the target triple for the current system
@@ -190,14 +288,39 @@ def _get_target_triple() -> str:
     return f"{architecture}-unknown-{operating_system}-gnu"
 
 
-def _install_tools_packages(distribution: Distribution, pkg_list: list[str]):
+def _shared_package_cache() -> PackageCache | None:
     '''
-    Helper function to install the packages
+    Return the package archive cache shared across runs, only when a cache
+    directory is configured through `PROJGEN_CACHE_DIR`. Otherwise the
+    package managers keep their own cache, and the archives do not end up
+    in the image layers.
+    '''
+
+    if not os.getenv('PROJGEN_CACHE_DIR'):
+        return None
+    return PackageCache()
+
+
+def _tools_package_manager(distribution: Distribution) -> PackageManager:
+    '''
+    Construct the package manager used to install the toolchain packages
     '''
 
-    pkg_manager = PackageManagerBuilder() \
+    return PackageManagerBuilder() \
         .confirm_action(False) \
         .distribution(distribution) \
+        .sync_ttl(_SYNC_TTL) \
+        .skip_installed(True) \
+        .parallel_downloads(_PARALLEL_DOWNLOADS) \
+        .package_cache(_shared_package_cache()) \
+        .lock_wait(DEFAULT_LOCK_TIMEOUT) \
+        .host_lock(HostLock()) \
         .build()
 
-    return pkg_manager.install(pkg_list).commit()
+
+def _install_tools_packages(distribution: Distribution, pkg_list: list[str]):
+    '''
+    Helper function to install the packages
+    '''
+
+    return _tools_package_manager(distribution).install(pkg_list).commit()
@@ -0,0 +1 @@
+from ._store import DiskStore, default_cache_dir, prune_lru
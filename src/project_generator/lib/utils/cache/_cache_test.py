@@ -0,0 +1,79 @@
+'''
+Unit tests for the cache package
+'''
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ._store import DiskStore, default_cache_dir
+
+
+class TestDiskStore(unittest.TestCase):
+    '''
+    Test suite for `DiskStore`
+    '''
+
+    def test_get_put(self):
+        '''
+        Test storing and reading back entries
+        '''
+
+        with tempfile.TemporaryDirectory() as root:
+            store = DiskStore(root)
+            self.assertIsNone(store.get('abcd'))
+
+            store.put('abcd', {'value': [1, 2]})
+            self.assertEqual(store.get('abcd'), {'value': [1, 2]})
+
+            store.delete('abcd')
+            self.assertIsNone(store.get('abcd'))
+
+    def test_lru_eviction(self):
+        '''
+        Test that the least recently used entries are evicted first
+        '''
+
+        with tempfile.TemporaryDirectory() as root:
+            store = DiskStore(root, max_bytes=1100)
+            payload = 'x' * 300
+            for idx, key in enumerate(['aa01', 'bb02', 'cc03']):
+                store.put(key, payload)
+                # make the access order visible to the mtime resolution
+                os.utime(store._path(key), (idx, idx))
+
+            # a read refreshes 'aa01', so 'bb02' is the oldest entry now
+            self.assertIsNotNone(store.get('aa01'))
+            store.put('dd04', payload)
+
+            self.assertIsNone(store.get('bb02'))
+            self.assertIsNotNone(store.get('aa01'))
+            self.assertIsNotNone(store.get('dd04'))
+
+    def test_ttl(self):
+        '''
+        Test that entries expire
+        '''
+
+        with tempfile.TemporaryDirectory() as root:
+            store = DiskStore(root, ttl=0.05)
+            store.put('abcd', 1)
+            self.assertEqual(store.get('abcd'), 1)
+            time.sleep(0.1)
+            self.assertIsNone(store.get('abcd'))
+
+    def test_default_cache_dir(self):
+        '''
+        Test the resolution of the cache directory
+        '''
+
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.dict(os.environ, {'PROJGEN_CACHE_DIR': root}):
+            self.assertEqual(default_cache_dir('commands'), Path(root, 'commands'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+'''
+Size bounded on-disk key/value store with TTL and LRU eviction
+'''
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from project_generator.lib.utils.logger import get_logger
+
+lgr = get_logger("cache")
+
+
+def default_cache_dir(*parts: str) -> Path:
+    '''
+    Return the cache directory of the project generator, honouring
+    `PROJGEN_CACHE_DIR` and `XDG_CACHE_HOME`, with `parts` appended
+    '''
+
+    root = os.getenv('PROJGEN_CACHE_DIR')
+    if not root:
+        xdg_cache = os.getenv('XDG_CACHE_HOME')
+        if not xdg_cache:
+            xdg_cache = os.path.join(os.path.expanduser('~'), '.cache')
+        root = os.path.join(xdg_cache, 'project_generator')
+
+    return Path(root, *parts)
+
+
+def prune_lru(paths: list[Path], max_bytes: int) -> list[Path]:
+    '''
+    Remove the least recently used files among `paths`, judged by their mtime,
+    until their total size fits in `max_bytes`. Return the removed paths.
+    '''
+
+    entries = []
+    total = 0
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = []
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+
+    return removed
+
+
+def _atomic_write(path: Path, data: bytes):
+    '''
+    Write `data` to `path` so that readers never observe a partial file
+    '''
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class DiskStore:
+    '''
+    Persistent mapping from string keys to JSON serializable values.
+
+    Entries older than `ttl` seconds are treated as missing, and the least
+    recently used entries are evicted once the store grows past `max_bytes`.
+    Every entry lives in its own file, written atomically, so that concurrent
+    processes can share a store.
+    '''
+
+    def __init__(self, root: Path, ttl: float = None, max_bytes: int = 64 * 1024 * 1024):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        '''
+        Return the value stored for `key`, `None` if missing or expired
+        '''
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                entry = json.loads(entry_file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if self.ttl is not None and time.time() - entry.get('created', 0) > self.ttl:
+            self.delete(key)
+            return None
+
+        # refresh the mtime, which orders the entries for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return entry.get('value')
+
+    def put(self, key: str, value):
+        '''
+        Store `value` for `key`, evicting old entries if over the size bound
+        '''
+
+        entry = {'created': time.time(), 'value': value}
+        _atomic_write(self._path(key), json.dumps(entry).encode())
+
+        removed = prune_lru(self.entries(), self.max_bytes)
+        if removed:
+            lgr.debug("Evicted %d entries from %s", len(removed), self.root)
+
+    def delete(self, key: str):
+        '''
+        Remove the entry for `key`, if any
+        '''
+
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> list[Path]:
+        '''
+        Return the paths of all the entry files in the store
+        '''
+
+        if not self.root.is_dir():
+            return []
+        return list(self.root.glob('*/*.json'))
+
+    def clear(self):
+        '''
+        Remove every entry from the store
+        '''
+
+        for path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1 +1,10 @@
 from ._command import CommandBuilder, Command
+from ._deadline import Deadline
+from ._environment import Environment
+from ._memo import CommandCache
+from ._profiling import (ResourceRecord, CommandHook, install_hook, remove_hook,
+                         MemoryCollector, JsonLinesSink, ChromeTraceSink)
+from ._result import CommandResult, CommandStatus, OutputBuffer
+from ._scheduler import CommandScheduler, ScheduleReport, NodeTiming
+from ._session import ShellSession
+from ._spawn import SpawnBackend, set_default_spawn_backend, default_spawn_backend
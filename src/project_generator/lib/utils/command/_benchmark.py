@@ -0,0 +1,100 @@
+'''
+Micro benchmarks for the command execution backends.
+
+Run with `python -m project_generator.lib.utils.command._benchmark`
+'''
+
+import argparse
+import time
+
+from ._command import Command, CommandBuilder
+from ._session import ShellSession
+from ._spawn import SpawnBackend
+
+
+def _time_runs(commands: list[Command]) -> float:
+    '''
+    Run the commands one after another and return the elapsed wall time
+    '''
+
+    start = time.perf_counter()
+    for cmd in commands:
+        ret = cmd.run()
+        if ret != 0:
+            raise RuntimeError(f"benchmark command returned {ret}")
+    return time.perf_counter() - start
+
+
+def bench_spawn_backends(iterations: int = 200, program: str = 'true',
+                         ballast_mb: int = 0) -> dict[SpawnBackend, float]:
+    '''
+    Return the mean time per command for every `SpawnBackend`. `ballast_mb`
+    inflates the resident set of the benchmark process, which is where the
+    fork based spawning pays the most.
+    '''
+
+    # touch every page so the ballast is actually resident
+    ballast = bytearray(ballast_mb * 1024 * 1024)
+    for offset in range(0, len(ballast), 4096):
+        ballast[offset] = 1
+
+    results = {}
+    for backend in SpawnBackend:
+        commands = [
+            CommandBuilder().program(program).spawn_backend(backend).build()
+            for _ in range(iterations)
+        ]
+        results[backend] = _time_runs(commands) / iterations
+
+    del ballast
+    return results
+
+
+def bench_shell_session(iterations: int = 200, program: str = 'true') -> dict[str, float]:
+    '''
+    Return the mean time per command when spawning a process per command and
+    when running all the commands inside a single `ShellSession`
+    '''
+
+    results = {}
+
+    commands = [CommandBuilder().program(program).build()
+                for _ in range(iterations)]
+    results['per-command'] = _time_runs(commands) / iterations
+
+    with ShellSession() as session:
+        commands = [CommandBuilder().program(program).session(session).build()
+                    for _ in range(iterations)]
+        results['shell-session'] = _time_runs(commands) / iterations
+
+    return results
+
+
+def _report(title: str, results: dict):
+    print(title)
+    for name, mean in results.items():
+        label = name.value if hasattr(name, 'value') else name
+        print(f"  {label:<16} {mean * 1e6:10.1f} us/command")
+
+
+def main():
+    '''
+    Entry point for the benchmark
+    '''
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('--program', default='true')
+    parser.add_argument('--ballast-mb', type=int, default=0,
+                        help="inflate the process RSS by this many MiB")
+    opts = parser.parse_args()
+
+    _report(f"spawn backends ({opts.iterations} x '{opts.program}', "
+            f"{opts.ballast_mb} MiB ballast)",
+            bench_spawn_backends(opts.iterations, opts.program, opts.ballast_mb))
+    _report(f"shell session ({opts.iterations} x '{opts.program}')",
+            bench_shell_session(opts.iterations, opts.program))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,29 @@
 Command wrapper
 '''
 
+import asyncio
 import os
+import signal
 import subprocess
-from copy import deepcopy
+import time
 from dataclasses import dataclass
-from io import BufferedReader
 from logging import Logger, StreamHandler
 
 from typing_extensions import Self
 
 from project_generator.lib.utils.logger import get_logger
 
+from ._deadline import (_NOT_STARTED, DEFAULT_KILL_GRACE, Deadline,
+                        _collect_deadlines, _earliest, _expired_status, _Reaper)
+from ._memo import CommandCache, _Memoization
+from ._pipeline import _run_pipeline
+from ._profiling import _has_hooks, _notify_finish, _notify_start
+from ._result import DEFAULT_CAPTURE_SIZE, CommandResult, OutputBuffer
+from ._session import ShellSession
+from ._spawn import (_READ_SIZE, SpawnBackend, _OutputLogger, _run_popen,
+                     _run_posix_spawn, _shell_argv, _spawn_environment,
+                     default_spawn_backend)
+
 lgr = get_logger(module_name="command", stream=StreamHandler())
 
 
@@ -30,6 +42,14 @@ class Command:
     buffered_logging: bool
     env: dict[str, str]
     shell: bool
+    capture_size: int
+    spawn_backend: SpawnBackend
+    session: ShellSession
+    timeout: float
+    deadline: Deadline
+    kill_grace: float
+    memo: _Memoization
+    pipe_cmd: Self
 
     def __init__(self, cmd_name="", cmd_opts: list[str] = None, cmd_args: list[str] = None, **kw):
         self.cmd_name: str = cmd_name
@@ -40,6 +60,14 @@ class Command:
         self.sub_cmd: Self = None
         self.env = None
         self.shell = False
+        self.capture_size = 0
+        self.spawn_backend = None
+        self.session = None
+        self.timeout = None
+        self.deadline = None
+        self.kill_grace = DEFAULT_KILL_GRACE
+        self.memo = None
+        self.pipe_cmd = None
 
     def programe_name(self) -> str:
         '''
@@ -62,11 +90,6 @@ class Command:
 
         cmd = []
 
-        if self.env:
-            cmd.append('/usr/bin/env')
-            for key, value in self.env.items():
-                cmd.append(f"{key}={value}")
-
         cmd.append(self.cmd_name)
 
         if self.cmd_opts is not None:
@@ -80,17 +103,113 @@ class Command:
 
         return cmd
 
+    def stages(self) -> list[Self]:
+        '''
+        Return the commands making up the pipeline started by this command
+        '''
+
+        stages = []
+        command = self
+        while command is not None:
+            stages.append(command)
+            command = command.pipe_cmd
+
+        return stages
+
+    def _memo_argv(self) -> list[str]:
+        argv = self.flatten()
+        for stage in self.stages()[1:]:
+            argv.append('|')
+            argv.extend(stage.flatten())
+        return argv
+
     def run(self) -> int:
         '''
         Run the command
         '''
 
-        return _check_call(
+        return self.execute().returncode
+
+    def execute(self) -> CommandResult:
+        '''
+        Run the command and return the detailed result, including the tail of
+        the output when capturing was requested
+        '''
+
+        if self.memo is not None:
+            return self.memo.cache.execute(
+                self._memo_argv(),
+                self._execute_uncached,
+                env=self.env,
+                env_keys=self.memo.env_keys,
+                probe=self.memo.probe
+            )
+
+        return self._execute_uncached()
+
+    def _execute_uncached(self) -> CommandResult:
+        '''
+        Run the command, bypassing the memoization
+        '''
+
+        if self.pipe_cmd is not None:
+            return _execute(
+                self.flatten(),
+                capture=self.capture_size,
+                pipeline=[(stage.flatten(), stage.env, stage.shell)
+                          for stage in self.stages()[1:]],
+                logger=self.logger,
+                env=self.env,
+                shell=self.shell,
+                timeout=self.timeout,
+                deadline=self.deadline,
+                grace=self.kill_grace
+            )
+
+        if self.session is not None:
+            return self.session.execute(
+                self.flatten(),
+                capture=self.capture_size,
+                logger=self.logger,
+                env=self.env,
+                shell=self.shell,
+                timeout=self.timeout,
+                deadline=self.deadline,
+                grace=self.kill_grace
+            )
+
+        return _execute(
             self.flatten(),
             buffered_out=self.buffered_logging,
+            capture=self.capture_size,
+            backend=self.spawn_backend,
             logger=self.logger,
             env=self.env,
-            shell=self.shell
+            shell=self.shell,
+            timeout=self.timeout,
+            deadline=self.deadline,
+            grace=self.kill_grace
+        )
+
+    async def run_async(self) -> int:
+        '''
+        Run the command without blocking the running event loop. Pipelines,
+        memoized, session and capturing commands go through `run()` on the
+        default executor of the loop.
+        '''
+
+        if (self.pipe_cmd is not None or self.memo is not None or self.session is not None
+                or self.capture_size):
+            return await asyncio.get_running_loop().run_in_executor(None, self.run)
+
+        return await _check_call_async(
+            self.flatten(),
+            logger=self.logger,
+            env=self.env,
+            shell=self.shell,
+            timeout=self.timeout,
+            deadline=self.deadline,
+            grace=self.kill_grace
         )
 
 
@@ -171,12 +290,92 @@ class CommandBuilder:
         self._command.buffered_logging = buffered
         return self
 
+    def capture_output(self, max_bytes: int = DEFAULT_CAPTURE_SIZE) -> Self:
+        '''
+        Retain the last `max_bytes` of the output in the result of `execute()`
+        '''
+
+        if max_bytes < 0:
+            raise ValueError("capture size cannot be negative")
+
+        self._command.capture_size = max_bytes
+        return self
+
+    def spawn_backend(self, backend: SpawnBackend) -> Self:
+        '''
+        Specify the mechanism used to spawn the process, overriding the global
+        default selected through `set_default_spawn_backend()`
+        '''
+
+        self._command.spawn_backend = backend
+        return self
+
+    def session(self, session: ShellSession) -> Self:
+        '''
+        Run the command inside a persistent `ShellSession` instead of spawning
+        a dedicated process for it
+        '''
+
+        self._command.session = session
+        return self
+
+    def timeout(self, seconds: float, grace: float = DEFAULT_KILL_GRACE) -> Self:
+        '''
+        Bound the run time of the command. Once `seconds` elapse the process
+        group gets SIGTERM, followed by SIGKILL after `grace` seconds.
+        '''
+
+        if seconds is not None and seconds < 0:
+            raise ValueError("timeout cannot be negative")
+
+        self._command.timeout = seconds
+        self._command.kill_grace = grace
+        return self
+
+    def deadline(self, deadline: Deadline) -> Self:
+        '''
+        Bound the command by a `Deadline`, which can be shared by a batch of
+        commands and cancelled explicitly
+        '''
+
+        self._command.deadline = deadline
+        return self
+
+    def memoize(self, cache: CommandCache, env_keys: list[str] = None, probe=None) -> Self:
+        '''
+        Remember the successful runs of this idempotent command in `cache`.
+        The key covers the flattened command, the values of the `env_keys`
+        environment variables and the outcome of `probe`, either a `Command`
+        or a callable, which is evaluated before every lookup.
+        '''
+
+        self._command.memo = _Memoization(cache, list(env_keys or []), probe)
+        return self
+
+    def pipe(self, command: Command) -> Self:
+        '''
+        Connect the stdout of the command to the stdin of `command`, appending
+        it to the pipeline. The stages are connected by OS pipes and started
+        together; `execute()` reports the exit code of every stage in
+        `pipestatus` and the rightmost failure as the return code. The output
+        options, timeout and deadline of the first command apply to the whole
+        pipeline, while every stage keeps its own environment. Pipelines are
+        always spawned directly, without going through a shell session.
+        '''
+
+        tail = self._command
+        while tail.pipe_cmd is not None:
+            tail = tail.pipe_cmd
+        tail.pipe_cmd = command
+        return self
+
     def env_vars(self, env: dict[str, str]) -> Self:
         '''
-        Specify the environment variables for this command
+        Specify the environment variables for this command. They are layered
+        on top of the process environment when the command is spawned.
         '''
 
-        self._command.env = deepcopy(env)
+        self._command.env = dict(env)
         return self
 
     def invoke_shell(self, shell: bool = False) -> Self:
@@ -199,8 +398,21 @@ def _check_call(*args, buffered_out: bool = True, **kw_args) -> int:
     '''
     Wrapper to intercept and forward the call to subprocess module
     '''
+    return _execute(*args, buffered_out=buffered_out, **kw_args).returncode
+
+
+def _execute(*args, buffered_out: bool = True, capture: int = 0,
+             backend: SpawnBackend = None, pipeline: list = None,
+             **kw_args) -> CommandResult:
+    '''
+    Run the command and return its `CommandResult`. With a non-zero `capture`,
+    the last `capture` bytes of the combined stdout/stderr are retained.
+    `backend` defaults to the globally selected `SpawnBackend`. The process
+    group is torn down once `timeout` seconds elapse or `deadline` expires.
+    `pipeline` lists further `(argv, env, shell)` stages fed by the command.
+    '''
     logger = lgr
-    env = deepcopy(os.environ)
+    env = None
     use_shell = False
 
     if kw_args:
@@ -208,42 +420,62 @@ def _check_call(*args, buffered_out: bool = True, **kw_args) -> int:
         if _logger is not None:
             logger = _logger
 
-        _env = kw_args.get('env', None)
-        if _env is not None:
-            env.update(_env)
+        env = kw_args.get('env', None)
 
         use_shell = kw_args.get('shell', False)
 
     logger.debug("Command: %s", *args)
     # logger.debug("Environment: %s", env)
 
-    ret = 0
+    argv = list(*args)
+    result = CommandResult(args=argv, returncode=0)
+    output = OutputBuffer(capture) if capture > 0 else None
+
+    if pipeline:
+        result.args = list(argv)
+        for stage_argv, _, _ in pipeline:
+            result.args.append('|')
+            result.args.extend(stage_argv)
+
+    deadlines = _collect_deadlines(kw_args.get('timeout', None),
+                                   kw_args.get('deadline', None))
+    grace = kw_args.get('grace', DEFAULT_KILL_GRACE)
+
+    expired = _earliest(deadlines)
+    if expired is not None and expired.expired:
+        result.status = _expired_status(expired)
+        result.returncode = _NOT_STARTED[result.status]
+        logger.debug("(%s) - Not started, deadline %s",
+                     argv[0], result.status.value)
+        return result
+
+    if backend is None:
+        backend = default_spawn_backend()
+
+    start = time.time()
+    started = time.perf_counter()
+    _notify_start(result.args)
 
     try:
-        stdout_file = subprocess.PIPE
-        stderr_file = subprocess.STDOUT
-
-        with subprocess.Popen(
-            *args,
-            env=env,
-            stdout=stdout_file,
-            stderr=stderr_file,
-            shell=use_shell,
-        ) as process:
-            if process.stdout is not None:
-                with process.stdout as out:
-                    if not buffered_out:
-                        reader = out
-                    else:
-                        reader = BufferedReader(out)
-                    for line in iter(reader.readline, b''):
-                        logger.debug(
-                            "(%s) - %s", process.args[0], line.decode('utf-8').strip())
-                    process.stdout.flush()
-
-                ret = process.wait()
-                logger.debug("(%s) - Process returned %d",
-                             process.args[0], ret)
+        if pipeline:
+            outcome = _run_pipeline(
+                [(argv, env, use_shell), *pipeline], output, logger, deadlines, grace)
+        elif backend == SpawnBackend.POSIX_SPAWN:
+            outcome = _run_posix_spawn(
+                argv, env, use_shell, output, logger, deadlines, grace)
+        else:
+            outcome = _run_popen(
+                argv, env, use_shell, buffered_out, output, logger, deadlines, grace)
+
+        result.returncode = outcome.returncode
+        result.status = outcome.status
+        result.output_bytes = outcome.output_bytes
+        result.user_time = outcome.user_time
+        result.system_time = outcome.system_time
+        result.max_rss = outcome.max_rss
+        result.pipestatus = outcome.pipestatus
+        logger.debug("(%s) - Process returned %d (%s)",
+                     argv[0], result.returncode, result.status.value)
 
     except FileNotFoundError as exec_err:
         logger.debug(
@@ -251,7 +483,7 @@ def _check_call(*args, buffered_out: bool = True, **kw_args) -> int:
             exec_err.filename,
             exec_err.errno,
         )
-        ret = exec_err.errno
+        result.returncode = exec_err.errno
 
     except subprocess.CalledProcessError as run_err:
         logger.debug(
@@ -260,6 +492,121 @@ def _check_call(*args, buffered_out: bool = True, **kw_args) -> int:
             run_err.returncode,
             run_err.output,
         )
-        ret = run_err.returncode
+        result.returncode = run_err.returncode
+
+    if output is not None:
+        result.output = output.tail()
+        result.truncated = output.truncated
+
+    result.wall_time = time.perf_counter() - started
+    _notify_finish(result, start)
+
+    return result
+
+
+async def _check_call_async(*args, **kw_args) -> int:
+    '''
+    Asynchronous counterpart of `_check_call` built on top of asyncio subprocesses
+    '''
+    logger = lgr
+    env = None
+    use_shell = False
+
+    if kw_args:
+        _logger = kw_args.get('logger', None)
+        if _logger is not None:
+            logger = _logger
+
+        env = kw_args.get('env', None)
+
+        use_shell = kw_args.get('shell', False)
+
+    logger.debug("Command: %s", *args)
+
+    argv = list(*args)
+    if use_shell:
+        argv = _shell_argv(argv)
+
+    deadlines = _collect_deadlines(kw_args.get('timeout', None),
+                                   kw_args.get('deadline', None))
+    grace = kw_args.get('grace', DEFAULT_KILL_GRACE)
+
+    expired = _earliest(deadlines)
+    if expired is not None and expired.expired:
+        return _NOT_STARTED[_expired_status(expired)]
+
+    ret = 0
+    reaper = None
+    output_bytes = 0
+
+    start = time.time()
+    started = time.perf_counter()
+    _notify_start(argv)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            env=_spawn_environment(env),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=bool(deadlines),
+        )
+
+        watchdog = None
+        if deadlines:
+            reaper = _Reaper(process.pid, deadlines, grace, logger)
+            watchdog = asyncio.ensure_future(_watch_async(process, reaper))
+
+        try:
+            # read in chunks instead of `readline()`, so that overly long lines
+            # do not trip the stream reader limit
+            out_logger = _OutputLogger(logger, argv[0])
+            while True:
+                chunk = await process.stdout.read(_READ_SIZE)
+                if not chunk:
+                    break
+                output_bytes += len(chunk)
+                out_logger.feed(chunk)
+            out_logger.flush()
+
+            ret = await process.wait()
+        except asyncio.CancelledError:
+            # the awaiting task got cancelled, do not leave the process behind
+            if process.returncode is None:
+                if deadlines:
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+        logger.debug("(%s) - Process returned %d", argv[0], ret)
+
+    except FileNotFoundError as exec_err:
+        logger.debug(
+            "Failed to find executable '%s'. Process returned '%d'.",
+            exec_err.filename,
+            exec_err.errno,
+        )
+        ret = exec_err.errno
+
+    if _has_hooks():
+        # asyncio reaps the child itself, so its rusage is not available
+        result = CommandResult(args=argv, returncode=ret, output_bytes=output_bytes,
+                               wall_time=time.perf_counter() - started)
+        if reaper is not None:
+            result.status = reaper.status
+        _notify_finish(result, start)
 
     return ret
+
+
+async def _watch_async(process: asyncio.subprocess.Process, reaper: _Reaper):
+    '''
+    Enforce the reaper deadlines on an asyncio subprocess
+    '''
+
+    while process.returncode is None:
+        await asyncio.sleep(reaper.check())
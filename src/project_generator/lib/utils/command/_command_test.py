@@ -2,10 +2,26 @@
 Unit tests for command package
 '''
 
+import asyncio
+import errno
+import json
 import os
+import signal
+import tempfile
+import threading
+import time
 import unittest
 
 from ._command import Command, CommandBuilder
+from ._deadline import Deadline
+from ._environment import Environment
+from ._memo import CommandCache
+from ._profiling import (ChromeTraceSink, JsonLinesSink, MemoryCollector,
+                         install_hook, remove_hook)
+from ._result import CommandStatus, OutputBuffer
+from ._scheduler import CommandScheduler
+from ._session import ShellSession
+from ._spawn import SpawnBackend, default_spawn_backend, set_default_spawn_backend
 
 
 class TestCommandBuilder(unittest.TestCase):
@@ -70,20 +86,802 @@ class TestCommandBuilder(unittest.TestCase):
             }) \
             .build()
 
-        self.assertEqual(cmd.flatten(), [
-            '/usr/bin/env',
-            'GOPATH=/usr/local/lib/go',
-            'GOROOT=/usr/local/sdks/go',
-            f"PATH={os.getenv('PATH')}:/usr/local/sdks/go/bin",
-            'go',
-            'env'
-        ])
+        self.assertEqual(cmd.flatten(), ['go', 'env'])
+        self.assertEqual(cmd.env['GOROOT'], '/usr/local/sdks/go')
 
         if os.path.exists('/usr/local/sdks/go/bin/go'):
             self.assertEqual(cmd.run(), 0)
         else:
             self.assertEqual(cmd.run(), 2)
 
+    def test_cmd_env_overlay(self):
+        '''
+        Test that the environment overlay reaches the spawned process
+        '''
+
+        cmd = CommandBuilder() \
+            .program('sh') \
+            .option('-c') \
+            .arg('test "$PROJGEN_TEST_VAR" = overlay && test -n "$PATH"') \
+            .env_vars({'PROJGEN_TEST_VAR': 'overlay'}) \
+            .build()
+
+        self.assertEqual(cmd.run(), 0)
+        self.assertNotIn('PROJGEN_TEST_VAR', os.environ)
+
+
+class TestEnvironment(unittest.TestCase):
+    '''
+    Test suite for `Environment`
+    '''
+
+    def test_overlay(self):
+        '''
+        Test the lookup and merge order of the layers
+        '''
+
+        base = Environment({'A': '1', 'B': '2'})
+        env = base.overlay({'B': '3'}).overlay({'C': '4'})
+
+        self.assertEqual(env['A'], '1')
+        self.assertEqual(env['B'], '3')
+        self.assertEqual(len(env), 3)
+        self.assertEqual(env.materialize(), {'A': '1', 'B': '3', 'C': '4'})
+        self.assertEqual(base.materialize(), {'A': '1', 'B': '2'})
+
+    def test_inherit(self):
+        '''
+        Test that an empty overlay keeps inheriting the process environment
+        '''
+
+        self.assertIsNone(Environment.inherit().materialize())
+        self.assertIsNone(Environment.inherit().overlay({}).materialize())
+        self.assertEqual(
+            Environment.inherit().overlay({'X': 'y'}).materialize()['X'], 'y')
+
+
+class TestOutputCapture(unittest.TestCase):
+    '''
+    Test suite for output capturing through `Command.execute()`
+    '''
+
+    def test_ring_buffer(self):
+        '''
+        Test that the ring buffer keeps only the most recent bytes
+        '''
+
+        buf = OutputBuffer(8)
+        buf.write(b'abcde')
+        self.assertEqual(bytes(buf.tail()), b'abcde')
+        self.assertFalse(buf.truncated)
+
+        buf.write(b'fghij')
+        self.assertEqual(bytes(buf.tail()), b'cdefghij')
+        self.assertTrue(buf.truncated)
+
+        buf.write(b'0123456789')
+        self.assertEqual(bytes(buf.tail()), b'23456789')
+        self.assertEqual(buf.total_bytes, 20)
+
+        buf = OutputBuffer(8)
+        buf.write(b'abc')
+        buf.write(b'defgh')
+        self.assertEqual(bytes(buf.tail()), b'abcdefgh')
+        buf.write(b'i')
+        self.assertEqual(bytes(buf.tail()), b'bcdefghi')
+
+    def test_ring_buffer_growth(self):
+        '''
+        Test that the buffer only grows with the output
+        '''
+
+        buf = OutputBuffer()
+        buf.write(b'go1.22.1\n')
+        self.assertEqual(bytes(buf.tail()), b'go1.22.1\n')
+        self.assertLess(len(buf.tail().obj), 1024)
+
+    def test_capture_tail(self):
+        '''
+        Test that only the tail of a large output is retained
+        '''
+
+        cmd = CommandBuilder() \
+            .program("seq") \
+            .arg("100000") \
+            .capture_output(16) \
+            .build()
+        result = cmd.execute()
+
+        self.assertEqual(result.returncode, 0)
+        self.assertIsInstance(result.output, memoryview)
+        self.assertEqual(result.text(), "99998\n99999\n100000\n"[-16:])
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.output_bytes, len(
+            "".join(f"{i}\n" for i in range(1, 100001))))
+
+    def test_capture_failure(self):
+        '''
+        Test that the output of a failed command is kept for inspection
+        '''
+
+        cmd = CommandBuilder() \
+            .program("ls") \
+            .arg("/nonexistent/path") \
+            .capture_output() \
+            .build()
+        result = cmd.execute()
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("/nonexistent/path", result.text())
+
+    def test_no_capture(self):
+        '''
+        Test that no output is retained by default
+        '''
+
+        result = CommandBuilder().program("ls").build().execute()
+        self.assertEqual(result.returncode, 0)
+        self.assertIsNone(result.output)
+
+
+class TestPosixSpawnBackend(unittest.TestCase):
+    '''
+    Test suite for the `posix_spawn` based backend
+    '''
+
+    @staticmethod
+    def _builder() -> CommandBuilder:
+        return CommandBuilder().spawn_backend(SpawnBackend.POSIX_SPAWN)
+
+    def test_return_codes(self):
+        '''
+        Test that return codes match the `subprocess.Popen` backend
+        '''
+
+        for argv in (["true"], ["false"], ["/nonexistent/program"],
+                     ["sh", "-c", "exit 3"], ["sh", "-c", "kill -TERM $$"],
+                     ["sh", "-c", "kill -PIPE $$"]):
+            popen_cmd = Command(argv[0], None, argv[1:])
+            spawn_cmd = Command(argv[0], None, argv[1:])
+            spawn_cmd.spawn_backend = SpawnBackend.POSIX_SPAWN
+            self.assertEqual(spawn_cmd.run(), popen_cmd.run(), argv)
+
+    def test_capture_and_env(self):
+        '''
+        Test output capture and environment overlay through `posix_spawn`
+        '''
+
+        result = self._builder() \
+            .program("sh") \
+            .option("-c") \
+            .arg('echo "$PROJGEN_TEST_VAR"; echo err >&2') \
+            .env_vars({'PROJGEN_TEST_VAR': 'spawned'}) \
+            .capture_output() \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.text(), "spawned\nerr\n")
+
+    def test_default_backend(self):
+        '''
+        Test the selection of the global default backend
+        '''
+
+        previous = default_spawn_backend()
+        try:
+            set_default_spawn_backend(SpawnBackend.POSIX_SPAWN)
+            self.assertEqual(CommandBuilder().program("ls").build().run(), 0)
+        finally:
+            set_default_spawn_backend(previous)
+
+
+class TestShellSession(unittest.TestCase):
+    '''
+    Test suite for `ShellSession`
+    '''
+
+    def test_session_commands(self):
+        '''
+        Test return codes and output of consecutive commands in one session
+        '''
+
+        with ShellSession() as session:
+            def _cmd(program: str, *args: str) -> CommandBuilder:
+                return CommandBuilder() \
+                    .program(program) \
+                    .args(list(args)) \
+                    .session(session) \
+                    .capture_output()
+
+            result = _cmd("printf", "no newline").build().execute()
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual(result.text(), "no newline")
+
+            result = _cmd("sh", "-c", "echo out; echo err >&2; exit 5") \
+                .build().execute()
+            self.assertEqual(result.returncode, 5)
+            self.assertEqual(result.text(), "out\nerr\n")
+
+            result = _cmd("sh", "-c", 'echo "$PROJGEN_TEST_VAR"') \
+                .env_vars({'PROJGEN_TEST_VAR': "it's quoted"}) \
+                .build().execute()
+            self.assertEqual(result.text(), "it's quoted\n")
+
+            result = _cmd("sh", "-c", 'echo "${PROJGEN_TEST_VAR:-unset}"') \
+                .build().execute()
+            self.assertEqual(result.text(), "unset\n")
+
+            self.assertEqual(_cmd("seq", "20000").build().execute().text()
+                             .splitlines()[-1], "20000")
+            self.assertTrue(session.alive)
+
+        self.assertFalse(session.alive)
+
+    def test_session_return_codes(self):
+        '''
+        Test that return codes match the per-command spawning
+        '''
+
+        with ShellSession() as session:
+            for argv in (["true"], ["false"], ["/nonexistent/program"],
+                         ["sh", "-c", "kill -TERM $$"]):
+                cmd = Command(argv[0], None, argv[1:])
+                expected = cmd.run()
+                cmd.session = session
+                self.assertEqual(cmd.run(), expected, argv)
+
+    def test_session_environment(self):
+        '''
+        Test that only the overlay of an environment is passed to the command
+        '''
+
+        with ShellSession() as session:
+            env = Environment.inherit().overlay({'PROJGEN_TEST_VAR': 'overlay'})
+            script = session._script(["sh", "-c", 'echo "$PROJGEN_TEST_VAR"'], env, False)
+            self.assertIn(b"env PROJGEN_TEST_VAR=overlay sh", script)
+            self.assertNotIn(b"PATH=", script)
+
+            cmd = CommandBuilder() \
+                .program("sh") \
+                .args(["-c", 'echo "$PROJGEN_TEST_VAR"']) \
+                .session(session) \
+                .capture_output() \
+                .build()
+            cmd.env = env
+            self.assertEqual(cmd.execute().text(), "overlay\n")
+
+
+class TestCommandTimeout(unittest.TestCase):
+    '''
+    Test suite for command timeouts and cancellation
+    '''
+
+    def test_timeout_teardown(self):
+        '''
+        Test that the whole process group is terminated on timeout
+        '''
+
+        for backend in SpawnBackend:
+            start = time.monotonic()
+            result = CommandBuilder() \
+                .program("sh") \
+                .option("-c") \
+                .arg("sleep 30 & sleep 30; echo unreachable") \
+                .spawn_backend(backend) \
+                .timeout(0.3, grace=1) \
+                .capture_output() \
+                .build() \
+                .execute()
+
+            self.assertEqual(result.status, CommandStatus.TIMED_OUT, backend)
+            self.assertEqual(result.returncode, -signal.SIGTERM, backend)
+            self.assertNotIn("unreachable", result.text())
+            self.assertLess(time.monotonic() - start, 3)
+
+    def test_kill_after_grace(self):
+        '''
+        Test the escalation to SIGKILL when SIGTERM is ignored
+        '''
+
+        result = CommandBuilder() \
+            .program("sh") \
+            .option("-c") \
+            .arg("trap '' TERM; sleep 30") \
+            .timeout(0.2, grace=0.3) \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.status, CommandStatus.TIMED_OUT)
+        self.assertEqual(result.returncode, -signal.SIGKILL)
+
+    def test_completes_within_timeout(self):
+        '''
+        Test that a quick command is unaffected by its timeout
+        '''
+
+        result = CommandBuilder().program("true").timeout(10).build().execute()
+        self.assertTrue(result.completed)
+        self.assertEqual(result.returncode, 0)
+
+    def test_shared_deadline_cancel(self):
+        '''
+        Test cancelling a batch of commands through a shared deadline
+        '''
+
+        deadline = Deadline()
+        cmd = CommandBuilder() \
+            .program("sleep") \
+            .arg("30") \
+            .deadline(deadline) \
+            .build()
+
+        threading.Timer(0.2, deadline.cancel).start()
+        result = cmd.execute()
+        self.assertEqual(result.status, CommandStatus.CANCELLED)
+
+        result = cmd.execute()
+        self.assertEqual(result.status, CommandStatus.CANCELLED)
+        self.assertEqual(result.returncode, errno.ECANCELED)
+
+    def test_session_timeout(self):
+        '''
+        Test that a timed out command restarts the shell session
+        '''
+
+        with ShellSession() as session:
+            result = CommandBuilder() \
+                .program("sleep") \
+                .arg("30") \
+                .session(session) \
+                .timeout(0.2, grace=1) \
+                .build() \
+                .execute()
+            self.assertEqual(result.status, CommandStatus.TIMED_OUT)
+
+            cmd = CommandBuilder().program("true").session(session).build()
+            self.assertEqual(cmd.run(), 0)
+
+    def test_async_timeout(self):
+        '''
+        Test the timeout on the asyncio path
+        '''
+
+        cmd = CommandBuilder().program("sleep").arg("30").timeout(0.2).build()
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(cmd.run_async()), -signal.SIGTERM)
+        self.assertLess(time.monotonic() - start, 3)
+
+
+class TestCommandMemoization(unittest.TestCase):
+    '''
+    Test suite for command memoization
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cache = CommandCache(self._tmpdir.name)
+        self.marker = os.path.join(self._tmpdir.name, 'runs')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _counting_cmd(self, **kw) -> CommandBuilder:
+        return CommandBuilder() \
+            .program("sh") \
+            .option("-c") \
+            .arg(f"echo run >> {self.marker}; echo done") \
+            .capture_output() \
+            .memoize(self.cache, **kw)
+
+    def _runs(self) -> int:
+        with open(self.marker, encoding='utf-8') as marker:
+            return len(marker.readlines())
+
+    def test_memoized_run(self):
+        '''
+        Test that a successful run is only executed once
+        '''
+
+        first = self._counting_cmd().build().execute()
+        second = self._counting_cmd().build().execute()
+
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.returncode, 0)
+        self.assertEqual(second.text(), "done\n")
+        self.assertEqual(self._runs(), 1)
+
+    def test_key_inputs(self):
+        '''
+        Test that the environment and the probe are part of the key
+        '''
+
+        state = {'version': '1'}
+
+        def _probe():
+            return state['version']
+
+        self._counting_cmd(env_keys=['PROJGEN_MEMO'], probe=_probe) \
+            .env_vars({'PROJGEN_MEMO': 'a'}).build().execute()
+        self._counting_cmd(env_keys=['PROJGEN_MEMO'], probe=_probe) \
+            .env_vars({'PROJGEN_MEMO': 'b'}).build().execute()
+        self.assertEqual(self._runs(), 2)
+
+        state['version'] = '2'
+        result = self._counting_cmd(env_keys=['PROJGEN_MEMO'], probe=_probe) \
+            .env_vars({'PROJGEN_MEMO': 'b'}).build().execute()
+        self.assertFalse(result.cached)
+        self.assertEqual(self._runs(), 3)
+
+    def test_key_own_env(self):
+        '''
+        Test that the environment of the command is part of the key, without
+        listing it in `env_keys`
+        '''
+
+        def _echo(value: str):
+            return CommandBuilder() \
+                .program("sh") \
+                .options(["-c", 'echo "$PROJGEN_MEMO"']) \
+                .env_vars({'PROJGEN_MEMO': value}) \
+                .capture_output() \
+                .memoize(self.cache) \
+                .build() \
+                .execute()
+
+        self.assertEqual(_echo('a').text(), "a\n")
+        result = _echo('b')
+        self.assertFalse(result.cached)
+        self.assertEqual(result.text(), "b\n")
+        self.assertTrue(_echo('b').cached)
+
+    def test_failure_not_memoized(self):
+        '''
+        Test that failed runs are executed again
+        '''
+
+        cmd = CommandBuilder().program("false").memoize(self.cache).build()
+        self.assertEqual(cmd.run(), 1)
+        self.assertFalse(cmd.execute().cached)
+
+    def test_ttl(self):
+        '''
+        Test that expired entries are not used
+        '''
+
+        self.cache = CommandCache(self._tmpdir.name, ttl=0)
+        self._counting_cmd().build().execute()
+        time.sleep(0.01)
+        self.assertFalse(self._counting_cmd().build().execute().cached)
+
+
+class TestCommandPipeline(unittest.TestCase):
+    '''
+    Test suite for pipelines of commands
+    '''
+
+    @staticmethod
+    def _sh(script: str) -> CommandBuilder:
+        return CommandBuilder().program("sh").option("-c").arg(script)
+
+    def test_pipe(self):
+        '''
+        Test that the stages are connected and report their exit codes
+        '''
+
+        cmd = CommandBuilder() \
+            .program("echo") \
+            .arg("hello") \
+            .pipe(CommandBuilder().program("tr").args(["a-z", "A-Z"]).build()) \
+            .pipe(CommandBuilder().program("rev").build()) \
+            .capture_output() \
+            .build()
+        result = cmd.execute()
+
+        self.assertEqual(len(cmd.stages()), 3)
+        self.assertEqual(result.args, ["echo", "hello", "|", "tr", "a-z", "A-Z", "|", "rev"])
+        self.assertEqual(result.text(), "OLLEH\n")
+        self.assertEqual(result.pipestatus, [0, 0, 0])
+        self.assertEqual(result.returncode, 0)
+
+    def test_sigpipe(self):
+        '''
+        Test that an upstream stage is killed by SIGPIPE once the downstream
+        stage exits
+        '''
+
+        result = CommandBuilder() \
+            .program("yes") \
+            .pipe(CommandBuilder().program("head").args(["-n", "1"]).build()) \
+            .capture_output() \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.text(), "y\n")
+        self.assertEqual(result.pipestatus, [-signal.SIGPIPE, 0])
+
+    def test_pipefail(self):
+        '''
+        Test that the rightmost failure becomes the return code
+        '''
+
+        result = self._sh("echo data; exit 3") \
+            .pipe(self._sh("cat >/dev/null; exit 4").build()) \
+            .pipe(CommandBuilder().program("cat").build()) \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.pipestatus, [3, 4, 0])
+        self.assertEqual(result.returncode, 4)
+
+    def test_stream_between_stages(self):
+        '''
+        Test that the data between the stages never reaches the parent, while
+        the stderr of every stage does
+        '''
+
+        result = self._sh("echo stage1 >&2; head -c 10000000 /dev/zero") \
+            .pipe(self._sh("wc -c | tr -d ' '; echo stage2 >&2").build()) \
+            .capture_output() \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(sorted(result.text().split()), ["10000000", "stage1", "stage2"])
+        self.assertLess(result.output_bytes, 100)
+
+    def test_stage_env(self):
+        '''
+        Test that every stage is spawned with its own environment
+        '''
+
+        result = self._sh("echo $PROJGEN_STAGE") \
+            .env_vars({'PROJGEN_STAGE': 'one'}) \
+            .pipe(self._sh("cat; echo $PROJGEN_STAGE")
+                  .env_vars({'PROJGEN_STAGE': 'two'}).build()) \
+            .capture_output() \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.text(), "one\ntwo\n")
+
+    def test_missing_stage(self):
+        '''
+        Test that a missing program fails the pipeline before spawning
+        '''
+
+        result = CommandBuilder() \
+            .program("echo") \
+            .pipe(CommandBuilder().program("nonexistent-projgen-cmd").build()) \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.returncode, errno.ENOENT)
+        self.assertIsNone(result.pipestatus)
+
+    def test_pipeline_timeout(self):
+        '''
+        Test that a timeout tears down every stage of the pipeline
+        '''
+
+        started = time.monotonic()
+        result = CommandBuilder() \
+            .program("sleep") \
+            .arg("10") \
+            .pipe(CommandBuilder().program("cat").build()) \
+            .timeout(0.2, grace=0.5) \
+            .build() \
+            .execute()
+
+        self.assertEqual(result.status, CommandStatus.TIMED_OUT)
+        self.assertEqual(result.pipestatus, [-signal.SIGTERM, -signal.SIGTERM])
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class TestCommandProfiling(unittest.TestCase):
+    '''
+    Test suite for resource accounting and profiling hooks
+    '''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _profiled(self, hook, *commands: Command):
+        install_hook(hook)
+        try:
+            for command in commands:
+                command.run()
+        finally:
+            remove_hook(hook)
+
+    def test_resource_usage(self):
+        '''
+        Test that the result reports the resources consumed by the command
+        '''
+
+        for backend in SpawnBackend:
+            result = CommandBuilder() \
+                .program("sh") \
+                .option("-c") \
+                .arg("i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done; echo done") \
+                .spawn_backend(backend) \
+                .build() \
+                .execute()
+
+            self.assertEqual(result.returncode, 0)
+            self.assertGreater(result.wall_time, 0)
+            self.assertGreater(result.user_time + result.system_time, 0)
+            self.assertGreater(result.max_rss, 0)
+            self.assertEqual(result.output_bytes, len("done\n"))
+
+    def test_memory_collector(self):
+        '''
+        Test that the hooks observe every run, including session runs
+        '''
+
+        collector = MemoryCollector()
+        with ShellSession() as session:
+            self._profiled(
+                collector,
+                CommandBuilder().program("true").build(),
+                CommandBuilder().program("false").build(),
+                CommandBuilder().program("true").session(session).build(),
+            )
+
+        self.assertEqual([r.args for r in collector.records],
+                         [["true"], ["false"], ["true"]])
+        self.assertEqual([r.returncode for r in collector.records], [0, 1, 0])
+        self.assertIsNotNone(collector.records[0].user_time)
+        self.assertIsNone(collector.records[2].user_time)
+        self.assertEqual(len(collector.top(2)), 2)
+
+        # removed hooks are no longer notified
+        CommandBuilder().program("true").build().run()
+        self.assertEqual(len(collector.records), 3)
+
+    def test_sinks(self):
+        '''
+        Test the JSON lines and the Chrome trace outputs
+        '''
+
+        jsonl_path = os.path.join(self._tmpdir.name, 'runs.jsonl')
+        trace_path = os.path.join(self._tmpdir.name, 'trace.json')
+        jsonl, trace = JsonLinesSink(jsonl_path), ChromeTraceSink(trace_path)
+
+        install_hook(trace)
+        try:
+            self._profiled(jsonl,
+                           CommandBuilder().program("echo").arg("hi").build(),
+                           CommandBuilder().program("true").build())
+        finally:
+            remove_hook(trace)
+
+        with open(jsonl_path, encoding='utf-8') as jsonl_file:
+            records = [json.loads(line) for line in jsonl_file]
+        self.assertEqual([r['args'] for r in records], [["echo", "hi"], ["true"]])
+        self.assertEqual(records[0]['output_bytes'], 3)
+
+        with open(trace_path, encoding='utf-8') as trace_file:
+            # the trace is left unterminated, as allowed by the format
+            events = json.loads(trace_file.read().rstrip().rstrip(',') + ']')
+        self.assertEqual([e['name'] for e in events], ["echo", "true"])
+        self.assertTrue(all(e['ph'] == 'X' and e['dur'] > 0 for e in events))
+
+
+class TestCommandAsync(unittest.TestCase):
+    '''
+    Test suite for `Command.run_async()`
+    '''
+
+    def test_run_async(self):
+        '''
+        Test a single command run on the event loop
+        '''
+
+        cmd = CommandBuilder().program("ls").build()
+        self.assertEqual(asyncio.run(cmd.run_async()), 0)
+
+    def test_run_async_missing_program(self):
+        '''
+        Test that a missing executable maps to the same return code as `run()`
+        '''
+
+        cmd = CommandBuilder().program("/nonexistent/program").build()
+        self.assertEqual(asyncio.run(cmd.run_async()), cmd.run())
+
+    def test_run_async_pipeline(self):
+        '''
+        Test that a pipeline runs off the event loop with its pipefail status
+        '''
+
+        cmd = CommandBuilder() \
+            .program("echo") \
+            .arg("hello") \
+            .pipe(CommandBuilder().program("sh").options(["-c", "cat; exit 3"]).build()) \
+            .capture_output() \
+            .build()
+        self.assertEqual(asyncio.run(cmd.run_async()), 3)
+
+    def test_run_async_concurrent(self):
+        '''
+        Test that multiple commands overlap on the same event loop
+        '''
+
+        cmds = [
+            CommandBuilder().program("sleep").arg("0.5").build()
+            for _ in range(4)
+        ]
+
+        async def _run_all():
+            return await asyncio.gather(*[cmd.run_async() for cmd in cmds])
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(_run_all()), [0, 0, 0, 0])
+        self.assertLess(time.monotonic() - start, 1.5)
+
+
+class TestCommandScheduler(unittest.TestCase):
+    '''
+    Test suite for `CommandScheduler`
+    '''
+
+    @staticmethod
+    def _sleep(secs: str) -> Command:
+        return CommandBuilder().program("sleep").arg(secs).build()
+
+    def test_independent_branches(self):
+        '''
+        Test that independent branches run concurrently
+        '''
+
+        report = CommandScheduler(max_workers=4) \
+            .add("a", self._sleep("0.4")) \
+            .add("b", self._sleep("0.4")) \
+            .add("c", self._sleep("0.1"), depends_on=["a"]) \
+            .run()
+
+        self.assertEqual(report.returncode, 0)
+        self.assertEqual(set(report.timings), {"a", "b", "c"})
+        self.assertEqual(report.critical_path, ["a", "c"])
+        self.assertGreaterEqual(
+            report.timings["c"].start, report.timings["a"].end)
+        self.assertLess(report.wall_time, 0.8)
+
+    def test_failure_skips_dependents(self):
+        '''
+        Test that dependents of a failed node are skipped
+        '''
+
+        report = CommandScheduler(max_workers=2) \
+            .add("fail", CommandBuilder().program("false").build()) \
+            .add("after", self._sleep("0"), depends_on=["fail"]) \
+            .add("last", self._sleep("0"), depends_on=["after"]) \
+            .add("other", self._sleep("0")) \
+            .run()
+
+        self.assertEqual(report.failed, ["fail"])
+        self.assertEqual(sorted(report.skipped), ["after", "last"])
+        self.assertIn("other", report.timings)
+        self.assertEqual(report.returncode, 1)
+
+    def test_invalid_graph(self):
+        '''
+        Test the validation of unknown dependencies and cycles
+        '''
+
+        with self.assertRaises(ValueError):
+            CommandScheduler().add("a", self._sleep("0"), ["missing"]).run()
+
+        with self.assertRaises(ValueError):
+            CommandScheduler() \
+                .add("a", self._sleep("0"), ["b"]) \
+                .add("b", self._sleep("0"), ["a"]) \
+                .run()
+
 
 if __name__ == '__main__':
     unittest.main()
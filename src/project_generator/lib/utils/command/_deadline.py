@@ -0,0 +1,169 @@
+'''
+Deadlines and cancellation for running commands
+'''
+
+import errno
+import os
+import signal
+import time
+from logging import Logger
+
+from ._result import CommandStatus
+
+DEFAULT_KILL_GRACE = 5.0
+
+# upper bound on how long a wait blocks without re-checking the deadlines, so
+# that a `Deadline.cancel()` from another thread is noticed promptly
+_POLL_INTERVAL = 0.1
+
+# return codes of commands whose deadline expired before they were started
+_NOT_STARTED = {
+    CommandStatus.TIMED_OUT: errno.ETIMEDOUT,
+    CommandStatus.CANCELLED: errno.ECANCELED,
+}
+
+
+class Deadline:
+    '''
+    A point in time after which running commands are torn down.
+
+    A single instance can be shared by several commands to bound a whole
+    batch, and `cancel()` expires it immediately, cancelling every command
+    still running under it.
+    '''
+
+    __slots__ = ('_expiry', '_cancelled')
+
+    def __init__(self, timeout: float = None):
+        self._expiry = None if timeout is None else time.monotonic() + timeout
+        self._cancelled = False
+
+    def remaining(self) -> float | None:
+        '''
+        Seconds left before expiry, `None` for a deadline without a time bound
+        '''
+
+        if self._cancelled:
+            return 0.0
+        if self._expiry is None:
+            return None
+        return max(0.0, self._expiry - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        '''
+        Whether the deadline has passed or was cancelled
+        '''
+        return self.remaining() == 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        '''
+        Whether the deadline was cancelled explicitly
+        '''
+        return self._cancelled
+
+    def cancel(self):
+        '''
+        Expire the deadline immediately
+        '''
+        self._cancelled = True
+
+
+def _collect_deadlines(timeout: float = None, deadline: Deadline = None) -> list[Deadline]:
+    '''
+    Combine a per-command timeout and a shared deadline into a list
+    '''
+
+    deadlines = []
+    if timeout is not None:
+        deadlines.append(Deadline(timeout))
+    if deadline is not None:
+        deadlines.append(deadline)
+    return deadlines
+
+
+def _earliest(deadlines: list[Deadline]) -> Deadline | None:
+    '''
+    Return the deadline expiring first, cancelled ones taking precedence
+    '''
+
+    earliest = None
+    for deadline in deadlines:
+        if deadline is None:
+            continue
+        remaining = deadline.remaining()
+        if remaining is None:
+            continue
+        if earliest is None or remaining < earliest.remaining():
+            earliest = deadline
+    return earliest
+
+
+def _expired_status(deadline: Deadline) -> CommandStatus:
+    return CommandStatus.CANCELLED if deadline.cancelled else CommandStatus.TIMED_OUT
+
+
+class _Reaper:
+    '''
+    Enforce deadlines on a spawned process group: SIGTERM once a deadline
+    expires, then SIGKILL after the grace period
+    '''
+
+    __slots__ = ('_pgid', '_deadlines', '_grace', '_logger', '_kill_at',
+                 '_abandon_at', 'status')
+
+    def __init__(self, pgid: int, deadlines: list[Deadline], grace: float, logger: Logger):
+        self._pgid = pgid
+        self._deadlines = deadlines
+        self._grace = grace
+        self._logger = logger
+        self._kill_at: float = None
+        self._abandon_at: float = None
+        self.status = CommandStatus.COMPLETED
+
+    def _signal(self, signum: int):
+        try:
+            os.killpg(self._pgid, signum)
+        except ProcessLookupError:
+            pass
+
+    def check(self) -> float:
+        '''
+        Escalate the teardown when due and return the seconds until the next
+        check is needed
+        '''
+
+        now = time.monotonic()
+
+        if self._kill_at is None:
+            deadline = _earliest(self._deadlines)
+            remaining = None if deadline is None else deadline.remaining()
+            if remaining is None or remaining > 0:
+                return _POLL_INTERVAL if remaining is None else min(remaining, _POLL_INTERVAL)
+
+            self.status = _expired_status(deadline)
+            self._logger.debug("Process group %d %s, sending SIGTERM",
+                               self._pgid, self.status.value)
+            self._signal(signal.SIGTERM)
+            self._kill_at = now + self._grace
+            return min(self._grace, _POLL_INTERVAL)
+
+        if self._abandon_at is None:
+            if now < self._kill_at:
+                return min(self._kill_at - now, _POLL_INTERVAL)
+
+            self._logger.debug("Process group %d still alive after %.1fs, sending SIGKILL",
+                               self._pgid, self._grace)
+            self._signal(signal.SIGKILL)
+            self._abandon_at = now + 1.0
+
+        return _POLL_INTERVAL
+
+    @property
+    def abandoned(self) -> bool:
+        '''
+        Whether the output should no longer be waited for. Descendants that
+        escaped the process group may keep the pipe open after SIGKILL.
+        '''
+        return self._abandon_at is not None and time.monotonic() >= self._abandon_at
@@ -0,0 +1,98 @@
+'''
+Layered process environment used when spawning commands
+'''
+
+import os
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from typing_extensions import Self
+
+
+class Environment(Mapping):
+    '''
+    Immutable environment built from a base layer and cheap per-command
+    overlays. Layers are only merged once, by `materialize()`, right before a
+    process is spawned.
+
+    The default base layer reads through `os.environ`, so that changes made to
+    the process environment stay visible to the commands spawned afterwards.
+    Use `snapshot()` to pin the base to the current state instead.
+    '''
+
+    __slots__ = ('_layers',)
+
+    def __init__(self, *layers: Mapping):
+        # top-most layer first
+        self._layers: tuple[Mapping, ...] = layers
+
+    @classmethod
+    def inherit(cls) -> Self:
+        '''
+        Return the environment inherited from the current process
+        '''
+        return _INHERITED
+
+    @classmethod
+    def snapshot(cls) -> Self:
+        '''
+        Return a frozen copy of the current process environment
+        '''
+        return cls(MappingProxyType(dict(os.environ)))
+
+    def overlay(self, env: Mapping = None) -> Self:
+        '''
+        Return a new environment with `env` layered on top of this one
+        '''
+
+        if not env:
+            return self
+        return Environment(MappingProxyType(dict(env)), *self._layers)
+
+    def materialize(self) -> dict[str, str] | None:
+        '''
+        Merge the layers into the mapping handed over to the child process.
+        `None` is returned when the process environment can be inherited as is.
+        '''
+
+        if self is _INHERITED:
+            return None
+
+        merged = {}
+        for layer in reversed(self._layers):
+            merged.update(layer)
+        return merged
+
+    def __getitem__(self, key: str) -> str:
+        for layer in self._layers:
+            if key in layer:
+                return layer[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        seen = set()
+        for layer in self._layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self) -> int:
+        return len(set().union(*self._layers))
+
+    def __repr__(self) -> str:
+        return f"Environment(layers={len(self._layers)})"
+
+
+_INHERITED = Environment(os.environ)
+
+
+def _overlay(env: Mapping) -> Mapping:
+    '''
+    Return the variables of `env` set on top of the environment inherited
+    from the current process
+    '''
+
+    if isinstance(env, Environment):
+        return {key: value for key, value in env.items() if os.environ.get(key) != value}
+    return env
@@ -0,0 +1,132 @@
+'''
+Memoization of idempotent command results
+'''
+
+import base64
+import hashlib
+import json
+import os
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from project_generator.lib.utils.cache import DiskStore, default_cache_dir
+
+from ._environment import _overlay
+from ._result import CommandResult, CommandStatus
+
+DEFAULT_MEMO_TTL = 24 * 60 * 60
+DEFAULT_MEMO_SIZE = 16 * 1024 * 1024
+
+
+class CommandCache:
+    '''
+    On-disk memo of successful command runs, keyed by the flattened command,
+    the relevant environment variables and the outcome of a validity probe.
+
+    Only runs that completed with a zero return code are remembered. Entries
+    expire after `ttl` seconds and the least recently used ones are evicted
+    once the cache outgrows `max_bytes`.
+    '''
+
+    def __init__(self, root: Path = None, ttl: float = DEFAULT_MEMO_TTL,
+                 max_bytes: int = DEFAULT_MEMO_SIZE):
+        if root is None:
+            root = default_cache_dir('commands')
+        self._store = DiskStore(root, ttl=ttl, max_bytes=max_bytes)
+
+    @staticmethod
+    def _probe_fingerprint(probe) -> str:
+        '''
+        Reduce the validity probe to a string. A command probe contributes its
+        return code and a digest of its captured output, a callable probe the
+        string form of its return value.
+        '''
+
+        if probe is None:
+            return ''
+
+        if hasattr(probe, 'execute'):
+            result: CommandResult = probe.execute()
+            digest = ''
+            if result.output is not None:
+                digest = hashlib.sha256(result.output).hexdigest()
+            return f"{result.returncode}:{digest}"
+
+        return str(probe())
+
+    def key(self, argv: list[str], env: Mapping = None, env_keys: list[str] = None,
+            probe=None) -> str:
+        '''
+        Compute the cache key of a command, covering its own environment
+        overlay and the values of the `env_keys` it depends on
+        '''
+
+        overlay = sorted((_overlay(env) or {}).items())
+        env_values = {}
+        for name in sorted(env_keys or []):
+            if env is not None and name in env:
+                env_values[name] = env[name]
+            else:
+                env_values[name] = os.environ.get(name)
+
+        material = json.dumps([argv, overlay, env_values, self._probe_fingerprint(probe)])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def execute(self, argv: list[str], runner: Callable[[], CommandResult],
+                env: Mapping = None, env_keys: list[str] = None, probe=None) -> CommandResult:
+        '''
+        Return the remembered result for the command, or run it through
+        `runner` and remember the outcome when successful
+        '''
+
+        key = self.key(argv, env, env_keys, probe)
+
+        value = self._store.get(key)
+        if value is not None:
+            output = value.get('output')
+            return CommandResult(
+                args=argv,
+                returncode=value['returncode'],
+                output=None if output is None else memoryview(base64.b64decode(output)),
+                output_bytes=value.get('output_bytes', 0),
+                truncated=value.get('truncated', False),
+                cached=True,
+            )
+
+        result = runner()
+        if result.returncode == 0 and result.status == CommandStatus.COMPLETED:
+            self._store.put(key, {
+                'args': argv,
+                'returncode': result.returncode,
+                'output': None if result.output is None
+                else base64.b64encode(result.output).decode(),
+                'output_bytes': result.output_bytes,
+                'truncated': result.truncated,
+            })
+
+        return result
+
+    def invalidate(self, argv: list[str], env: Mapping = None,
+                   env_keys: list[str] = None, probe=None):
+        '''
+        Forget the remembered result of a command
+        '''
+        self._store.delete(self.key(argv, env, env_keys, probe))
+
+    def clear(self):
+        '''
+        Forget every remembered result
+        '''
+        self._store.clear()
+
+
+@dataclass(slots=True)
+class _Memoization:
+    '''
+    Memoization settings attached to a command
+    '''
+
+    cache: CommandCache
+    env_keys: list[str] = field(default_factory=list)
+    probe: object = None
@@ -0,0 +1,117 @@
+'''
+Pipelines of processes connected by OS pipes
+'''
+
+import os
+import signal
+from collections.abc import Mapping
+from logging import Logger
+
+from ._deadline import DEFAULT_KILL_GRACE, Deadline, _Reaper
+from ._result import OutputBuffer
+from ._spawn import (_RESTORED_SIGNALS, _drain, _OutputLogger, _Outcome,
+                     _resolve_executable, _shell_argv, _spawn_environment, _wait_pid)
+
+
+def _pipefail(pipestatus: list[int]) -> int:
+    '''
+    Return the exit code of the rightmost failed stage, zero if all succeeded,
+    like `set -o pipefail` does
+    '''
+
+    for returncode in reversed(pipestatus):
+        if returncode != 0:
+            return returncode
+    return 0
+
+
+def _run_pipeline(stages: list[tuple[list[str], Mapping, bool]],
+                  output: OutputBuffer, logger: Logger,
+                  deadlines: list[Deadline] = None,
+                  grace: float = DEFAULT_KILL_GRACE) -> _Outcome:
+    '''
+    Run `stages`, given as `(argv, env, use_shell)` tuples, with the stdout of
+    every stage connected to the stdin of the next one. The data flows between
+    the processes through kernel pipes and never passes through Python; only
+    the stdout of the last stage and the stderr of all the stages are read.
+
+    The stages are spawned through `os.posix_spawn`. With deadlines, they share
+    a dedicated process group, so that the whole pipeline is torn down at once.
+    '''
+
+    spawns = []
+    for argv, env, use_shell in stages:
+        if use_shell:
+            argv = _shell_argv(argv)
+        child_env = _spawn_environment(env)
+        if child_env is None:
+            child_env = os.environ
+        # resolve every stage upfront, so a missing program fails the whole
+        # pipeline before anything is spawned
+        spawns.append((_resolve_executable(argv[0], child_env), argv, child_env))
+
+    pids = []
+    pgid = None
+    read_fd, write_fd = os.pipe()
+    stdin_fd = None
+    try:
+        for idx, (executable, argv, child_env) in enumerate(spawns):
+            next_stdin = None
+            stdout_fd = write_fd
+            if idx < len(spawns) - 1:
+                next_stdin, stdout_fd = os.pipe()
+
+            # all the pipe ends are non-inheritable, only the dup'ed
+            # descriptors survive the exec
+            file_actions = [
+                (os.POSIX_SPAWN_DUP2, stdout_fd, 1),
+                (os.POSIX_SPAWN_DUP2, write_fd, 2),
+            ]
+            if stdin_fd is not None:
+                file_actions.append((os.POSIX_SPAWN_DUP2, stdin_fd, 0))
+
+            # upstream stages rely on SIGPIPE to stop once a downstream one exits
+            spawn_kw = {'setsigdef': _RESTORED_SIGNALS}
+            if deadlines:
+                spawn_kw['setpgroup'] = 0 if pgid is None else pgid
+
+            try:
+                pids.append(os.posix_spawn(executable, argv, child_env,
+                                           file_actions=file_actions, **spawn_kw))
+            finally:
+                if stdin_fd is not None:
+                    os.close(stdin_fd)
+                if stdout_fd != write_fd:
+                    os.close(stdout_fd)
+                stdin_fd = next_stdin
+
+            if pgid is None:
+                pgid = pids[0]
+    except BaseException:
+        if stdin_fd is not None:
+            os.close(stdin_fd)
+        os.close(read_fd)
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+            _wait_pid(pid)
+        raise
+    finally:
+        os.close(write_fd)
+
+    reaper = _Reaper(pgid, deadlines, grace, logger) if deadlines else None
+    outcome = _Outcome(returncode=0, pipestatus=[])
+    try:
+        outcome.output_bytes = _drain(
+            read_fd, output, _OutputLogger(logger, spawns[-1][1][0]), reaper)
+    finally:
+        os.close(read_fd)
+        for pid in pids:
+            returncode, rusage = _wait_pid(pid, reaper)
+            outcome.pipestatus.append(returncode)
+            outcome.account(rusage)
+
+    outcome.returncode = _pipefail(outcome.pipestatus)
+    if reaper is not None:
+        outcome.status = reaper.status
+
+    return outcome
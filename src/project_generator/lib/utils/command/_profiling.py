@@ -0,0 +1,202 @@
+'''
+Resource accounting of command runs and hooks for attaching profilers
+'''
+
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from ._result import CommandResult
+
+
+@dataclass(slots=True)
+class ResourceRecord:
+    '''
+    Resources consumed by a single command run. The CPU times and the peak
+    resident set size are `None` when the run was not reaped directly, e.g.
+    inside a `ShellSession`.
+    '''
+
+    args: list[str]
+    returncode: int
+    status: str
+    start: float
+    wall_time: float
+    user_time: float = None
+    system_time: float = None
+    max_rss: int = None
+    output_bytes: int = 0
+    pid: int = 0
+    thread: int = 0
+
+    @classmethod
+    def from_result(cls, result: CommandResult, start: float) -> 'ResourceRecord':
+        '''
+        Build the record of a finished command run starting at `start`, in
+        seconds since the epoch
+        '''
+
+        return cls(
+            args=result.args,
+            returncode=result.returncode,
+            status=result.status.value,
+            start=start,
+            wall_time=result.wall_time,
+            user_time=result.user_time,
+            system_time=result.system_time,
+            max_rss=result.max_rss,
+            output_bytes=result.output_bytes,
+            pid=os.getpid(),
+            thread=threading.get_native_id(),
+        )
+
+    def to_dict(self) -> dict:
+        '''
+        Return a `dict` representation of the record
+        '''
+        return asdict(self)
+
+
+class CommandHook:
+    '''
+    Interface for observers of command runs. Install an instance through
+    `install_hook()`; both callbacks run on the thread running the command.
+    '''
+
+    def on_start(self, argv: list[str]):
+        '''
+        Called right before the process for `argv` is spawned
+        '''
+
+    def on_finish(self, record: ResourceRecord):
+        '''
+        Called once the command finished, with the resources it consumed
+        '''
+
+
+_hooks: tuple[CommandHook, ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def install_hook(hook: CommandHook) -> CommandHook:
+    '''
+    Start notifying `hook` about every command run
+    '''
+
+    global _hooks  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = (*_hooks, hook)
+    return hook
+
+
+def remove_hook(hook: CommandHook):
+    '''
+    Stop notifying `hook`
+    '''
+
+    global _hooks  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def _has_hooks() -> bool:
+    return bool(_hooks)
+
+
+def _notify_start(argv: list[str]):
+    '''
+    Notify the installed hooks that `argv` is about to run
+    '''
+
+    for hook in _hooks:
+        hook.on_start(argv)
+
+
+def _notify_finish(result: CommandResult, start: float):
+    '''
+    Notify the installed hooks about the finished run described by `result`
+    '''
+
+    if not _hooks:
+        return
+
+    record = ResourceRecord.from_result(result, start)
+    for hook in _hooks:
+        hook.on_finish(record)
+
+
+class MemoryCollector(CommandHook):
+    '''
+    Keep the records of the command runs in memory
+    '''
+
+    def __init__(self):
+        self.records: list[ResourceRecord] = []
+        self._lock = threading.Lock()
+
+    def on_finish(self, record: ResourceRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def top(self, count: int = 10, key: str = 'wall_time') -> list[ResourceRecord]:
+        '''
+        Return the `count` records with the highest `key`
+        '''
+
+        with self._lock:
+            records = [r for r in self.records if getattr(r, key) is not None]
+        return sorted(records, key=lambda r: getattr(r, key), reverse=True)[:count]
+
+
+class JsonLinesSink(CommandHook):
+    '''
+    Append every record as a JSON object on its own line
+    '''
+
+    def __init__(self, path: Path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+
+    def on_finish(self, record: ResourceRecord):
+        line = json.dumps(record.to_dict()) + '\n'
+        with self._lock, open(self._path, 'a', encoding='utf-8') as sink:
+            sink.write(line)
+
+
+class ChromeTraceSink(CommandHook):
+    '''
+    Write the command runs as complete events in the Chrome trace event
+    format, viewable in `chrome://tracing` or Perfetto. The file uses the
+    JSON array format, whose closing bracket is optional, so it stays valid
+    when the process exits abruptly.
+    '''
+
+    def __init__(self, path: Path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        with open(self._path, 'w', encoding='utf-8') as sink:
+            sink.write('[\n')
+
+    def on_finish(self, record: ResourceRecord):
+        event = {
+            'name': os.path.basename(record.args[0]) if record.args else '',
+            'cat': 'command',
+            'ph': 'X',
+            'ts': record.start * 1e6,
+            'dur': record.wall_time * 1e6,
+            'pid': record.pid,
+            'tid': record.thread,
+            'args': {
+                'argv': ' '.join(record.args),
+                'returncode': record.returncode,
+                'status': record.status,
+                'user_time': record.user_time,
+                'system_time': record.system_time,
+                'max_rss': record.max_rss,
+                'output_bytes': record.output_bytes,
+            },
+        }
+        with self._lock, open(self._path, 'a', encoding='utf-8') as sink:
+            sink.write(json.dumps(event) + ',\n')
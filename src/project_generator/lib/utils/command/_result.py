@@ -0,0 +1,133 @@
+'''
+Structures holding the outcome of a command run
+'''
+
+from dataclasses import dataclass, field
+from enum import Enum
+
+
+DEFAULT_CAPTURE_SIZE = 4 * 1024 * 1024
+
+
+class OutputBuffer:
+    '''
+    Ring buffer retaining only the most recent bytes written to it. It grows
+    with the output up to its capacity, so small outputs stay small.
+    '''
+
+    __slots__ = ('_buffer', '_capacity', '_pos', '_wrapped', 'total_bytes')
+
+    def __init__(self, capacity: int = DEFAULT_CAPTURE_SIZE):
+        if capacity <= 0:
+            raise ValueError("capacity must be a positive number of bytes")
+
+        self._buffer = bytearray()
+        self._capacity = capacity
+        self._pos = 0
+        self._wrapped = False
+        self.total_bytes = 0
+
+    def write(self, data: bytes) -> int:
+        '''
+        Append `data`, overwriting the oldest bytes once the buffer is full
+        '''
+
+        size = len(data)
+        self.total_bytes += size
+
+        if len(self._buffer) < self._capacity:
+            if self._pos + size < self._capacity:
+                self._buffer += data
+                self._pos += size
+                return size
+            # from now on the buffer wraps around at its full capacity
+            self._buffer.extend(bytes(self._capacity - len(self._buffer)))
+
+        if size >= self._capacity:
+            self._buffer[:] = memoryview(data)[size - self._capacity:]
+            self._pos = 0
+            self._wrapped = True
+            return size
+
+        end = self._pos + size
+        if end <= self._capacity:
+            self._buffer[self._pos:end] = data
+        else:
+            split = self._capacity - self._pos
+            view = memoryview(data)
+            self._buffer[self._pos:] = view[:split]
+            self._buffer[:size - split] = view[split:]
+            self._wrapped = True
+
+        self._pos = end % self._capacity
+        if self._pos == 0 and size > 0:
+            self._wrapped = True
+
+        return size
+
+    @property
+    def truncated(self) -> bool:
+        '''
+        Whether older output was discarded to stay within the capacity
+        '''
+        return self.total_bytes > self._capacity
+
+    def __len__(self) -> int:
+        return self._capacity if self._wrapped else self._pos
+
+    def tail(self) -> memoryview:
+        '''
+        Return the retained bytes in write order without copying them out.
+        A wrapped buffer is rotated in place once so the view is contiguous.
+        '''
+
+        if self._wrapped and self._pos != 0:
+            self._buffer[:] = self._buffer[self._pos:] + self._buffer[:self._pos]
+            self._pos = 0
+
+        return memoryview(self._buffer)[:len(self)]
+
+
+class CommandStatus(Enum):
+    '''
+    How a command run ended
+    '''
+    COMPLETED = 'completed'
+    TIMED_OUT = 'timed out'
+    CANCELLED = 'cancelled'
+
+
+@dataclass(slots=True)
+class CommandResult:
+    '''
+    Outcome of a command run: the return code and the captured output tail
+    '''
+
+    args: list[str]
+    returncode: int
+    output: memoryview = field(default=None, repr=False)
+    output_bytes: int = 0
+    truncated: bool = False
+    status: CommandStatus = CommandStatus.COMPLETED
+    cached: bool = False
+    wall_time: float = 0.0
+    user_time: float = None
+    system_time: float = None
+    max_rss: int = None
+    pipestatus: list[int] = None
+
+    @property
+    def completed(self) -> bool:
+        '''
+        Whether the command ran to completion, regardless of its return code
+        '''
+        return self.status == CommandStatus.COMPLETED
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        '''
+        Decode the captured output tail
+        '''
+
+        if self.output is None:
+            return ''
+        return str(self.output, encoding, errors='replace')
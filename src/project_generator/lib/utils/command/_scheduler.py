@@ -0,0 +1,228 @@
+'''
+Dependency graph based scheduler for running commands concurrently
+'''
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from logging import Logger
+
+from typing_extensions import Self
+
+from ._command import Command, lgr
+
+
+@dataclass(slots=True)
+class NodeTiming:
+    '''
+    Execution record of a single scheduled node
+    '''
+
+    name: str
+    start: float = 0.0
+    end: float = 0.0
+    returncode: int = None
+
+    @property
+    def duration(self) -> float:
+        '''
+        Wall clock time spent running the node
+        '''
+        return self.end - self.start
+
+
+@dataclass(slots=True)
+class ScheduleReport:
+    '''
+    Outcome of a scheduler run
+    '''
+
+    timings: dict[str, NodeTiming] = field(default_factory=dict)
+    critical_path: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def returncode(self) -> int:
+        '''
+        Return code of the first failed node in completion order, 0 otherwise
+        '''
+        if self.failed:
+            return self.timings[self.failed[0]].returncode
+        return 0
+
+    @property
+    def critical_path_time(self) -> float:
+        '''
+        Sum of the node durations along the critical path
+        '''
+        return sum(self.timings[name].duration for name in self.critical_path)
+
+
+@dataclass(slots=True)
+class _Node:
+    name: str
+    command: Command
+    depends_on: list[str]
+
+
+class CommandScheduler:
+    '''
+    Run a set of commands as a dependency graph on a bounded worker pool.
+
+    Any object exposing a `run() -> int` method can be scheduled, `Command`
+    being the common case. A node only starts once all of its dependencies
+    finished with a zero return code; the dependents of a failed node are
+    skipped while the independent branches keep running.
+    '''
+
+    def __init__(self, max_workers: int = None, logger: Logger = None):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self._max_workers = max_workers
+        self._logger = logger if logger is not None else lgr
+        self._nodes: dict[str, _Node] = {}
+
+    def add(self, name: str, command: Command, depends_on: list[str] = None) -> Self:
+        '''
+        Add a node to the graph, depending on the nodes named in `depends_on`
+        '''
+
+        if name in self._nodes:
+            raise ValueError(f"duplicate node '{name}'")
+
+        self._nodes[name] = _Node(name, command, list(depends_on or []))
+        return self
+
+    def _topological_order(self) -> list[str]:
+        '''
+        Validate the graph and return the node names in topological order
+        '''
+
+        for node in self._nodes.values():
+            for dep in node.depends_on:
+                if dep not in self._nodes:
+                    raise ValueError(
+                        f"node '{node.name}' depends on unknown node '{dep}'")
+
+        indegree = {name: len(node.depends_on)
+                    for name, node in self._nodes.items()}
+        ready = [name for name, count in indegree.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for other in self._nodes.values():
+                if name in other.depends_on:
+                    indegree[other.name] -= 1
+                    if indegree[other.name] == 0:
+                        ready.append(other.name)
+
+        if len(order) != len(self._nodes):
+            cyclic = sorted(set(self._nodes) - set(order))
+            raise ValueError(f"dependency cycle between nodes {cyclic}")
+
+        return order
+
+    def _run_node(self, node: _Node) -> NodeTiming:
+        timing = NodeTiming(node.name, start=time.monotonic())
+        try:
+            timing.returncode = node.command.run()
+        finally:
+            timing.end = time.monotonic()
+        return timing
+
+    def run(self) -> ScheduleReport:
+        '''
+        Run the graph and return the per-node timings and the critical path
+        '''
+
+        order = self._topological_order()
+        report = ScheduleReport()
+        remaining = {name: set(self._nodes[name].depends_on) for name in order}
+        running: dict[Future, str] = {}
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while remaining or running:
+                for name in [n for n, deps in remaining.items() if not deps]:
+                    del remaining[name]
+                    self._logger.debug("Scheduling node '%s'", name)
+                    future = executor.submit(self._run_node, self._nodes[name])
+                    running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        timing = future.result()
+                    except Exception:
+                        # let the in-flight nodes finish before propagating
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+
+                    report.timings[name] = timing
+                    self._logger.debug("Node '%s' returned %d in %.3fs",
+                                       name, timing.returncode, timing.duration)
+
+                    if timing.returncode == 0:
+                        for deps in remaining.values():
+                            deps.discard(name)
+                    else:
+                        report.failed.append(name)
+                        self._skip_dependents(name, remaining, report)
+
+        report.wall_time = time.monotonic() - start
+        report.critical_path = self._critical_path(order, report)
+
+        return report
+
+    def _skip_dependents(self, failed: str, remaining: dict[str, set[str]],
+                         report: ScheduleReport):
+        '''
+        Drop every pending node that transitively depends on `failed`
+        '''
+
+        blocked = [failed]
+        while blocked:
+            current = blocked.pop()
+            for name in [n for n in remaining
+                         if current in self._nodes[n].depends_on]:
+                del remaining[name]
+                report.skipped.append(name)
+                blocked.append(name)
+
+    def _critical_path(self, order: list[str], report: ScheduleReport) -> list[str]:
+        '''
+        Return the chain of executed nodes with the longest total duration
+        '''
+
+        cost: dict[str, float] = {}
+        parent: dict[str, str] = {}
+        for name in order:
+            timing = report.timings.get(name)
+            if timing is None:
+                continue
+            best_dep = None
+            for dep in self._nodes[name].depends_on:
+                if dep in cost and (best_dep is None or cost[dep] > cost[best_dep]):
+                    best_dep = dep
+            cost[name] = timing.duration + (cost[best_dep] if best_dep else 0.0)
+            parent[name] = best_dep
+
+        if not cost:
+            return []
+
+        path = []
+        current = max(cost, key=cost.get)
+        while current is not None:
+            path.append(current)
+            current = parent[current]
+        path.reverse()
+
+        return path
@@ -0,0 +1,270 @@
+'''
+Persistent shell coprocess for running batches of small commands
+'''
+
+import errno
+import math
+import os
+import select
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from logging import Logger, StreamHandler
+
+from typing_extensions import Self
+
+from project_generator.lib.utils.logger import get_logger
+
+from ._deadline import (_NOT_STARTED, DEFAULT_KILL_GRACE, _collect_deadlines,
+                        _earliest, _expired_status, _Reaper)
+from ._environment import _overlay
+from ._profiling import _notify_finish, _notify_start
+from ._result import CommandResult, CommandStatus, OutputBuffer
+from ._spawn import _READ_SIZE, _OutputLogger, _shell_argv
+
+lgr = get_logger(module_name="shell_session", stream=StreamHandler())
+
+
+def _returncode(status: int) -> int:
+    '''
+    Map the `128 + n` status the shell reports for a command killed by the
+    signal `n` to `-n`, like `subprocess.Popen` does
+    '''
+
+    if 128 < status < 128 + signal.NSIG:
+        return 128 - status
+    return status
+
+
+class ShellSession:
+    '''
+    Keep a single `/bin/sh` coprocess alive and feed it commands one at a time,
+    saving the fork/exec of a new interpreter for every command.
+
+    Every command is followed by a sentinel carrying its exit code, which is
+    used to delimit the output of consecutive commands. Commands run with
+    their stdin redirected from `/dev/null`, so they cannot consume the
+    command stream of the session. Attach a session to a command through
+    `CommandBuilder.session()`.
+    '''
+
+    def __init__(self, shell: str = '/bin/sh', logger: Logger = None):
+        self._shell = shell
+        self._logger = logger if logger is not None else lgr
+        self._process: subprocess.Popen = None
+        self._token = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def alive(self) -> bool:
+        '''
+        Whether the shell coprocess is running
+        '''
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> Self:
+        '''
+        Start the shell coprocess, if not already running
+        '''
+
+        if not self.alive:
+            self._process = subprocess.Popen(  # pylint: disable=consider-using-with
+                [self._shell],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=0,
+                # own process group, so a timed out command can be torn down
+                # together with the session
+                start_new_session=True,
+            )
+        return self
+
+    def close(self) -> int:
+        '''
+        Terminate the shell coprocess and return its exit code
+        '''
+
+        if self._process is None:
+            return 0
+
+        process, self._process = self._process, None
+        try:
+            process.stdin.write(b'exit 0\n')
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.stdout.close()
+        return process.wait()
+
+    def _script(self, argv: list[str], env: Mapping, use_shell: bool) -> bytes:
+        '''
+        Generate the shell snippet running `argv` and reporting its exit code
+        '''
+
+        if use_shell:
+            argv = _shell_argv(argv)
+
+        program = shlex.quote(argv[0])
+        command = shlex.join(argv)
+
+        overlay = _overlay(env)
+        if overlay:
+            # set for the command alone, keeping the session environment as is
+            assignments = ' '.join(shlex.quote(f"{key}={value}")
+                                   for key, value in overlay.items())
+            command = f"env {assignments} {command}"
+
+        script = (
+            f"if command -v {program} >/dev/null 2>&1; then "
+            f"{command} </dev/null 2>&1; __pg_rc=$?; "
+            f"else __pg_rc={errno.ENOENT}; fi; "
+            f"printf '\\000{self._token}:%d\\n' \"$__pg_rc\""
+        )
+
+        return f"{script}\n".encode()
+
+    def execute(self, *args, capture: int = 0, **kw_args) -> CommandResult:
+        '''
+        Run the command inside the session and return its `CommandResult`.
+        Accepts the same arguments as `Command` execution does.
+        '''
+
+        logger = kw_args.get('logger', None) or self._logger
+        env = kw_args.get('env', None)
+        use_shell = kw_args.get('shell', False)
+
+        argv = list(*args)
+        result = CommandResult(args=argv, returncode=0)
+        output = OutputBuffer(capture) if capture > 0 else None
+        out_logger = _OutputLogger(logger, argv[0])
+
+        logger.debug("Command (session): %s", argv)
+
+        deadlines = _collect_deadlines(kw_args.get('timeout', None),
+                                       kw_args.get('deadline', None))
+        expired = _earliest(deadlines)
+        if expired is not None and expired.expired:
+            result.status = _expired_status(expired)
+            result.returncode = _NOT_STARTED[result.status]
+            return result
+
+        start = time.time()
+        started = time.perf_counter()
+        _notify_start(argv)
+
+        with self._lock:
+            self.start()
+            reaper = None
+            if deadlines:
+                reaper = _Reaper(self._process.pid, deadlines,
+                                 kw_args.get('grace', DEFAULT_KILL_GRACE), logger)
+            try:
+                self._process.stdin.write(self._script(argv, env, use_shell))
+            except BrokenPipeError as err:
+                raise RuntimeError("shell session terminated unexpectedly") from err
+            result.returncode = self._read_until_sentinel(output, out_logger, reaper)
+            if reaper is not None:
+                result.status = reaper.status
+
+        out_logger.flush()
+        logger.debug("(%s) - Process returned %d", argv[0], result.returncode)
+
+        if output is not None:
+            result.output = output.tail()
+            result.output_bytes = output.total_bytes
+            result.truncated = output.truncated
+
+        # the command is not reaped by us, so only the wall time is known
+        result.wall_time = time.perf_counter() - started
+        _notify_finish(result, start)
+
+        return result
+
+    def run(self, *args, **kw_args) -> int:
+        '''
+        Run the command inside the session and return its exit code
+        '''
+        return self.execute(*args, **kw_args).returncode
+
+    def _read_until_sentinel(self, output: OutputBuffer, out_logger: _OutputLogger,
+                             reaper: _Reaper = None) -> int:
+        '''
+        Forward the command output until the sentinel and return the exit code.
+        When the `reaper` tears the session down, the exit code of the shell is
+        returned instead and the session restarts on the next command.
+        '''
+
+        marker = f"\0{self._token}:".encode()
+        keep = len(marker) - 1
+        fd = self._process.stdout.fileno()
+        pending = b''
+
+        poller = None
+        if reaper is not None:
+            poller = select.poll()
+            poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+
+        while True:
+            if poller is not None and not poller.poll(math.ceil(reaper.check() * 1000)):
+                if not reaper.abandoned:
+                    continue
+                chunk = b''
+            else:
+                chunk = os.read(fd, _READ_SIZE)
+
+            if not chunk:
+                self._emit(pending, output, out_logger)
+                if reaper is not None and reaper.status != CommandStatus.COMPLETED:
+                    return self._kill()
+                self.close()
+                raise RuntimeError("shell session terminated unexpectedly")
+            pending += chunk
+
+            idx = pending.find(marker)
+            if idx < 0:
+                # hold back a possible partial marker at the end of the chunk
+                if len(pending) > keep:
+                    self._emit(pending[:-keep], output, out_logger)
+                    pending = pending[-keep:]
+                continue
+
+            end = pending.find(b'\n', idx)
+            if end < 0:
+                continue
+
+            self._emit(pending[:idx], output, out_logger)
+            return _returncode(int(pending[idx + len(marker):end]))
+
+    def _kill(self) -> int:
+        '''
+        Forcibly tear down the session and return the exit code of the shell
+        '''
+
+        process, self._process = self._process, None
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.stdin.close()
+        process.stdout.close()
+        return process.wait()
+
+    @staticmethod
+    def _emit(data: bytes, output: OutputBuffer, out_logger: _OutputLogger):
+        if not data:
+            return
+        if output is not None:
+            output.write(data)
+        out_logger.feed(data)
@@ -0,0 +1,311 @@
+'''
+Process spawning backends used to run commands
+'''
+
+import errno
+import math
+import os
+import resource
+import select
+import shutil
+import signal
+import subprocess
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+from enum import Enum
+from io import BufferedReader
+from logging import DEBUG, Logger
+
+from ._deadline import DEFAULT_KILL_GRACE, Deadline, _Reaper
+from ._environment import Environment
+from ._result import CommandStatus, OutputBuffer
+
+_READ_SIZE = 64 * 1024
+
+# signals ignored by the interpreter, reset in the children like
+# `subprocess.Popen` does with `restore_signals`
+_RESTORED_SIGNALS = tuple(getattr(signal, name) for name in ('SIGPIPE', 'SIGXFSZ')
+                          if hasattr(signal, name))
+
+
+class SpawnBackend(Enum):
+    '''
+    An enum listing the supported process spawning mechanisms
+    '''
+    POPEN = 'popen'
+    POSIX_SPAWN = 'posix_spawn'
+
+
+_default_backend = SpawnBackend.POPEN
+
+
+def set_default_spawn_backend(backend: SpawnBackend):
+    '''
+    Select the spawn backend used by commands that do not specify one
+    '''
+
+    global _default_backend  # pylint: disable=global-statement
+
+    if backend == SpawnBackend.POSIX_SPAWN and not hasattr(os, 'posix_spawn'):
+        raise ValueError("posix_spawn is not supported on this platform")
+    _default_backend = backend
+
+
+def default_spawn_backend() -> SpawnBackend:
+    '''
+    Return the spawn backend used by commands that do not specify one
+    '''
+    return _default_backend
+
+
+def _spawn_environment(env: Mapping = None) -> dict[str, str] | None:
+    '''
+    Merge the environment overlay for the child process exactly once
+    '''
+
+    if not isinstance(env, Environment):
+        env = Environment.inherit().overlay(env)
+    return env.materialize()
+
+
+def _shell_argv(argv: list[str]) -> list[str]:
+    '''
+    Mirror the argument handling of `subprocess.Popen` with `shell=True`
+    '''
+    return ['/bin/sh', '-c', *argv]
+
+
+class _OutputLogger:
+    '''
+    Split raw output chunks into lines and log them. Decoding only happens when
+    the logger would actually emit a DEBUG record.
+    '''
+
+    __slots__ = ('_logger', '_program', '_pending', '_enabled')
+
+    def __init__(self, logger: Logger, program: str):
+        self._logger = logger
+        self._program = program
+        self._pending = b''
+        self._enabled = logger.isEnabledFor(DEBUG)
+
+    def feed(self, chunk: bytes):
+        '''
+        Log every complete line in `chunk`, keeping the trailing partial line
+        '''
+
+        if not self._enabled:
+            return
+
+        *lines, self._pending = (self._pending + chunk).split(b'\n')
+        for line in lines:
+            self._logger.debug("(%s) - %s", self._program,
+                               line.decode('utf-8', errors='replace').strip())
+
+    def flush(self):
+        '''
+        Log the trailing partial line, if any
+        '''
+
+        if self._enabled and self._pending:
+            self._logger.debug("(%s) - %s", self._program,
+                               self._pending.decode('utf-8', errors='replace').strip())
+        self._pending = b''
+
+
+@dataclass(slots=True)
+class _Outcome:
+    '''
+    What a spawn backend reports back about a finished process
+    '''
+
+    returncode: int
+    status: CommandStatus = CommandStatus.COMPLETED
+    output_bytes: int = 0
+    user_time: float = None
+    system_time: float = None
+    max_rss: int = None
+    pipestatus: list[int] = None
+
+    def account(self, rusage: resource.struct_rusage):
+        '''
+        Add the resources consumed by a reaped child
+        '''
+
+        self.user_time = (self.user_time or 0.0) + rusage.ru_utime
+        self.system_time = (self.system_time or 0.0) + rusage.ru_stime
+        # Linux reports the peak resident set size in KiB
+        self.max_rss = max(self.max_rss or 0, rusage.ru_maxrss * 1024)
+
+
+def _drain(fd: int, output: OutputBuffer = None, out_logger: _OutputLogger = None,
+           reaper: _Reaper = None) -> int:
+    '''
+    Read `fd` until EOF in large chunks, feeding the ring buffer and the logger.
+    With a `reaper`, reads never block past the deadlines it enforces. Return
+    the number of bytes read.
+    '''
+
+    poller = None
+    if reaper is not None:
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+
+    read = os.read
+    total = 0
+    while True:
+        if poller is not None and not poller.poll(math.ceil(reaper.check() * 1000)):
+            if reaper.abandoned:
+                break
+            continue
+
+        chunk = read(fd, _READ_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if output is not None:
+            output.write(chunk)
+        if out_logger is not None:
+            out_logger.feed(chunk)
+
+    if out_logger is not None:
+        out_logger.flush()
+
+    return total
+
+
+def _wait_pid(pid: int, reaper: _Reaper = None) -> tuple[int, resource.struct_rusage]:
+    '''
+    Reap the child and return its exit code, negative for a terminating signal,
+    along with its resource usage
+    '''
+
+    if reaper is None:
+        _, status, rusage = os.wait4(pid, 0)
+        return os.waitstatus_to_exitcode(status), rusage
+
+    delay = 0.0005
+    while True:
+        done, status, rusage = os.wait4(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status), rusage
+        time.sleep(min(delay, reaper.check()))
+        delay *= 2
+
+
+def _run_popen(argv: list[str], env: Mapping, use_shell: bool, buffered_out: bool,
+               output: OutputBuffer, logger: Logger,
+               deadlines: list[Deadline] = None,
+               grace: float = DEFAULT_KILL_GRACE) -> _Outcome:
+    '''
+    Run the command through `subprocess.Popen`
+    '''
+
+    outcome = _Outcome(returncode=0)
+    reaper = None
+
+    with subprocess.Popen(
+        argv,
+        env=_spawn_environment(env),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        shell=use_shell,
+        # a dedicated process group lets the whole tree be torn down
+        start_new_session=bool(deadlines),
+    ) as process:
+        if deadlines:
+            reaper = _Reaper(process.pid, deadlines, grace, logger)
+
+        if process.stdout is not None:
+            with process.stdout as out:
+                if output is None and reaper is None and logger.isEnabledFor(DEBUG):
+                    if not buffered_out:
+                        reader = out
+                    else:
+                        reader = BufferedReader(out)
+                    for line in iter(reader.readline, b''):
+                        outcome.output_bytes += len(line)
+                        logger.debug(
+                            "(%s) - %s", process.args[0], line.decode('utf-8').strip())
+                else:
+                    outcome.output_bytes = _drain(
+                        out.fileno(), output, _OutputLogger(logger, argv[0]), reaper)
+
+            outcome.returncode, rusage = _wait_pid(process.pid, reaper)
+            outcome.account(rusage)
+            # the child was reaped above, keep `Popen` from waiting on it again
+            process.returncode = outcome.returncode
+
+    if reaper is not None:
+        outcome.status = reaper.status
+
+    return outcome
+
+
+def _resolve_executable(program: str, child_env: Mapping) -> str:
+    '''
+    Resolve `program` against the PATH of the child environment, like
+    `subprocess.Popen` does
+    '''
+
+    if os.path.dirname(program) != '':
+        return program
+
+    executable = shutil.which(program, path=child_env.get('PATH', os.defpath))
+    if executable is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+    return executable
+
+
+def _run_posix_spawn(argv: list[str], env: Mapping, use_shell: bool,
+                     output: OutputBuffer, logger: Logger,
+                     deadlines: list[Deadline] = None,
+                     grace: float = DEFAULT_KILL_GRACE) -> _Outcome:
+    '''
+    Run the command through `os.posix_spawn`, avoiding the cost of duplicating
+    the page tables of a large parent process
+    '''
+
+    if use_shell:
+        argv = _shell_argv(argv)
+
+    child_env = _spawn_environment(env)
+    if child_env is None:
+        child_env = os.environ
+
+    executable = _resolve_executable(argv[0], child_env)
+
+    spawn_kw = {'setsigdef': _RESTORED_SIGNALS}
+    if deadlines:
+        # a dedicated process group lets the whole tree be torn down
+        spawn_kw['setpgroup'] = 0
+
+    read_fd, write_fd = os.pipe()
+    try:
+        # both pipe ends are non-inheritable, only the dup'ed descriptors
+        # survive the exec
+        pid = os.posix_spawn(executable, argv, child_env, file_actions=[
+            (os.POSIX_SPAWN_DUP2, write_fd, 1),
+            (os.POSIX_SPAWN_DUP2, write_fd, 2),
+        ], **spawn_kw)
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    reaper = _Reaper(pid, deadlines, grace, logger) if deadlines else None
+    outcome = _Outcome(returncode=0)
+    try:
+        outcome.output_bytes = _drain(
+            read_fd, output, _OutputLogger(logger, argv[0]), reaper)
+    finally:
+        os.close(read_fd)
+        outcome.returncode, rusage = _wait_pid(pid, reaper)
+        outcome.account(rusage)
+
+    if reaper is not None:
+        outcome.status = reaper.status
+
+    return outcome